@@ -0,0 +1,5 @@
+"""
+Micro-benchmarks of the image processing, magic wand and export hot paths
+
+Run from backend/: python -m benchmarks.run --help
+"""
@@ -0,0 +1,415 @@
+"""
+Benchmark runner: times the hot paths on synthetic masterplans and compares against a baseline
+
+    python -m benchmarks.run --sizes 1 4 16 --output results.json
+    python -m benchmarks.run --sizes 1 4 16 --baseline results.json
+
+Results are JSON: per sheet size, the median and minimum wall time of each
+benchmark over --repeat runs (after one warm-up run). With --baseline, each
+median is compared with the stored one and slowdowns beyond --tolerance are
+reported as regressions (exit status 1 with --fail-on-regression).
+"""
+
+import argparse
+import base64
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from benchmarks.synthetic import BOUNDARY_BGR, Masterplan, generate_masterplan, parcel_ring
+from magic_wand import (
+    PolygonIndex,
+    check_overlap,
+    compute_boundary_labels,
+    magic_wand_select_boundary,
+    magic_wand_select_tolerance,
+    mask_to_polygon,
+    pad_selection,
+    refine_mask,
+)
+from schemas import ExtractionSettings, GeoreferencePoint
+from services.georeference import transform_coordinates
+from services.image_processing import (
+    decode_image,
+    extract_all_region_contours,
+    extract_region_contours,
+    preprocess_image,
+    segment_by_color,
+    segment_by_palette,
+)
+
+DEFAULT_SIZES = [1.0, 4.0, 16.0]
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.10
+
+# Selections / overlap queries / OCR crops per timed run
+CLICKS_PER_RUN = 10
+OVERLAP_QUERIES_PER_RUN = 100
+OCR_PARCELS_PER_RUN = 5
+
+BOUNDARY_RGB = tuple(reversed(BOUNDARY_BGR))
+
+
+class Skip(Exception):
+    """Raised by a benchmark that cannot run here (e.g. no Tesseract)."""
+
+
+class SheetContext:
+    """A synthetic sheet plus intermediates shared by the benchmarks, computed on first use."""
+
+    def __init__(self, plan: Masterplan):
+        self.plan = plan
+        self.image = plan.image
+        self.settings = ExtractionSettings()
+        self._values: Dict[str, object] = {}
+
+    def value(self, name: str, compute: Callable[[], object]):
+        if name not in self._values:
+            self._values[name] = compute()
+        return self._values[name]
+
+    @property
+    def base64_png(self) -> str:
+        return self.value("base64_png", lambda: base64.b64encode(
+            cv2.imencode(".png", self.image)[1]
+        ).decode())
+
+    @property
+    def processed(self) -> np.ndarray:
+        return self.value("processed", lambda: preprocess_image(self.image, self.settings.denoise))
+
+    @property
+    def labels(self) -> np.ndarray:
+        return self.value("labels", lambda: segment_by_color(
+            self.processed,
+            self.settings.color_clusters,
+            self.settings.kmeans_sample_size,
+            self.settings.kmeans_attempts
+        ))
+
+    @property
+    def largest_label(self) -> int:
+        return self.value("largest_label", lambda: int(np.argmax(np.bincount(self.labels.reshape(-1)))))
+
+    @property
+    def boundary_labels(self):
+        return self.value("boundary_labels", lambda: compute_boundary_labels(self.image, BOUNDARY_RGB))
+
+    @property
+    def clicks(self) -> List[tuple]:
+        return [parcel.seed for parcel in self.plan.parcels[:CLICKS_PER_RUN]]
+
+    @property
+    def polygon_index(self) -> PolygonIndex:
+        return self.value("polygon_index", lambda: PolygonIndex({
+            i: [parcel_ring(parcel)] for i, parcel in enumerate(self.plan.parcels)
+        }))
+
+    @property
+    def features(self) -> List[dict]:
+        return self.value("features", lambda: [
+            {"type": "Feature", "properties": {"label": parcel.label},
+             "geometry": {"type": "Polygon", "coordinates": [parcel_ring(parcel)]}}
+            for parcel in self.plan.parcels
+        ])
+
+
+def _control_points(width: int, height: int) -> List[GeoreferencePoint]:
+    corners = [(0, 0), (width, 0), (width, height), (0, height)]
+    geo = [(4.40, 51.20), (4.46, 51.21), (4.45, 51.17), (4.39, 51.16)]
+    return [
+        GeoreferencePoint(image_x=x, image_y=y, geo_lng=lng, geo_lat=lat)
+        for (x, y), (lng, lat) in zip(corners, geo)
+    ]
+
+
+def bench_decode_image(ctx: SheetContext):
+    data = ctx.base64_png
+    return lambda: decode_image(data)
+
+
+def bench_preprocess_image(ctx: SheetContext):
+    image, denoise = ctx.image, ctx.settings.denoise
+    return lambda: preprocess_image(image, denoise)
+
+
+def bench_segment_by_color(ctx: SheetContext):
+    processed, settings = ctx.processed, ctx.settings
+    return lambda: segment_by_color(
+        processed, settings.color_clusters, settings.kmeans_sample_size, settings.kmeans_attempts
+    )
+
+
+def bench_segment_by_palette(ctx: SheetContext):
+    return lambda: segment_by_palette(ctx.image, ctx.settings.kmeans_sample_size)
+
+
+def bench_extract_region_contours(ctx: SheetContext):
+    labels, label, area = ctx.labels, ctx.largest_label, ctx.image.shape[0] * ctx.image.shape[1]
+    return lambda: extract_region_contours(labels, label, ctx.settings, area)
+
+
+def bench_extract_all_region_contours(ctx: SheetContext):
+    labels, area = ctx.labels, ctx.image.shape[0] * ctx.image.shape[1]
+    return lambda: extract_all_region_contours(labels, ctx.settings, area)
+
+
+def bench_compute_boundary_labels(ctx: SheetContext):
+    return lambda: compute_boundary_labels(ctx.image, BOUNDARY_RGB)
+
+
+def bench_magic_wand_boundary(ctx: SheetContext):
+    """CLICKS_PER_RUN boundary-mode clicks without a label map (a flood fill each)"""
+    def run():
+        for x, y in ctx.clicks:
+            magic_wand_select_boundary(ctx.image, x, y, BOUNDARY_RGB)
+    return run
+
+
+def bench_magic_wand_boundary_labels(ctx: SheetContext):
+    """CLICKS_PER_RUN boundary-mode clicks against a precomputed label map"""
+    boundary_labels = ctx.boundary_labels
+
+    def run():
+        for x, y in ctx.clicks:
+            magic_wand_select_boundary(ctx.image, x, y, BOUNDARY_RGB, boundary_labels=boundary_labels)
+    return run
+
+
+def bench_magic_wand_tolerance(ctx: SheetContext):
+    """CLICKS_PER_RUN tolerance-mode clicks"""
+    def run():
+        for x, y in ctx.clicks:
+            magic_wand_select_tolerance(ctx.image, x, y)
+    return run
+
+
+def bench_magic_wand_polygon(ctx: SheetContext):
+    """Refine and vectorize the masks of CLICKS_PER_RUN selections"""
+    selections = [
+        magic_wand_select_boundary(ctx.image, x, y, boundary_labels=ctx.boundary_labels)
+        for x, y in ctx.clicks
+    ]
+
+    def run():
+        for mask, bbox in selections:
+            padded, offset = pad_selection(mask, bbox, ctx.image.shape)
+            mask_to_polygon(refine_mask(padded), 2.0, offset)
+    return run
+
+
+def bench_check_overlap(ctx: SheetContext):
+    """OVERLAP_QUERIES_PER_RUN overlap checks against an index of every parcel"""
+    index = ctx.polygon_index
+    rings = [parcel_ring(parcel) for parcel in ctx.plan.parcels[:OVERLAP_QUERIES_PER_RUN]]
+
+    def run():
+        for ring in rings:
+            check_overlap(ring, index)
+    return run
+
+
+def bench_polygon_index_build(ctx: SheetContext):
+    polygons = {i: [parcel_ring(parcel)] for i, parcel in enumerate(ctx.plan.parcels)}
+    return lambda: PolygonIndex(polygons)
+
+
+def bench_transform_coordinates(ctx: SheetContext):
+    """Homography from four control points over every parcel ring"""
+    height, width = ctx.image.shape[:2]
+    features, control_points = ctx.features, _control_points(width, height)
+    # Transforms in place; repeated runs re-transform the same number of vertices
+    return lambda: transform_coordinates(features, width, height, control_points)
+
+
+def bench_ocr_tesseract(ctx: SheetContext):
+    """Tesseract OCR of OCR_PARCELS_PER_RUN parcel labels, OCR cache cleared per run"""
+    import ocr_service
+
+    if not ocr_service.is_tesseract_available():
+        raise Skip("Tesseract is not available")
+
+    crops = []
+    for x, y in ctx.clicks[:OCR_PARCELS_PER_RUN]:
+        mask, bbox = magic_wand_select_boundary(ctx.image, x, y, boundary_labels=ctx.boundary_labels)
+        padded, offset = pad_selection(mask, bbox, ctx.image.shape)
+        refined = refine_mask(padded)
+        result = mask_to_polygon(refined, 2.0, offset)
+        if result:
+            crops.append((refined, result["polygon"][0][:-1], offset))
+
+    def run():
+        ocr_service._ocr_cache.clear()
+        for refined, coords, offset in crops:
+            ocr_service.extract_text_from_polygon(ctx.image, refined, coords, offset)
+    return run
+
+
+BENCHMARKS: Dict[str, Callable[[SheetContext], Callable[[], object]]] = {
+    "decode_image": bench_decode_image,
+    "preprocess_image": bench_preprocess_image,
+    "segment_by_color": bench_segment_by_color,
+    "segment_by_palette": bench_segment_by_palette,
+    "extract_region_contours": bench_extract_region_contours,
+    "extract_all_region_contours": bench_extract_all_region_contours,
+    "compute_boundary_labels": bench_compute_boundary_labels,
+    "magic_wand_boundary": bench_magic_wand_boundary,
+    "magic_wand_boundary_labels": bench_magic_wand_boundary_labels,
+    "magic_wand_tolerance": bench_magic_wand_tolerance,
+    "magic_wand_polygon": bench_magic_wand_polygon,
+    "check_overlap": bench_check_overlap,
+    "polygon_index_build": bench_polygon_index_build,
+    "transform_coordinates": bench_transform_coordinates,
+    "ocr_tesseract": bench_ocr_tesseract,
+}
+
+
+def time_benchmark(fn: Callable[[], object], repeat: int) -> dict:
+    """Median and minimum wall time (ms) of fn over repeat runs, after a warm-up run"""
+    fn()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": round(statistics.median(durations), 3),
+        "min_ms": round(min(durations), 3),
+        "runs": repeat,
+    }
+
+
+def size_key(megapixels: float) -> str:
+    return f"{megapixels:g}mp"
+
+
+def run_benchmarks(
+    sizes: List[float],
+    names: List[str],
+    repeat: int,
+    seed: int = 0,
+    log=print
+) -> dict:
+    """Run the named benchmarks on one synthetic sheet per size"""
+    results: Dict[str, dict] = {}
+    for megapixels in sizes:
+        plan = generate_masterplan(megapixels, seed)
+        ctx = SheetContext(plan)
+        height, width = plan.image.shape[:2]
+        sheet = {"width": width, "height": height, "parcels": len(plan.parcels), "benchmarks": {}}
+        log(f"{size_key(megapixels)}: {width}x{height}, {len(plan.parcels)} parcels")
+
+        for name in names:
+            try:
+                result = time_benchmark(BENCHMARKS[name](ctx), repeat)
+            except Skip as e:
+                result = {"skipped": str(e)}
+            sheet["benchmarks"][name] = result
+            log(f"  {name:<30} " + (
+                f"{result['median_ms']:>10.2f} ms" if "median_ms" in result else f"skipped: {result['skipped']}"
+            ))
+
+        results[size_key(megapixels)] = sheet
+
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+        },
+        "repeat": repeat,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[dict]:
+    """
+    Per-benchmark median ratios (current / baseline) for entries present in both.
+
+    An entry is a regression when its ratio exceeds 1 + tolerance.
+    """
+    rows = []
+    for size, sheet in current["results"].items():
+        baseline_sheet = baseline.get("results", {}).get(size, {}).get("benchmarks", {})
+        for name, result in sheet["benchmarks"].items():
+            previous = baseline_sheet.get(name, {})
+            if "median_ms" not in result or not previous.get("median_ms"):
+                continue
+            ratio = result["median_ms"] / previous["median_ms"]
+            rows.append({
+                "size": size,
+                "benchmark": name,
+                "baseline_ms": previous["median_ms"],
+                "current_ms": result["median_ms"],
+                "ratio": round(ratio, 3),
+                "regression": ratio > 1 + tolerance,
+            })
+    return rows
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=float, nargs="+", default=DEFAULT_SIZES,
+                        help="Sheet sizes in megapixels (1-100)")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), default=list(BENCHMARKS),
+                        help="Benchmarks to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Timed runs per benchmark")
+    parser.add_argument("--seed", type=int, default=0, help="Synthetic sheet seed")
+    parser.add_argument("--output", help="Write the results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="Results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed slowdown before a benchmark counts as a regression (0.1 = 10%%)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions")
+    args = parser.parse_args(argv)
+
+    if any(not 1 <= size <= 100 for size in args.sizes):
+        parser.error("--sizes must be between 1 and 100 megapixels")
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = _parse_args(argv)
+    log = lambda message: print(message, file=sys.stderr)
+
+    report = run_benchmarks(args.sizes, args.only, args.repeat, args.seed, log)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        comparison = compare(report, baseline, args.tolerance)
+        report["comparison"] = {"baseline": args.baseline, "tolerance": args.tolerance, "results": comparison}
+        regressions = [row for row in comparison if row["regression"]]
+
+        log(f"\nAgainst {args.baseline}:")
+        for row in comparison:
+            flag = "  REGRESSION" if row["regression"] else ""
+            log(f"  {row['size']:<6} {row['benchmark']:<30} {row['baseline_ms']:>10.2f} -> "
+                f"{row['current_ms']:>10.2f} ms  x{row['ratio']:.2f}{flag}")
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
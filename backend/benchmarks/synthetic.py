@@ -0,0 +1,116 @@
+"""
+Deterministic synthetic masterplans: grey-bounded colored parcels with text labels
+"""
+
+import math
+from typing import List, NamedTuple, Tuple
+
+import cv2
+import numpy as np
+
+# Same default as MagicWandOptions.boundary_color (#989898), in BGR
+BOUNDARY_BGR = (152, 152, 152)
+BOUNDARY_WIDTH = 2
+
+# White margin around the sheet, in pixels
+SHEET_MARGIN = 40
+
+# Flat parcel fills (BGR), kept well away from the boundary grey
+PARCEL_COLORS = [
+    (180, 220, 250), (140, 200, 240), (200, 230, 180), (160, 210, 140),
+    (230, 200, 170), (210, 170, 130), (190, 190, 240), (150, 150, 220),
+    (240, 220, 200), (200, 240, 240), (170, 230, 210), (120, 190, 170),
+    (220, 180, 220), (250, 240, 220), (100, 180, 230), (180, 250, 200),
+]
+
+
+class Parcel(NamedTuple):
+    x: int
+    y: int
+    width: int
+    height: int
+    label: str
+    seed: Tuple[int, int]  # A point inside the parcel, clear of its label
+
+
+class Masterplan(NamedTuple):
+    image: np.ndarray  # BGR
+    parcels: List[Parcel]
+
+
+def sheet_size(megapixels: float) -> Tuple[int, int]:
+    """Width and height of a 4:3 sheet of the given size"""
+    width = max(64, round(math.sqrt(megapixels * 1_000_000 * 4 / 3)))
+    return width, max(48, round(width * 3 / 4))
+
+
+def generate_masterplan(
+    megapixels: float,
+    seed: int = 0,
+    min_parcel: int = 120,
+    max_parcel: int = 260
+) -> Masterplan:
+    """
+    Draw a synthetic masterplan of about the given size (1-100 MP).
+
+    Parcels are laid out in rows of random height, each row split into
+    parcels of random width (like blocks of plots), filled with flat colors,
+    outlined in the boundary grey and labelled with anti-aliased text. The
+    same arguments always give the same image.
+    """
+    width, height = sheet_size(megapixels)
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+
+    left, top = SHEET_MARGIN, SHEET_MARGIN
+    right, bottom = width - SHEET_MARGIN, height - SHEET_MARGIN
+    parcels = []
+
+    y = top
+    row = 0
+    while y < bottom:
+        row_height = min(int(rng.integers(min_parcel, max_parcel)), bottom - y)
+        if bottom - (y + row_height) < min_parcel // 2:
+            row_height = bottom - y  # Last row takes up the remainder
+        x = left
+        column = 0
+        while x < right:
+            parcel_width = min(int(rng.integers(min_parcel, max_parcel)), right - x)
+            if right - (x + parcel_width) < min_parcel // 2:
+                parcel_width = right - x
+            color = PARCEL_COLORS[int(rng.integers(len(PARCEL_COLORS)))]
+            cv2.rectangle(image, (x, y), (x + parcel_width - 1, y + row_height - 1), color, -1)
+
+            label = f"{chr(ord('A') + row % 26)}-{column + 1}"
+            scale = max(0.4, min(parcel_width, row_height) / 160)
+            (text_width, text_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, scale, 2)
+            origin = (x + (parcel_width - text_width) // 2, y + (row_height + text_height) // 2)
+            cv2.putText(image, label, origin, cv2.FONT_HERSHEY_SIMPLEX, scale, (30, 30, 30), 2, cv2.LINE_AA)
+
+            parcels.append(Parcel(
+                x, y, parcel_width, row_height, label,
+                (x + BOUNDARY_WIDTH + 6, y + BOUNDARY_WIDTH + 6)
+            ))
+            x += parcel_width
+            column += 1
+        y += row_height
+        row += 1
+
+    # Boundaries on top of the fills, along every parcel edge
+    for parcel in parcels:
+        cv2.rectangle(
+            image,
+            (parcel.x, parcel.y),
+            (parcel.x + parcel.width - 1, parcel.y + parcel.height - 1),
+            BOUNDARY_BGR,
+            BOUNDARY_WIDTH
+        )
+
+    return Masterplan(image, parcels)
+
+
+def parcel_ring(parcel: Parcel) -> List[List[float]]:
+    """Closed GeoJSON ring of a parcel's rectangle, in pixel coordinates"""
+    x0, y0 = float(parcel.x), float(parcel.y)
+    x1, y1 = float(parcel.x + parcel.width), float(parcel.y + parcel.height)
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]
@@ -0,0 +1,2 @@
+# test_ocr.py is a manual script run against a local sample map
+collect_ignore = ["test_ocr.py"]
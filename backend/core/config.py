@@ -1,6 +1,78 @@
+import os
+import tempfile
+
 from dotenv import load_dotenv
 
 # Load environment variables early
 load_dotenv()
 
 APP_TITLE = "Map to GeoJSON Converter"
+
+# Decoded image cache (shared by upload, process and magic-wand)
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+IMAGE_CACHE_TTL_SECONDS = float(os.environ.get("IMAGE_CACHE_TTL_SECONDS", 60 * 60))
+
+# /api/process intermediates (preprocessed image, label map, raw contours) per image, crop and settings
+PIPELINE_CACHE_MAX_BYTES = int(os.environ.get("PIPELINE_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+# Boundary-mode connected-component label maps, per image and boundary settings
+LABEL_CACHE_MAX_BYTES = int(os.environ.get("LABEL_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+# Worker threads used to process the seeds of a /api/magic-wand/batch request
+MAGIC_WAND_BATCH_WORKERS = int(os.environ.get("MAGIC_WAND_BATCH_WORKERS", os.cpu_count() or 4))
+# Units of one auto-digitize request submitted to those workers at a time
+AUTO_DIGITIZE_IN_FLIGHT = int(os.environ.get("AUTO_DIGITIZE_IN_FLIGHT", MAGIC_WAND_BATCH_WORKERS * 2))
+
+# Per-image spatial indexes of existing unit polygons (overlap checks)
+POLYGON_INDEX_CACHE_SIZE = int(os.environ.get("POLYGON_INDEX_CACHE_SIZE", 256))
+
+# Worker pool for CPU-bound request handling ("thread" or "process").
+# Process workers only run work that doesn't rely on the in-process caches
+# (run_blocking with isolated=True): the TopoJSON topology build of
+# /api/export/topojson. Everything else, including /api/process and its
+# pipeline cache, always runs on threads.
+WORKER_POOL_KIND = os.environ.get("WORKER_POOL_KIND", "thread")
+WORKER_POOL_SIZE = int(os.environ.get("WORKER_POOL_SIZE", os.cpu_count() or 4))
+# Requests allowed in flight (running + waiting) before new ones get a 503
+WORKER_QUEUE_LIMIT = int(os.environ.get("WORKER_QUEUE_LIMIT", WORKER_POOL_SIZE * 4))
+WORKER_RETRY_AFTER_SECONDS = int(os.environ.get("WORKER_RETRY_AFTER_SECONDS", 5))
+
+# Tesseract multi-pass OCR
+OCR_PASS_WORKERS = int(os.environ.get("OCR_PASS_WORKERS", 5))
+# Stop running further passes once one reaches this confidence (0-100)
+OCR_EARLY_STOP_CONFIDENCE = float(os.environ.get("OCR_EARLY_STOP_CONFIDENCE", 85))
+# Passes of one region running ahead of the highest-priority unfinished pass
+OCR_PASS_LOOKAHEAD = int(os.environ.get("OCR_PASS_LOOKAHEAD", 2))
+OCR_CACHE_SIZE = int(os.environ.get("OCR_CACHE_SIZE", 4096))  # Cached results (entries)
+# "auto" uses persistent tesserocr engines when available, else the tesseract CLI via pytesseract
+OCR_BACKEND = os.environ.get("OCR_BACKEND", "auto")
+OCR_LANGUAGE = os.environ.get("OCR_LANGUAGE", "eng")
+
+# AI vision OCR (OpenAI-compatible API, OpenRouter by default)
+OPENROUTER_BASE_URL = os.environ.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+AI_OCR_MAX_CONCURRENCY = int(os.environ.get("AI_OCR_MAX_CONCURRENCY", 4))  # Requests in flight
+AI_OCR_BATCH_SIZE = int(os.environ.get("AI_OCR_BATCH_SIZE", 8))  # Crops per model request
+AI_OCR_BATCH_WINDOW_MS = float(os.environ.get("AI_OCR_BATCH_WINDOW_MS", 25))
+AI_OCR_TIMEOUT_SECONDS = float(os.environ.get("AI_OCR_TIMEOUT_SECONDS", 20))
+AI_OCR_MAX_RETRIES = int(os.environ.get("AI_OCR_MAX_RETRIES", 2))
+AI_OCR_CACHE_SIZE = int(os.environ.get("AI_OCR_CACHE_SIZE", 4096))  # Cached results (entries)
+
+# Threads used to extract contours for the labels of one /api/process request
+EXTRACTION_WORKERS = int(os.environ.get("EXTRACTION_WORKERS", os.cpu_count() or 4))
+# Estimated working memory of the label windows one request extracts at a time
+EXTRACTION_MAX_WINDOW_BYTES = int(os.environ.get("EXTRACTION_MAX_WINDOW_BYTES", 256 * 1024 * 1024))
+
+# /api/process switches to the tiled pipeline above this many pixels (when settings.tiled is unset)
+TILED_PROCESSING_MIN_PIXELS = int(os.environ.get("TILED_PROCESSING_MIN_PIXELS", 50_000_000))
+
+# Binary and multipart image uploads
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 512 * 1024 * 1024))
+# Uploads are spooled to a temporary file once they exceed this size
+UPLOAD_SPOOL_MEMORY_BYTES = int(os.environ.get("UPLOAD_SPOOL_MEMORY_BYTES", 8 * 1024 * 1024))
+
+# PDF uploads: pages are rendered on demand and cached on disk
+PDF_CACHE_DIR = os.environ.get("PDF_CACHE_DIR", os.path.join(tempfile.gettempdir(), "map-to-geojson-pdf"))
+PDF_CACHE_MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+PDF_DEFAULT_DPI = int(os.environ.get("PDF_DEFAULT_DPI", 200))
+PDF_MIN_DPI = int(os.environ.get("PDF_MIN_DPI", 36))
+PDF_MAX_DPI = int(os.environ.get("PDF_MAX_DPI", 600))
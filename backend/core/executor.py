@@ -0,0 +1,135 @@
+"""
+Worker pools for CPU-bound request handling, with a bounded admission queue
+"""
+
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from core.config import (
+    WORKER_POOL_KIND,
+    WORKER_POOL_SIZE,
+    WORKER_QUEUE_LIMIT,
+    WORKER_RETRY_AFTER_SECONDS,
+)
+
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+_in_flight = 0
+_DONE = object()
+
+
+class WorkerPoolBusy(Exception):
+    """Raised when the worker queue is full."""
+
+
+def _get_thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(
+            max_workers=WORKER_POOL_SIZE, thread_name_prefix="worker"
+        )
+    return _thread_pool
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=WORKER_POOL_SIZE,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _process_pool
+
+
+def _get_executor(isolated: bool) -> Executor:
+    if isolated and WORKER_POOL_KIND == "process":
+        return _get_process_pool()
+    return _get_thread_pool()
+
+
+@asynccontextmanager
+async def worker_slot():
+    """
+    Reserve a place in the worker queue for the duration of a request.
+
+    Raises WorkerPoolBusy (served as 503 with Retry-After) if the queue is full.
+    """
+    global _in_flight
+    if _in_flight >= WORKER_QUEUE_LIMIT:
+        raise WorkerPoolBusy()
+
+    _in_flight += 1
+    try:
+        yield
+    finally:
+        _in_flight -= 1
+
+
+async def run_blocking(fn: Callable[..., Any], *args: Any, isolated: bool = False, **kwargs: Any) -> Any:
+    """
+    Run a blocking function on the worker pool without blocking the event loop.
+
+    Args:
+        fn: Function to run
+        isolated: True if fn only depends on its (picklable) arguments, so it
+            may run in a worker process when WORKER_POOL_KIND is "process"
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_executor(isolated), functools.partial(fn, *args, **kwargs)
+    )
+
+
+async def iter_blocking(iterator: Iterator[Any]) -> AsyncIterator[Any]:
+    """Advance a blocking iterator on the worker pool, one item at a time."""
+    while True:
+        item = await run_blocking(next, iterator, _DONE)
+        if item is _DONE:
+            return
+        yield item
+
+
+class WorkerStreamingResponse(StreamingResponse):
+    """
+    Streams a blocking iterator, advanced on the worker pool, inside a worker slot.
+
+    slot is an AsyncExitStack that entered worker_slot() (hand it over with
+    pop_all()). It is closed once the body has been sent or the client has
+    disconnected, so the slot is held for as long as the stream does work.
+    """
+
+    def __init__(self, content: Iterator[bytes], slot: AsyncExitStack, **kwargs: Any):
+        super().__init__(iter_blocking(content), **kwargs)
+        self._slot = slot
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self._slot.aclose()
+
+
+async def worker_pool_busy_handler(request: Request, exc: WorkerPoolBusy) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please retry shortly"},
+        headers={"Retry-After": str(WORKER_RETRY_AFTER_SECONDS)}
+    )
+
+
+def shutdown_pools() -> None:
+    global _thread_pool, _process_pool
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False)
+        _thread_pool = None
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False)
+        _process_pool = None
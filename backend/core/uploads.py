@@ -0,0 +1,73 @@
+"""
+Streaming ingest of binary image uploads (raw request bodies and multipart forms)
+"""
+
+import tempfile
+from typing import BinaryIO, Optional, Tuple, Type, TypeVar
+
+from fastapi import HTTPException, Request
+from pydantic import BaseModel, ValidationError
+from starlette.datastructures import UploadFile
+
+from core.config import UPLOAD_MAX_BYTES, UPLOAD_SPOOL_MEMORY_BYTES
+
+Options = TypeVar("Options", bound=BaseModel)
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Upload exceeds {UPLOAD_MAX_BYTES} bytes")
+
+
+def check_upload_size(file: UploadFile) -> None:
+    """Reject a multipart file over UPLOAD_MAX_BYTES"""
+    if file.size is not None and file.size > UPLOAD_MAX_BYTES:
+        raise _too_large()
+
+
+async def spool_body(request: Request) -> BinaryIO:
+    """Stream a raw request body into a spooled temporary file, without holding it in memory."""
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MEMORY_BYTES)
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > UPLOAD_MAX_BYTES:
+            spool.close()
+            raise _too_large()
+        spool.write(chunk)
+
+    spool.seek(0)
+    return spool
+
+
+def parse_options(model: Type[Options], options: Optional[str]) -> Options:
+    """Validate JSON request options sent next to a binary image"""
+    try:
+        return model.model_validate_json(options or "{}")
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+
+
+async def read_binary_request(request: Request, model: Type[Options]) -> Tuple[BinaryIO, Options]:
+    """
+    Read an image and its options from a binary request.
+
+    Accepts either a multipart form with a "file" part and an optional
+    "options" part (JSON), or a raw body (application/octet-stream or image/*)
+    with the JSON options in the "options" query parameter. Multipart files
+    are spooled to disk by the form parser; raw bodies by spool_body.
+
+    Returns:
+        Tuple of (file positioned at 0, parsed options)
+    """
+    content_type = request.headers.get("content-type", "")
+
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form(max_part_size=UPLOAD_SPOOL_MEMORY_BYTES)
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
+            raise HTTPException(status_code=400, detail='Multipart upload needs a "file" part')
+        check_upload_size(file)
+        options = form.get("options")
+        return file.file, parse_options(model, options if isinstance(options, str) else None)
+
+    return await spool_body(request), parse_options(model, request.query_params.get("options"))
@@ -3,18 +3,243 @@ Magic Wand Selection - Flood fill bounded by a specific color
 """
 
 import cv2
+import functools
 import numpy as np
-from typing import Tuple, Optional, List
-from collections import deque
+import threading
+from typing import Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple, Union
+from shapely import STRtree
 from shapely.geometry import Polygon as ShapelyPolygon
 
 
+# Selections covering more than this fraction of the image are rejected
+# (likely boundary detection failure)
+MAX_SELECTION_RATIO = 0.8
+
+# Padding around a selection's bounding box for refine_mask(): room for the
+# closing's dilation plus a kernel, so the refined ROI matches a full-frame run
+REFINE_MARGIN = 11
+
+BOUNDARY_METRICS = ("rgb", "lab")
+
+# Pixels classified per chunk in compute_boundary_mask (bounds the temporaries)
+BOUNDARY_CHUNK_PIXELS = 1 << 20
+
+# Side of the first flood fill window around the seed; it doubles until the
+# selection fits (see _flood_fill)
+FILL_WINDOW = 256
+
+
+class BoundaryLabels(NamedTuple):
+    """Connected components of the non-boundary pixels of an image."""
+    labels: np.ndarray  # int32 label per pixel, 0 = boundary
+    stats: np.ndarray  # cv2.connectedComponentsWithStats stats (x, y, width, height, area)
+
+
+@functools.lru_cache(maxsize=4)
+def _lab_boundary_lut(boundary_color: Tuple[int, int, int], max_delta_e: float) -> np.ndarray:
+    """
+    Boundary flag for every 24-bit color (indexed by B << 16 | G << 8 | R).
+
+    A color is a boundary when its CIE76 delta E to boundary_color is at most
+    max_delta_e. Built once per color and tolerance (16 MB, ~0.5 s).
+    """
+    rgb = np.array([[boundary_color]], dtype=np.float32) / 255
+    target = cv2.cvtColor(rgb, cv2.COLOR_RGB2LAB)[0, 0]
+
+    # One 256 x 256 plane of colors (all G, R) per blue value
+    g, r = np.divmod(np.arange(1 << 16, dtype=np.uint32), 256)
+    plane = np.empty((256, 256, 3), dtype=np.float32)
+    plane[..., 1] = (g / 255).reshape(256, 256)
+    plane[..., 2] = (r / 255).reshape(256, 256)
+
+    lut = np.empty(1 << 24, dtype=bool)
+    for b in range(256):
+        plane[..., 0] = b / 255
+        lab = cv2.cvtColor(plane, cv2.COLOR_BGR2LAB).reshape(-1, 3)
+        lut[b << 16:(b + 1) << 16] = np.sum((lab - target) ** 2, axis=1) <= max_delta_e ** 2
+    return lut
+
+
+def compute_boundary_mask(
+    image: np.ndarray,
+    boundary_color: Tuple[int, int, int] = (152, 152, 152),
+    boundary_tolerance: int = 15,
+    metric: str = "rgb"
+) -> np.ndarray:
+    """
+    Classify boundary pixels.
+
+    Works on the uint8 image in chunks of BOUNDARY_CHUNK_PIXELS, so no
+    full-frame float copies are made.
+
+    Args:
+        image: BGR image as numpy array
+        boundary_color: RGB color that acts as boundary
+        boundary_tolerance: How close a pixel must be to boundary_color to be considered boundary
+        metric: "rgb" - Euclidean RGB distance within boundary_tolerance * sqrt(3);
+            "lab" - CIE76 delta E within boundary_tolerance
+
+    Returns:
+        Boolean mask, True where the pixel is a boundary
+    """
+    if metric not in BOUNDARY_METRICS:
+        raise ValueError(f"Unknown boundary metric: {metric}")
+
+    h, w = image.shape[:2]
+    pixels = image.reshape(-1, 3)
+    mask = np.empty(h * w, dtype=bool)
+
+    if metric == "lab":
+        lut = _lab_boundary_lut(tuple(int(c) for c in boundary_color), float(boundary_tolerance))
+    else:
+        # Squared distance per channel value, BGR order; the sum stays exact in int32
+        channel_luts = [
+            ((np.arange(256, dtype=np.int32) - int(c)) ** 2)
+            for c in (boundary_color[2], boundary_color[1], boundary_color[0])
+        ]
+        # sqrt(d2) <= tolerance * sqrt(3)  <=>  d2 <= 3 * tolerance^2
+        max_squared = 3 * boundary_tolerance ** 2
+
+    for start in range(0, len(pixels), BOUNDARY_CHUNK_PIXELS):
+        chunk = pixels[start:start + BOUNDARY_CHUNK_PIXELS]
+        if metric == "lab":
+            packed = chunk[:, 0].astype(np.int32) << 16
+            packed |= chunk[:, 1].astype(np.int32) << 8
+            packed |= chunk[:, 2]
+            mask[start:start + len(chunk)] = lut[packed]
+        else:
+            squared = channel_luts[0][chunk[:, 0]]
+            squared += channel_luts[1][chunk[:, 1]]
+            squared += channel_luts[2][chunk[:, 2]]
+            np.less_equal(squared, max_squared, out=mask[start:start + len(chunk)])
+
+    return mask.reshape(h, w)
+
+
+def compute_boundary_labels(
+    image: np.ndarray,
+    boundary_color: Tuple[int, int, int] = (152, 152, 152),
+    boundary_tolerance: int = 15,
+    boundary_metric: str = "rgb"
+) -> BoundaryLabels:
+    """
+    Label every 4-connected region enclosed by the boundary color.
+
+    Computing this once per image and boundary settings turns each boundary-mode
+    click into a label lookup.
+    """
+    boundary_mask = compute_boundary_mask(image, boundary_color, boundary_tolerance, boundary_metric)
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(
+        (~boundary_mask).view(np.uint8), connectivity=4, ltype=cv2.CV_32S
+    )
+    return BoundaryLabels(labels, stats)
+
+
+def _empty_selection(error: Optional[str] = None) -> Tuple[np.ndarray, dict]:
+    bbox = {"x": 0, "y": 0, "width": 0, "height": 0}
+    if error:
+        bbox["error"] = error
+    return np.zeros((0, 0), dtype=np.uint8), bbox
+
+
+def _flood_fill(
+    image: np.ndarray,
+    seed_x: int,
+    seed_y: int,
+    fill: Callable[[np.ndarray, np.ndarray, Tuple[int, int]], Tuple[int, Tuple[int, int, int, int]]]
+) -> Tuple[int, np.ndarray, Tuple[int, int, int, int]]:
+    """
+    Flood fill from a seed in a window of the image that grows until the fill fits.
+
+    fill(window, mask, seed) runs a 4-connected FLOODFILL_MASK_ONLY fill on an
+    image window with a (h + 2) x (w + 2) zero mask and returns (filled pixel
+    count, rect). A fill that stays off the window's inner edges is the same
+    as a full-frame fill; otherwise the window doubles and the fill is rerun.
+    Memory and time scale with the selection rather than the image.
+
+    Returns:
+        Tuple of (filled pixel count, mask cropped to rect, rect in image coordinates)
+    """
+    h, w = image.shape[:2]
+    half = FILL_WINDOW // 2
+    while True:
+        x0, y0 = max(0, seed_x - half), max(0, seed_y - half)
+        x1, y1 = min(w, seed_x + half + 1), min(h, seed_y + half + 1)
+        mask = np.zeros((y1 - y0 + 2, x1 - x0 + 2), dtype=np.uint8)
+        count, (x, y, width, height) = fill(image[y0:y1, x0:x1], mask, (seed_x - x0, seed_y - y0))
+
+        reaches_edge = (
+            (x0 > 0 and x == 0) or (y0 > 0 and y == 0)
+            or (x1 < w and x + width == x1 - x0) or (y1 < h and y + height == y1 - y0)
+        )
+        if not reaches_edge:
+            selected = mask[y + 1:y + 1 + height, x + 1:x + 1 + width].copy()
+            return count, selected, (x + x0, y + y0, width, height)
+        half *= 2
+
+
+def _select_from_labels(
+    boundary_labels: BoundaryLabels,
+    seed_x: int,
+    seed_y: int
+) -> Tuple[np.ndarray, dict]:
+    """Select the labelled component under the seed point."""
+    labels, stats = boundary_labels
+    h, w = labels.shape
+
+    label = labels[seed_y, seed_x]
+    if label == 0:
+        # Seed is on a boundary
+        return _empty_selection()
+
+    if stats[label, cv2.CC_STAT_AREA] / (h * w) > MAX_SELECTION_RATIO:
+        return _empty_selection("selection_too_large")
+
+    return select_label(boundary_labels, int(label))
+
+
+def select_label(boundary_labels: BoundaryLabels, label: int) -> Tuple[np.ndarray, dict]:
+    """Mask (cropped to its bounding box) and bbox of one labelled component."""
+    labels, stats = boundary_labels
+    x, y, width, height, _ = (int(v) for v in stats[label])
+
+    window = (slice(y, y + height), slice(x, x + width))
+    result_mask = (labels[window] == label).view(np.uint8) * np.uint8(255)
+
+    return result_mask, {"x": x, "y": y, "width": width, "height": height}
+
+
+def enclosed_components(
+    boundary_labels: BoundaryLabels,
+    min_area: int = 0,
+    skip_border: bool = False
+) -> np.ndarray:
+    """
+    Labels of the components that a click could select, in raster order.
+
+    Components smaller than min_area pixels, or larger than
+    MAX_SELECTION_RATIO of the image, are left out. With skip_border,
+    components touching the image edge (usually the area around the sheet)
+    are left out too.
+    """
+    labels, stats = boundary_labels
+    h, w = labels.shape
+    x, y, width, height, area = stats[1:].T.astype(np.int64)
+
+    keep = (area >= min_area) & (area <= MAX_SELECTION_RATIO * h * w)
+    if skip_border:
+        keep &= (x > 0) & (y > 0) & (x + width < w) & (y + height < h)
+    return np.flatnonzero(keep) + 1
+
+
 def magic_wand_select_boundary(
     image: np.ndarray,
     seed_x: int,
     seed_y: int,
     boundary_color: Tuple[int, int, int] = (152, 152, 152),  # #989898
-    boundary_tolerance: int = 15
+    boundary_tolerance: int = 15,
+    boundary_labels: Optional[BoundaryLabels] = None,
+    boundary_metric: str = "rgb"
 ) -> Tuple[np.ndarray, dict]:
     """
     Perform magic wand selection using flood fill bounded by a specific color.
@@ -25,10 +250,13 @@ def magic_wand_select_boundary(
         seed_y: Y coordinate of click point
         boundary_color: RGB color that acts as boundary (default grey #989898)
         boundary_tolerance: How close a pixel must be to boundary_color to be considered boundary
+        boundary_labels: Precomputed compute_boundary_labels() result for the same
+            image and boundary settings; if given, no flood fill is run
+        boundary_metric: Color distance for boundary_tolerance, "rgb" or "lab"
 
     Returns:
         Tuple of (mask, bbox_dict)
-        mask: Binary mask of selected region
+        mask: Binary mask of the selected region, cropped to its bounding box
         bbox_dict: Bounding box {x, y, width, height}
     """
     h, w = image.shape[:2]
@@ -37,78 +265,40 @@ def magic_wand_select_boundary(
     if not (0 <= seed_x < w and 0 <= seed_y < h):
         raise ValueError(f"Seed point ({seed_x}, {seed_y}) out of image bounds ({w}x{h})")
 
-    # Convert boundary color from RGB to BGR (OpenCV uses BGR)
-    boundary_bgr = np.array([boundary_color[2], boundary_color[1], boundary_color[0]], dtype=np.float32)
+    if boundary_labels is not None:
+        return _select_from_labels(boundary_labels, seed_x, seed_y)
 
-    # Create a mask of boundary pixels
-    # A pixel is a boundary if it's within tolerance of the boundary color
-    image_float = image.astype(np.float32)
-    diff = np.sqrt(np.sum((image_float - boundary_bgr) ** 2, axis=2))
-    boundary_mask = diff <= boundary_tolerance * np.sqrt(3)  # Scale tolerance for RGB distance
-
-    # Create result mask
-    result_mask = np.zeros((h, w), dtype=np.uint8)
+    def on_boundary(window: np.ndarray) -> np.ndarray:
+        return compute_boundary_mask(window, boundary_color, boundary_tolerance, boundary_metric)
 
     # Check if seed point is on a boundary - if so, return empty
-    if boundary_mask[seed_y, seed_x]:
-        return result_mask, {"x": 0, "y": 0, "width": 0, "height": 0}
-
-    # Flood fill using BFS, stopping at boundary pixels
-    visited = np.zeros((h, w), dtype=bool)
-    queue = deque([(seed_x, seed_y)])
-    visited[seed_y, seed_x] = True
-
-    min_x, max_x = seed_x, seed_x
-    min_y, max_y = seed_y, seed_y
+    if on_boundary(image[seed_y:seed_y + 1, seed_x:seed_x + 1])[0, 0]:
+        return _empty_selection()
 
-    while queue:
-        x, y = queue.popleft()
+    # Flood fill the 4-connected non-boundary region around the seed.
+    # With a zero range the fill only spreads over pixels equal to the seed
+    # value (0 = not boundary), so boundary pixels (1) stop it.
+    flags = 4 | cv2.FLOODFILL_MASK_ONLY | (255 << 8)
 
-        # Mark as selected
-        result_mask[y, x] = 255
+    def fill(window, mask, seed):
+        count, _, _, rect = cv2.floodFill(on_boundary(window).view(np.uint8), mask, seed, 0, 0, 0, flags)
+        return count, rect
 
-        # Update bounding box
-        min_x = min(min_x, x)
-        max_x = max(max_x, x)
-        min_y = min(min_y, y)
-        max_y = max(max_y, y)
-
-        # Check 4-connected neighbors
-        for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-            nx, ny = x + dx, y + dy
-
-            # Skip if out of bounds
-            if not (0 <= nx < w and 0 <= ny < h):
-                continue
-
-            # Skip if already visited
-            if visited[ny, nx]:
-                continue
-
-            visited[ny, nx] = True
-
-            # Skip if it's a boundary pixel
-            if boundary_mask[ny, nx]:
-                continue
-
-            queue.append((nx, ny))
+    selected_pixels, result_mask, rect = _flood_fill(image, seed_x, seed_y, fill)
 
     # Check if selection is too large (likely boundary detection failure)
-    selected_pixels = np.sum(result_mask > 0)
     total_pixels = h * w
     selection_ratio = selected_pixels / total_pixels
 
-    if selection_ratio > 0.8:
-        return np.zeros((h, w), dtype=np.uint8), {
-            "x": 0, "y": 0, "width": 0, "height": 0,
-            "error": "selection_too_large"
-        }
+    if selection_ratio > MAX_SELECTION_RATIO:
+        return _empty_selection("selection_too_large")
 
+    x, y, width, height = rect
     bbox = {
-        "x": int(min_x),
-        "y": int(min_y),
-        "width": int(max_x - min_x + 1),
-        "height": int(max_y - min_y + 1)
+        "x": int(x),
+        "y": int(y),
+        "width": int(width),
+        "height": int(height)
     }
 
     return result_mask, bbox
@@ -131,7 +321,7 @@ def magic_wand_select_tolerance(
 
     Returns:
         Tuple of (mask, bbox_dict)
-        mask: Binary mask of selected region
+        mask: Binary mask of the selected region, cropped to its bounding box
         bbox_dict: Bounding box {x, y, width, height}
     """
     h, w = image.shape[:2]
@@ -140,42 +330,33 @@ def magic_wand_select_tolerance(
     if not (0 <= seed_x < w and 0 <= seed_y < h):
         raise ValueError(f"Seed point ({seed_x}, {seed_y}) out of image bounds ({w}x{h})")
 
-    # Create mask (needs to be 2 pixels larger than image)
-    mask = np.zeros((h + 2, w + 2), np.uint8)
-
     # Flood fill flags
     flags = 4  # 4-connectivity
     flags |= cv2.FLOODFILL_MASK_ONLY
     flags |= cv2.FLOODFILL_FIXED_RANGE
     flags |= (255 << 8)  # Fill mask with 255
 
-    # Perform flood fill
-    cv2.floodFill(
-        image.copy(),
-        mask,
-        (seed_x, seed_y),
-        (255, 255, 255),
-        (tolerance, tolerance, tolerance),
-        (tolerance, tolerance, tolerance),
-        flags
-    )
-
-    # Extract the actual mask (remove 1-pixel border)
-    result_mask = mask[1:-1, 1:-1]
-
-    # Find bounding box
-    points = np.where(result_mask > 0)
-    if len(points[0]) == 0:
-        return result_mask, {"x": 0, "y": 0, "width": 0, "height": 0}
-
-    y_min, y_max = points[0].min(), points[0].max()
-    x_min, x_max = points[1].min(), points[1].max()
-
+    def fill(window, mask, seed):
+        # With FLOODFILL_MASK_ONLY the image is left untouched
+        count, _, _, rect = cv2.floodFill(
+            window,
+            mask,
+            seed,
+            (255, 255, 255),
+            (tolerance, tolerance, tolerance),
+            (tolerance, tolerance, tolerance),
+            flags
+        )
+        return count, rect
+
+    _, result_mask, rect = _flood_fill(image, seed_x, seed_y, fill)
+
+    x, y, width, height = rect
     bbox = {
-        "x": int(x_min),
-        "y": int(y_min),
-        "width": int(x_max - x_min + 1),
-        "height": int(y_max - y_min + 1)
+        "x": int(x),
+        "y": int(y),
+        "width": int(width),
+        "height": int(height)
     }
 
     return result_mask, bbox
@@ -188,7 +369,9 @@ def magic_wand_select(
     use_boundary_mode: bool = True,
     boundary_color: Tuple[int, int, int] = (152, 152, 152),
     boundary_tolerance: int = 15,
-    tolerance: int = 32
+    tolerance: int = 32,
+    boundary_labels: Optional[BoundaryLabels] = None,
+    boundary_metric: str = "rgb"
 ) -> Tuple[np.ndarray, dict]:
     """
     Perform magic wand selection.
@@ -201,19 +384,53 @@ def magic_wand_select(
         boundary_color: RGB color that acts as boundary (for boundary mode)
         boundary_tolerance: How close to boundary color to be considered boundary
         tolerance: Color tolerance for tolerance mode
+        boundary_labels: Precomputed boundary labels (for boundary mode)
+        boundary_metric: Color distance for boundary_tolerance, "rgb" or "lab"
 
     Returns:
-        Tuple of (mask, bbox_dict)
+        Tuple of (mask, bbox_dict); the mask covers the bounding box only
     """
     if use_boundary_mode:
-        return magic_wand_select_boundary(image, seed_x, seed_y, boundary_color, boundary_tolerance)
+        return magic_wand_select_boundary(
+            image, seed_x, seed_y, boundary_color, boundary_tolerance, boundary_labels, boundary_metric
+        )
     else:
         return magic_wand_select_tolerance(image, seed_x, seed_y, tolerance)
 
 
+def selection_contains(mask: np.ndarray, bbox: dict, x: int, y: int) -> bool:
+    """Check whether an image point lies inside a selection (mask cropped to bbox)."""
+    col, row = x - bbox["x"], y - bbox["y"]
+    return 0 <= row < mask.shape[0] and 0 <= col < mask.shape[1] and bool(mask[row, col])
+
+
+def pad_selection(
+    mask: np.ndarray,
+    bbox: dict,
+    image_shape: Tuple[int, ...],
+    margin: int = REFINE_MARGIN
+) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Place a selection mask (cropped to bbox) in a window padded by margin pixels.
+
+    The window is clipped to the image. Returns the padded mask and its (x, y)
+    offset in the image.
+    """
+    h, w = image_shape[:2]
+    x0, y0 = max(0, bbox["x"] - margin), max(0, bbox["y"] - margin)
+    x1 = min(w, bbox["x"] + bbox["width"] + margin)
+    y1 = min(h, bbox["y"] + bbox["height"] + margin)
+
+    padded = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    row, col = bbox["y"] - y0, bbox["x"] - x0
+    padded[row:row + mask.shape[0], col:col + mask.shape[1]] = mask
+    return padded, (x0, y0)
+
+
 def mask_to_polygon(
     mask: np.ndarray,
-    simplify_tolerance: float = 2.0
+    simplify_tolerance: float = 2.0,
+    offset: Tuple[int, int] = (0, 0)
 ) -> Optional[dict]:
     """
     Convert binary mask to polygon using contour detection.
@@ -221,15 +438,18 @@ def mask_to_polygon(
     Args:
         mask: Binary mask (255 = selected, 0 = not selected)
         simplify_tolerance: Douglas-Peucker simplification tolerance
+        offset: (x, y) position of the mask in the image, for masks of an ROI
 
     Returns:
-        Dict with polygon coordinates, centroid, and area, or None if no valid contour
+        Dict with polygon coordinates, centroid, and area (image coordinates),
+        or None if no valid contour
     """
     # Find contours
     contours, _ = cv2.findContours(
         mask,
         cv2.RETR_EXTERNAL,
-        cv2.CHAIN_APPROX_SIMPLE
+        cv2.CHAIN_APPROX_SIMPLE,
+        offset=offset
     )
 
     if not contours:
@@ -281,6 +501,9 @@ def refine_mask(mask: np.ndarray) -> np.ndarray:
     """
     Refine mask using morphological operations.
 
+    For a selection, pass its pad_selection() window: with REFINE_MARGIN of
+    padding the result matches refining the full-frame mask.
+
     Args:
         mask: Binary mask
 
@@ -298,16 +521,105 @@ def refine_mask(mask: np.ndarray) -> np.ndarray:
     return refined
 
 
+def _to_shape(ring: List[List[float]]) -> Optional[ShapelyPolygon]:
+    """Build a valid polygon from a ring, repairing invalid geometry."""
+    if not ring or len(ring) < 3:
+        return None
+    shape = ShapelyPolygon(ring)
+    if not shape.is_valid:
+        shape = shape.buffer(0)  # Fix invalid geometry
+    return shape
+
+
+class PolygonIndex:
+    """
+    Spatial index of existing unit polygons for overlap checks.
+
+    Polygons live in a Shapely STRtree, so a query only exact-tests the
+    polygons whose bounding boxes intersect the new one. Polygons added since
+    the tree was built are kept in a small pending list (checked against their
+    bounds first) until enough accumulate to rebuild the tree.
+    """
+
+    def __init__(self, polygons: Optional[Dict[Hashable, List[List[List[float]]]]] = None):
+        self._shapes: Dict[Hashable, ShapelyPolygon] = {}
+        self._tree: Optional[STRtree] = None
+        self._tree_ids: List[Hashable] = []
+        self._tree_shapes: List[ShapelyPolygon] = []
+        self._pending: Dict[Hashable, ShapelyPolygon] = {}
+        self._lock = threading.Lock()
+
+        for polygon_id, coords in (polygons or {}).items():
+            self._add(polygon_id, coords)
+        self._rebuild()
+
+    def __len__(self) -> int:
+        return len(self._shapes)
+
+    def add(self, polygon_id: Hashable, coords: List[List[List[float]]]) -> None:
+        """Add or replace a polygon (GeoJSON polygon coordinates)."""
+        with self._lock:
+            self._add(polygon_id, coords)
+            if len(self._pending) > max(32, int(len(self._shapes) ** 0.5)):
+                self._rebuild()
+
+    def remove(self, polygon_id: Hashable) -> bool:
+        """Remove a polygon. Returns False if it was not indexed."""
+        with self._lock:
+            self._pending.pop(polygon_id, None)
+            return self._shapes.pop(polygon_id, None) is not None
+
+    def intersects(self, ring: List[List[float]]) -> bool:
+        """Check if a polygon ring overlaps any indexed polygon."""
+        shape = _to_shape(ring)
+        if shape is None or shape.is_empty:
+            return False
+
+        with self._lock:
+            if self._tree is not None:
+                for i in self._tree.query(shape, predicate="intersects"):
+                    polygon_id = self._tree_ids[i]
+                    # Skip entries removed or replaced since the tree was built
+                    if self._shapes.get(polygon_id) is self._tree_shapes[i]:
+                        return True
+
+            min_x, min_y, max_x, max_y = shape.bounds
+            for other in self._pending.values():
+                o_min_x, o_min_y, o_max_x, o_max_y = other.bounds
+                if o_min_x > max_x or o_max_x < min_x or o_min_y > max_y or o_max_y < min_y:
+                    continue
+                if shape.intersects(other):
+                    return True
+
+        return False
+
+    def _add(self, polygon_id: Hashable, coords: List[List[List[float]]]) -> None:
+        self._shapes.pop(polygon_id, None)
+        self._pending.pop(polygon_id, None)
+        shape = _to_shape(coords[0]) if coords else None
+        if shape is None or shape.is_empty:
+            return
+        self._shapes[polygon_id] = shape
+        self._pending[polygon_id] = shape
+
+    def _rebuild(self) -> None:
+        self._tree_ids = list(self._shapes)
+        self._tree_shapes = [self._shapes[i] for i in self._tree_ids]
+        self._tree = STRtree(self._tree_shapes) if self._tree_shapes else None
+        self._pending = {}
+
+
 def check_overlap(
     new_polygon: List[List[float]],
-    existing_polygons: List[List[List[List[float]]]]
+    existing_polygons: Union[PolygonIndex, List[List[List[List[float]]]]]
 ) -> bool:
     """
     Check if new polygon overlaps with any existing polygon.
 
     Args:
         new_polygon: List of [x, y] coordinates for the new polygon ring
-        existing_polygons: List of GeoJSON polygon coordinates (each is [[[x,y], ...]])
+        existing_polygons: PolygonIndex, or list of GeoJSON polygon coordinates
+            (each is [[[x,y], ...]])
 
     Returns:
         True if new polygon overlaps with any existing polygon
@@ -316,22 +628,9 @@ def check_overlap(
         return False
 
     try:
-        new_shape = ShapelyPolygon(new_polygon)
-        if not new_shape.is_valid:
-            new_shape = new_shape.buffer(0)  # Fix invalid geometry
-
-        for existing in existing_polygons:
-            if not existing or not existing[0]:
-                continue
-            existing_ring = existing[0]  # First ring of GeoJSON polygon
-            existing_shape = ShapelyPolygon(existing_ring)
-            if not existing_shape.is_valid:
-                existing_shape = existing_shape.buffer(0)
-
-            if new_shape.intersects(existing_shape):
-                return True
-
-        return False
+        if not isinstance(existing_polygons, PolygonIndex):
+            existing_polygons = PolygonIndex(dict(enumerate(existing_polygons)))
+        return existing_polygons.intersects(new_polygon)
     except Exception:
         # If geometry operations fail, allow the selection
         return False
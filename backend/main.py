@@ -3,16 +3,31 @@ Map Image to GeoJSON/TopoJSON Converter - Backend API
 Handles image processing and polygon extraction
 """
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from core.config import APP_TITLE
+from core.executor import WorkerPoolBusy, run_blocking, shutdown_pools, worker_pool_busy_handler
+from ocr_service import warm_up_tesseract
 from routers.process import router as process_router
 from routers.upload import router as upload_router
 from routers.magic_wand import router as magic_wand_router
 from routers.health import router as health_router
+from routers.polygons import router as polygons_router
+from routers.export import router as export_router
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_blocking(warm_up_tesseract)
+    yield
+    shutdown_pools()
+
 
-app = FastAPI(title=APP_TITLE)
+app = FastAPI(title=APP_TITLE, lifespan=lifespan)
+app.add_exception_handler(WorkerPoolBusy, worker_pool_busy_handler)
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,6 +41,8 @@ app.include_router(process_router)
 app.include_router(upload_router)
 app.include_router(magic_wand_router)
 app.include_router(health_router)
+app.include_router(polygons_router)
+app.include_router(export_router)
 
 
 if __name__ == "__main__":
@@ -3,38 +3,168 @@ OCR Service - Text extraction from image regions using Tesseract or Gemini (via
 """
 
 import os
+import re
 import cv2
+import queue
 import base64
+import hashlib
+import functools
+import threading
 import numpy as np
-from typing import Tuple, List, Optional, Any
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Tuple, List, Optional, Any, Iterator
+
+from core.config import (
+    AI_OCR_BATCH_SIZE,
+    AI_OCR_BATCH_WINDOW_MS,
+    AI_OCR_CACHE_SIZE,
+    AI_OCR_MAX_CONCURRENCY,
+    AI_OCR_MAX_RETRIES,
+    AI_OCR_TIMEOUT_SECONDS,
+    OCR_BACKEND,
+    OCR_CACHE_SIZE,
+    OCR_EARLY_STOP_CONFIDENCE,
+    OCR_LANGUAGE,
+    OCR_PASS_LOOKAHEAD,
+    OCR_PASS_WORKERS,
+    OPENROUTER_BASE_URL,
+)
+from services.ai_ocr import OPENAI_SDK_AVAILABLE, AIOCRClient
+from services.cache import LRUCache
 
 try:
     import pytesseract
-    TESSERACT_AVAILABLE = True
+    PYTESSERACT_AVAILABLE = True
 except ImportError:
-    TESSERACT_AVAILABLE = False
+    PYTESSERACT_AVAILABLE = False
 
 try:
-    from openai import OpenAI
-    OPENAI_SDK_AVAILABLE = True
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
 except ImportError:
-    OpenAI = None  # type: ignore
-    OPENAI_SDK_AVAILABLE = False
+    tesserocr = None  # type: ignore
+    TESSEROCR_AVAILABLE = False
+
+TESSERACT_AVAILABLE = PYTESSERACT_AVAILABLE or TESSEROCR_AVAILABLE
+
+# Tesseract passes run on threads: the CLI runs in a subprocess and tesserocr
+# releases the GIL while recognizing, so passes run in parallel
+_ocr_pool = ThreadPoolExecutor(max_workers=OCR_PASS_WORKERS, thread_name_prefix="ocr")
+_ocr_cache = LRUCache(OCR_CACHE_SIZE, sizeof=lambda _: 1)
+
+
+class TesseractEnginePool:
+    """
+    Long-lived tesserocr engines, created on demand up to size.
+
+    Each engine keeps its language model loaded and is used by one thread at
+    a time, so OCR passes avoid the fork and model load of the tesseract CLI.
+    """
+
+    def __init__(self, size: int, lang: str = "eng"):
+        self.size = size
+        self.lang = lang
+        self._idle: "queue.Queue[Any]" = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def engine(self) -> Iterator[Any]:
+        try:
+            api = self._idle.get_nowait()
+        except queue.Empty:
+            api = self._create_or_wait()
+
+        try:
+            yield api
+        finally:
+            api.Clear()
+            self._idle.put(api)
+
+    def warm_up(self) -> None:
+        """Create and load all engines ahead of the first request."""
+        engines = []
+        try:
+            api = self._try_create()
+            while api is not None:
+                engines.append(api)
+                api = self._try_create()
+        finally:
+            for api in engines:
+                self._idle.put(api)
+
+    def _create_or_wait(self) -> Any:
+        api = self._try_create()
+        return api if api is not None else self._idle.get()
+
+    def _try_create(self) -> Optional[Any]:
+        """Create a new engine, or return None if the pool is at capacity."""
+        with self._lock:
+            if self._created >= self.size:
+                return None
+            self._created += 1
+
+        try:
+            return tesserocr.PyTessBaseAPI(lang=self.lang, oem=tesserocr.OEM.DEFAULT)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+
+_engine_pool = TesseractEnginePool(OCR_PASS_WORKERS, OCR_LANGUAGE)
+
+
+@functools.lru_cache(maxsize=None)
+def _tesseract_backend() -> Optional[str]:
+    """Probe once for a working Tesseract backend: "tesserocr", "pytesseract" or None."""
+    if TESSEROCR_AVAILABLE and OCR_BACKEND in ("auto", "tesserocr"):
+        try:
+            _, languages = tesserocr.get_languages()
+            if OCR_LANGUAGE in languages:
+                return "tesserocr"
+        except Exception:
+            pass
+
+    if PYTESSERACT_AVAILABLE and OCR_BACKEND in ("auto", "pytesseract"):
+        try:
+            pytesseract.get_tesseract_version()
+            return "pytesseract"
+        except Exception:
+            pass
+
+    return None
+
+
+def warm_up_tesseract() -> None:
+    """Load the persistent Tesseract engines, if that backend is in use."""
+    if _tesseract_backend() == "tesserocr":
+        _engine_pool.warm_up()
+
 
 # OpenRouter configuration
 OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY", "")
 
 # Initialize OpenRouter client
-_openrouter_client: Optional[Any] = None
+_openrouter_client: Optional[AIOCRClient] = None
+_openrouter_client_lock = threading.Lock()
 
-def get_openrouter_client() -> Optional[Any]:
-    """Get or create OpenRouter client."""
+def get_openrouter_client() -> Optional[AIOCRClient]:
+    """Get or create the OpenRouter OCR client."""
     global _openrouter_client
-    if _openrouter_client is None and OPENAI_SDK_AVAILABLE and OPENROUTER_API_KEY:
-        _openrouter_client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=OPENROUTER_API_KEY,
-        )
+    with _openrouter_client_lock:
+        if _openrouter_client is None and OPENAI_SDK_AVAILABLE and OPENROUTER_API_KEY:
+            _openrouter_client = AIOCRClient(
+                base_url=OPENROUTER_BASE_URL,
+                api_key=OPENROUTER_API_KEY,
+                max_concurrency=AI_OCR_MAX_CONCURRENCY,
+                batch_size=AI_OCR_BATCH_SIZE,
+                batch_window=AI_OCR_BATCH_WINDOW_MS / 1000,
+                timeout=AI_OCR_TIMEOUT_SECONDS,
+                max_retries=AI_OCR_MAX_RETRIES,
+                cache_size=AI_OCR_CACHE_SIZE,
+            )
     return _openrouter_client
 
 
@@ -81,11 +211,17 @@ def extract_text_with_gemini(
     y2 = min(img_h, y + h + pad)
 
     # Crop the region
-    region = image[y1:y2, x1:x2].copy()
+    region = image[y1:y2, x1:x2]
 
     if region.size == 0:
         return "", 0.0
 
+    # Cache lookup before resizing and PNG encoding
+    crop_hash = hashlib.blake2b(region.tobytes(), digest_size=16).hexdigest() + str(region.shape)
+    cached = client.cached(crop_hash, model)
+    if cached is not None:
+        return cached
+
     # Scale up small regions for better visibility
     min_dim = 100
     scale = 1.0
@@ -101,38 +237,9 @@ def extract_text_with_gemini(
     base64_image = base64.b64encode(buffer).decode('utf-8')
 
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Extract the building label or code from this image. Return ONLY the text/label, nothing else. If there's no readable text, return an empty string. Do not add quotes or explanation."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=50,
-            temperature=0,
-        )
-
-        text = response.choices[0].message.content.strip()
-
-        # Clean up common artifacts
-        text = text.strip('"\'')
-        if text.lower() in ['', 'none', 'n/a', 'empty', 'no text']:
-            return "", 0.0
-
-        # Gemini doesn't provide confidence, so use 95% for non-empty results
-        return text, 95.0
+        # Crops from concurrent requests are batched into shared model calls;
+        # timeouts and API errors resolve to an empty result
+        return client.recognize_threadsafe(crop_hash, base64_image, model).result()
 
     except Exception as e:
         print(f"Gemini OCR error: {e}")
@@ -177,18 +284,31 @@ def preprocess_for_ocr(image: np.ndarray, invert: bool = False) -> np.ndarray:
     return binary
 
 
+def _mask_window(mask: np.ndarray, offset: Tuple[int, int], x1: int, y1: int, x2: int, y2: int) -> np.ndarray:
+    """Image window [y1:y2, x1:x2] of a mask placed at offset (zero outside the mask)"""
+    ox, oy = offset
+    window = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+    mx1, my1 = max(x1, ox), max(y1, oy)
+    mx2, my2 = min(x2, ox + mask.shape[1]), min(y2, oy + mask.shape[0])
+    if mx2 > mx1 and my2 > my1:
+        window[my1 - y1:my2 - y1, mx1 - x1:mx2 - x1] = mask[my1 - oy:my2 - oy, mx1 - ox:mx2 - ox]
+    return window
+
+
 def extract_text_from_polygon(
     image: np.ndarray,
     mask: np.ndarray,
-    polygon_coords: List[List[float]]
+    polygon_coords: List[List[float]],
+    mask_offset: Tuple[int, int] = (0, 0)
 ) -> Tuple[str, float]:
     """
     Extract text from inside the polygon region.
 
     Args:
         image: Full BGR image
-        mask: Binary mask of the flood-filled region
+        mask: Binary mask of the flood-filled region (full frame, or an ROI)
         polygon_coords: List of [x, y] coordinates defining the polygon
+        mask_offset: (x, y) position of the mask in the image
 
     Returns:
         Tuple of (extracted_text, confidence_score)
@@ -212,8 +332,8 @@ def extract_text_from_polygon(
     y2 = min(img_h, y + h + pad)
 
     # Crop the region
-    region = image[y1:y2, x1:x2].copy()
-    mask_region = mask[y1:y2, x1:x2].copy()
+    region = image[y1:y2, x1:x2]
+    mask_region = _mask_window(mask, mask_offset, x1, y1, x2, y2)
 
     if region.size == 0:
         return "", 0.0
@@ -226,39 +346,63 @@ def extract_text_from_polygon(
     mask_3ch = cv2.cvtColor(mask_region, cv2.COLOR_GRAY2BGR) if len(region.shape) == 3 else mask_region
     masked = np.where(mask_3ch > 0, region, white_bg)
 
-    # Try multiple OCR approaches and pick best result
-    results = []
+    cache_key = _ocr_cache_key(masked)
+    cached = _ocr_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    result = _run_ocr_passes(_ocr_passes(masked))
+    _ocr_cache.put(cache_key, result)
+    return result
 
-    # Approach 1: Direct OCR on masked image (light scaling only)
+
+def _ocr_passes(masked: np.ndarray) -> List[Tuple[np.ndarray, str]]:
+    """Images and Tesseract configs to try on a masked region, best first."""
+    # Direct OCR on masked image (light scaling only)
     # This works best for clean, colored regions with text
     scaled_masked = preprocess_light(masked)
-    text1, conf1 = run_ocr(scaled_masked, '--psm 7 --oem 3')  # Single line
-    if text1:
-        results.append((text1, conf1))
-
-    # Approach 2: Direct on masked, block of text mode
-    text2, conf2 = run_ocr(scaled_masked, '--psm 6 --oem 3')
-    if text2:
-        results.append((text2, conf2))
-
-    # Approach 3: Sparse text mode on masked
-    text3, conf3 = run_ocr(scaled_masked, '--psm 11 --oem 3')
-    if text3:
-        results.append((text3, conf3))
-
-    # Approach 4: Heavy preprocessing (for low contrast)
-    processed = preprocess_for_ocr(masked, invert=False)
-    text4, conf4 = run_ocr(processed, '--psm 7 --oem 3')
-    if text4:
-        results.append((text4, conf4))
-
-    # Approach 5: Inverted heavy preprocessing
-    processed_inv = preprocess_for_ocr(masked, invert=True)
-    text5, conf5 = run_ocr(processed_inv, '--psm 7 --oem 3')
-    if text5:
-        results.append((text5, conf5))
-
-    # Pick result with highest confidence
+
+    return [
+        (scaled_masked, '--psm 7 --oem 3'),  # Single line
+        (scaled_masked, '--psm 6 --oem 3'),  # Block of text
+        (scaled_masked, '--psm 11 --oem 3'),  # Sparse text
+        # Heavy preprocessing (for low contrast), normal and inverted
+        (preprocess_for_ocr(masked, invert=False), '--psm 7 --oem 3'),
+        (preprocess_for_ocr(masked, invert=True), '--psm 7 --oem 3'),
+    ]
+
+
+def _run_ocr_passes(passes: List[Tuple[np.ndarray, str]]) -> Tuple[str, float]:
+    """
+    Run OCR passes in priority order and pick the result.
+
+    The first pass (in priority order) reaching OCR_EARLY_STOP_CONFIDENCE
+    wins, as if the passes ran one after another; otherwise the most
+    confident pass does (the earliest on ties). Up to OCR_PASS_LOOKAHEAD
+    passes run concurrently, and later passes only start once an earlier one
+    has finished below the threshold, so an early stop saves their work and
+    the result does not depend on thread timing.
+    """
+    futures = []
+    results = []
+    try:
+        for index in range(len(passes)):
+            # Keep the lookahead window filled, in priority order
+            while len(futures) < min(len(passes), index + max(1, OCR_PASS_LOOKAHEAD)):
+                image, config = passes[len(futures)]
+                futures.append(_ocr_pool.submit(run_ocr, image, config))
+
+            text, conf = futures[index].result()
+            if not text:
+                continue
+            if conf >= OCR_EARLY_STOP_CONFIDENCE:
+                return text, conf
+            results.append((text, conf))
+    finally:
+        for future in futures:
+            future.cancel()
+
+    # Pick result with highest confidence (stable: earliest pass on ties)
     if results:
         results.sort(key=lambda x: x[1], reverse=True)
         return results[0]
@@ -266,27 +410,37 @@ def extract_text_from_polygon(
     return "", 0.0
 
 
+def _ocr_cache_key(masked: np.ndarray) -> tuple:
+    """Cache key for a masked region: its content hash and the OCR settings."""
+    digest = hashlib.blake2b(masked.tobytes(), digest_size=16).hexdigest()
+    return (digest, masked.shape, OCR_EARLY_STOP_CONFIDENCE)
+
+
 def run_ocr(image: np.ndarray, config: str) -> Tuple[str, float]:
     """Run OCR with given config and return text + confidence."""
     try:
-        data = pytesseract.image_to_data(
-            image,
-            config=config,
-            output_type=pytesseract.Output.DICT
-        )
+        if _tesseract_backend() == "tesserocr":
+            words = _recognize_words(image, config)
+        else:
+            data = pytesseract.image_to_data(
+                image,
+                config=config,
+                output_type=pytesseract.Output.DICT
+            )
+            words = list(zip(data['text'], data['conf']))
 
         texts = []
         confidences = []
 
-        for i, text in enumerate(data['text']):
-            conf = data['conf'][i]
+        for text, conf in words:
+            conf = float(conf)
             text = text.strip()
             # Filter out noise - require reasonable confidence and length
             if text and conf > 30 and len(text) >= 1:
                 # Skip if it's just punctuation or single special char
                 if text.isalnum() or len(text) > 1:
                     texts.append(text)
-                    confidences.append(float(conf))
+                    confidences.append(conf)
 
         if texts:
             combined_text = ' '.join(texts)
@@ -300,6 +454,38 @@ def run_ocr(image: np.ndarray, config: str) -> Tuple[str, float]:
         return "", 0.0
 
 
+def _recognize_words(image: np.ndarray, config: str) -> List[Tuple[str, float]]:
+    """
+    Recognize words with a pooled tesserocr engine.
+
+    The image is handed over in memory; like pytesseract, channels are passed
+    in array order. Only the --psm option of config is honoured.
+    """
+    psm_match = re.search(r"--psm\s+(\d+)", config)
+    psm = int(psm_match.group(1)) if psm_match else tesserocr.PSM.AUTO
+
+    image = np.ascontiguousarray(image)
+    height, width = image.shape[:2]
+    bytes_per_pixel = 1 if image.ndim == 2 else image.shape[2]
+
+    words = []
+    with _engine_pool.engine() as api:
+        api.SetPageSegMode(psm)
+        api.SetImageBytes(image.tobytes(), width, height, bytes_per_pixel, width * bytes_per_pixel)
+        api.Recognize()
+
+        iterator = api.GetIterator()
+        if iterator is not None:
+            level = tesserocr.RIL.WORD
+            for word in tesserocr.iterate_level(iterator, level):
+                try:
+                    words.append((word.GetUTF8Text(level), word.Confidence(level)))
+                except RuntimeError:
+                    continue  # Empty element
+
+    return words
+
+
 def extract_text_from_region(
     image: np.ndarray,
     bbox: dict,
@@ -332,12 +518,8 @@ def extract_text_from_region(
 
 
 def is_tesseract_available() -> bool:
-    """Check if Tesseract is available."""
+    """Check if Tesseract is available (probed once per process)."""
     if not TESSERACT_AVAILABLE:
         return False
 
-    try:
-        pytesseract.get_tesseract_version()
-        return True
-    except Exception:
-        return False
+    return _tesseract_backend() is not None
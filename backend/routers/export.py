@@ -0,0 +1,94 @@
+from contextlib import AsyncExitStack
+from itertools import chain
+from typing import Iterator, List
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from core.executor import WorkerStreamingResponse, run_blocking, worker_slot
+from schemas import ExportRequest
+from services.geobuf import MAX_PRECISION, encode_geobuf
+from services.topojson import build_topology, group_objects, iter_topojson
+
+router = APIRouter()
+
+POLYGON_TYPES = ("Polygon", "MultiPolygon")
+
+
+def _validate_features(features: List[dict]):
+    for index, feature in enumerate(features):
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") not in POLYGON_TYPES:
+            raise ValueError(f"Feature {index}: only Polygon and MultiPolygon geometries can be exported")
+
+
+def _topojson(request: ExportRequest):
+    _validate_features(request.features)
+    topology = build_topology(request.features, request.quantization)
+    return topology, group_objects(request.features, topology.geometries, request.group_by)
+
+
+def _geobuf(request: ExportRequest) -> Iterator[bytes]:
+    _validate_features(request.features)
+    yield from encode_geobuf(request.features, request.precision)
+
+
+@router.post("/api/export/topojson")
+async def export_topojson(request: ExportRequest):
+    """
+    Convert unit features to TopoJSON.
+
+    Boundaries shared by neighbouring units are stored once as common arcs,
+    and coordinates are quantized (see ExportRequest.quantization). Features
+    are grouped into one object per value of the group_by property, like the
+    frontend export. The document is streamed in chunks.
+    """
+    if request.quantization < 0:
+        raise HTTPException(status_code=400, detail="quantization must be 0 or greater")
+
+    async with worker_slot():
+        try:
+            # Depends on the request only, so it may run in a worker process
+            topology, objects = await run_blocking(_topojson, request, isolated=True)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return StreamingResponse(
+        iter_topojson(topology, objects),
+        media_type="application/json",
+        headers={"Content-Disposition": 'attachment; filename="units.topojson"'}
+    )
+
+
+@router.post("/api/export/geobuf")
+async def export_geobuf(request: ExportRequest):
+    """
+    Convert unit features to Geobuf, a compact protobuf encoding of GeoJSON.
+
+    Coordinates are stored as delta-encoded integers with request.precision
+    decimal places; decode with the geobuf library (geobuf.decode). Features
+    are encoded and streamed in chunks.
+    """
+    if request.precision is not None and not 0 <= request.precision <= MAX_PRECISION:
+        raise HTTPException(status_code=400, detail=f"precision must be between 0 and {MAX_PRECISION}")
+
+    async with AsyncExitStack() as slot:
+        await slot.enter_async_context(worker_slot())
+        try:
+            chunks = _geobuf(request)
+            # Everything up to the first chunk runs here, so errors still get a status code
+            first = await run_blocking(next, chunks)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        # Features are encoded as the body is sent
+        return WorkerStreamingResponse(
+            chain([first], chunks),
+            slot.pop_all(),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": 'attachment; filename="units.pbf"'}
+        )
@@ -1,98 +1,186 @@
-from fastapi import APIRouter, HTTPException
-
-from magic_wand import magic_wand_select, mask_to_polygon, refine_mask, check_overlap
-from ocr_service import (
-    extract_text_from_polygon,
-    extract_text_with_gemini,
-    is_tesseract_available,
-    is_gemini_available,
+from contextlib import AsyncExitStack
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+import numpy as np
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+import orjson
+from PIL import UnidentifiedImageError
+
+from core.executor import WorkerStreamingResponse, run_blocking, worker_slot
+from core.uploads import read_binary_request
+from schemas import (
+    AutoDigitizeRequest,
+    MagicWandBatchRequest,
+    MagicWandOptions,
+    MagicWandRequest,
+    MagicWandResponse,
 )
-from schemas import MagicWandRequest, MagicWandResponse
-from services.image_processing import decode_image
+from services.boundary_labels import get_boundary_labels
+from services.image_store import ImageNotFoundError, load_image, store_encoded_image
+from services.polygon_index import resolve_overlap_index
+from services.selection import build_response, digitize_sheet, select_batch, select_region
 
 router = APIRouter()
 
 
-@router.post("/api/magic-wand")
-async def magic_wand(request: MagicWandRequest):
-    """
-    Magic wand selection endpoint.
-    Click on the image to select a region using flood fill.
-    Returns polygon coordinates and OCR text from the selected region.
-    """
+def _resolve_image(options: MagicWandOptions, file: Optional[BinaryIO]) -> Tuple[str, np.ndarray]:
+    if file is not None:
+        return store_encoded_image(file)
+    return load_image(options.image_id, options.image_data)
+
+
+def _magic_wand(request: MagicWandRequest, file: Optional[BinaryIO] = None) -> MagicWandResponse:
     try:
-        img = decode_image(request.image_data)
-
-        boundary_color = tuple(request.boundary_color[:3])
-        mask, bbox = magic_wand_select(
-            img,
-            request.click_x,
-            request.click_y,
-            use_boundary_mode=request.use_boundary_mode,
-            boundary_color=boundary_color,
-            boundary_tolerance=request.boundary_tolerance,
-            tolerance=request.tolerance
-        )
+        image_id, img = _resolve_image(request, file)
 
-        if bbox.get("error") == "selection_too_large":
-            return MagicWandResponse(
-                success=False,
-                error="Selection too large - the boundary color may not be present in this area. Try adjusting the boundary color or tolerance."
+        boundary_labels = None
+        if request.use_boundary_mode:
+            boundary_labels = get_boundary_labels(
+                image_id, img, tuple(request.boundary_color[:3]), request.boundary_tolerance,
+                request.boundary_metric
             )
 
-        refined_mask = refine_mask(mask)
-        result = mask_to_polygon(refined_mask, request.simplify_tolerance)
+        mask, bbox = select_region(
+            img, request.click_x, request.click_y, request, boundary_labels
+        )
+        overlap_index = resolve_overlap_index(image_id, request)
+        return build_response(img, mask, bbox, request, overlap_index, request.unit_id)
+
+    except ImageNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found or expired - upload it again")
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=400, detail="Unsupported or corrupt image file")
+    except ValueError as e:
+        return MagicWandResponse(success=False, error=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _magic_wand_batch(request: MagicWandBatchRequest, file: Optional[BinaryIO] = None) -> List[MagicWandResponse]:
+    try:
+        image_id, img = _resolve_image(request, file)
 
-        if result is None:
-            return MagicWandResponse(
-                success=False,
-                error="No valid region selected. Try adjusting tolerance or clicking elsewhere."
+        boundary_labels = None
+        if request.use_boundary_mode:
+            boundary_labels = get_boundary_labels(
+                image_id, img, tuple(request.boundary_color[:3]), request.boundary_tolerance,
+                request.boundary_metric
             )
 
-        if request.existing_polygons and result["polygon"]:
-            new_ring = result["polygon"][0]
-            if check_overlap(new_ring, request.existing_polygons):
-                return MagicWandResponse(
-                    success=False,
-                    error="This area overlaps with an existing selection. Please select a different area."
-                )
-
-        ocr_text = ""
-        ocr_confidence = 0.0
-
-        if bbox["width"] > 0 and bbox["height"] > 0:
-            polygon_coords = result["polygon"][0][:-1] if result["polygon"][0] else []
-
-            if request.ocr_engine == "ai" and is_gemini_available():
-                ocr_text, ocr_confidence = extract_text_with_gemini(
-                    img, refined_mask, polygon_coords, model=request.ai_model
-                )
-            elif request.ocr_engine == "tesseract" and is_tesseract_available():
-                ocr_text, ocr_confidence = extract_text_from_polygon(
-                    img, refined_mask, polygon_coords
-                )
-
-            if not ocr_text:
-                if request.ocr_engine == "ai" and is_tesseract_available():
-                    ocr_text, ocr_confidence = extract_text_from_polygon(
-                        img, refined_mask, polygon_coords
-                    )
-                elif request.ocr_engine == "tesseract" and is_gemini_available():
-                    ocr_text, ocr_confidence = extract_text_with_gemini(
-                        img, refined_mask, polygon_coords, model=request.ai_model
-                    )
-
-        return MagicWandResponse(
-            success=True,
-            polygon=result["polygon"],
-            centroid=result["centroid"],
-            bbox=bbox,
-            ocr_text=ocr_text,
-            ocr_confidence=ocr_confidence,
-            area=result["area"]
+        overlap_index = resolve_overlap_index(image_id, request)
+        return select_batch(img, request.seeds, request, boundary_labels, overlap_index)
+
+    except ImageNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found or expired - upload it again")
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=400, detail="Unsupported or corrupt image file")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _auto_digitize(request: AutoDigitizeRequest, file: Optional[BinaryIO] = None):
+    try:
+        image_id, img = _resolve_image(request, file)
+        boundary_labels = get_boundary_labels(
+            image_id, img, tuple(request.boundary_color[:3]), request.boundary_tolerance,
+            request.boundary_metric
         )
+        overlap_index = resolve_overlap_index(image_id, request)
+        return digitize_sheet(img, request, boundary_labels, overlap_index)
 
+    except ImageNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found or expired - upload it again")
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=400, detail="Unsupported or corrupt image file")
     except ValueError as e:
-        return MagicWandResponse(success=False, error=str(e))
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def _unit_lines(responses: Iterator[MagicWandResponse]) -> Iterator[bytes]:
+    for response in responses:
+        yield orjson.dumps(response.model_dump()) + b"\n"
+
+
+async def _stream_units(request: AutoDigitizeRequest, file: Optional[BinaryIO] = None) -> StreamingResponse:
+    async with AsyncExitStack() as slot:
+        await slot.enter_async_context(worker_slot())
+        unit_count, responses = await run_blocking(_auto_digitize, request, file)
+
+        # The label map is built before responding; polygons and OCR then run
+        # on the batch pool while the units stream, still inside the worker slot
+        return WorkerStreamingResponse(
+            _unit_lines(responses),
+            slot.pop_all(),
+            media_type="application/x-ndjson",
+            headers={"X-Unit-Count": str(unit_count)}
+        )
+
+
+@router.post("/api/magic-wand")
+async def magic_wand(request: MagicWandRequest) -> MagicWandResponse:
+    """
+    Magic wand selection endpoint.
+    Click on the image to select a region using flood fill.
+    Returns polygon coordinates and OCR text from the selected region.
+    """
+    async with worker_slot():
+        return await run_blocking(_magic_wand, request)
+
+
+@router.post("/api/magic-wand/batch")
+async def magic_wand_batch(request: MagicWandBatchRequest) -> List[MagicWandResponse]:
+    """
+    Batch magic wand selection.
+    Runs the magic wand for every seed point on one image and returns one
+    result per seed, in order. Seeds that land in a region already selected
+    by an earlier seed are returned with duplicate_of set.
+    """
+    async with worker_slot():
+        return await run_blocking(_magic_wand_batch, request)
+
+
+@router.post("/api/magic-wand/binary")
+async def magic_wand_binary(request: Request) -> MagicWandResponse:
+    """
+    Magic wand selection on an image sent as binary instead of base64.
+
+    Send either a multipart form with a "file" part and an "options" part, or
+    the raw image bytes (application/octet-stream) with an "options" query
+    parameter. Options are a JSON MagicWandRequest without the image.
+    """
+    file, wand_request = await read_binary_request(request, MagicWandRequest)
+    async with worker_slot():
+        return await run_blocking(_magic_wand, wand_request, file)
+
+
+@router.post("/api/magic-wand/batch/binary")
+async def magic_wand_batch_binary(request: Request) -> List[MagicWandResponse]:
+    """Batch magic wand selection on an image sent as binary (see /api/magic-wand/binary)."""
+    file, batch_request = await read_binary_request(request, MagicWandBatchRequest)
+    async with worker_slot():
+        return await run_blocking(_magic_wand_batch, batch_request, file)
+
+
+@router.post("/api/magic-wand/auto-digitize")
+async def auto_digitize(request: AutoDigitizeRequest) -> StreamingResponse:
+    """
+    Extract every boundary-enclosed unit of the sheet in one pass.
+
+    Uses the boundary color settings to label all regions at once, then
+    builds each unit's polygon and OCR label in parallel. Units are streamed
+    as NDJSON (one MagicWandResponse per line, with unit_index) in the order
+    they complete; the X-Unit-Count header gives the total.
+    """
+    return await _stream_units(request)
+
+
+@router.post("/api/magic-wand/auto-digitize/binary")
+async def auto_digitize_binary(request: Request) -> StreamingResponse:
+    """Auto-digitize an image sent as binary (see /api/magic-wand/binary)."""
+    file, digitize_request = await read_binary_request(request, AutoDigitizeRequest)
+    return await _stream_units(digitize_request, file)
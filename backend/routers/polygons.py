@@ -0,0 +1,46 @@
+from fastapi import APIRouter, HTTPException, Query
+
+from core.executor import run_blocking
+from magic_wand import PolygonIndex
+from schemas import SessionPolygon, SessionPolygons
+from services.polygon_index import get_session_index, replace_session_index
+
+router = APIRouter()
+
+# Polygon sets are per client session: image IDs are content hashes, so two
+# clients working on the same sheet share an image_id
+SESSION_ID = Query(..., min_length=1, description="Client session ID")
+
+
+def _replace(session_id: str, image_id: str, polygons: dict) -> None:
+    replace_session_index(session_id, image_id, PolygonIndex(polygons))
+
+
+def _upsert(session_id: str, image_id: str, unit_id: str, coordinates: list) -> None:
+    get_session_index(session_id, image_id).add(unit_id, coordinates)
+
+
+def _remove(session_id: str, image_id: str, unit_id: str) -> bool:
+    return get_session_index(session_id, image_id).remove(unit_id)
+
+
+@router.put("/api/images/{image_id}/polygons")
+async def sync_polygons(image_id: str, request: SessionPolygons, session_id: str = SESSION_ID):
+    """Replace the set of unit polygons used for overlap checks on an image."""
+    await run_blocking(_replace, session_id, image_id, request.polygons)
+    return {"success": True, "count": len(request.polygons)}
+
+
+@router.put("/api/images/{image_id}/polygons/{unit_id}")
+async def upsert_polygon(image_id: str, unit_id: str, request: SessionPolygon, session_id: str = SESSION_ID):
+    """Add or update a single unit polygon (e.g. after a vertex edit)."""
+    await run_blocking(_upsert, session_id, image_id, unit_id, request.coordinates)
+    return {"success": True}
+
+
+@router.delete("/api/images/{image_id}/polygons/{unit_id}")
+async def delete_polygon(image_id: str, unit_id: str, session_id: str = SESSION_ID):
+    """Remove a unit polygon (e.g. after the unit is deleted)."""
+    if not await run_blocking(_remove, session_id, image_id, unit_id):
+        raise HTTPException(status_code=404, detail="Polygon not found")
+    return {"success": True}
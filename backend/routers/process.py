@@ -1,76 +1,84 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
-import numpy as np
+from contextlib import AsyncExitStack
+from itertools import chain
+from typing import BinaryIO, Optional
 
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from PIL import UnidentifiedImageError
+
+from core.executor import WorkerStreamingResponse, run_blocking, worker_slot
+from core.uploads import read_binary_request
 from schemas import ProcessRequest
-from services.image_processing import (
-    decode_image,
-    preprocess_image,
-    segment_by_color,
-    extract_region_contours,
-    contour_to_polygon,
-)
-from services.georeference import assign_zone_ids, transform_coordinates
+from services.extraction import extract_feature_chunks, extract_features
+from services.geojson_stream import OUTPUT_FORMATS, iter_feature_collection, iter_feature_lines
+from services.image_store import ImageNotFoundError, load_image, store_encoded_image
 
 router = APIRouter()
 
 
+async def _process(request: ProcessRequest, file: Optional[BinaryIO] = None) -> StreamingResponse:
+    if request.output_format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown output format: {request.output_format}")
+    if request.coordinate_precision is not None and not 0 <= request.coordinate_precision <= 15:
+        raise HTTPException(status_code=400, detail="coordinate_precision must be between 0 and 15")
+
+    async with AsyncExitStack() as slot:
+        await slot.enter_async_context(worker_slot())
+        try:
+            if file is not None:
+                image_id, img = await run_blocking(store_encoded_image, file)
+            else:
+                image_id, img = await run_blocking(load_image, request.image_id, request.image_data)
+
+            # On a thread: the pipeline cache lives in this process
+            if request.output_format == "ndjson":
+                chunks = extract_feature_chunks(img, request, image_id)
+                # Everything up to the first chunk runs here, so errors still get a status code
+                first = await run_blocking(next, chunks)
+            else:
+                geojson = await run_blocking(extract_features, img, request, image_id)
+
+        except ImageNotFoundError:
+            raise HTTPException(status_code=404, detail="Image not found or expired - upload it again")
+        except UnidentifiedImageError:
+            raise HTTPException(status_code=400, detail="Unsupported or corrupt image file")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        if request.output_format == "ndjson":
+            # One Feature per line as they are georeferenced, then a metadata line
+            return WorkerStreamingResponse(
+                iter_feature_lines(chain([first], chunks)),
+                slot.pop_all(),
+                media_type="application/x-ndjson"
+            )
+
+    return StreamingResponse(iter_feature_collection(geojson), media_type="application/json")
+
+
 @router.post("/api/process")
 async def process_image(request: ProcessRequest):
-    """Main endpoint: process image and extract polygons"""
-    try:
-        img = decode_image(request.image_data)
-        original_height, original_width = img.shape[:2]
-
-        if request.crop:
-            crop = request.crop
-            img = img[
-                crop.y: crop.y + crop.height,
-                crop.x: crop.x + crop.width
-            ]
-
-        img_height, img_width = img.shape[:2]
-        img_area = img_width * img_height
-
-        processed = preprocess_image(img)
-        labels = segment_by_color(processed, request.settings.color_clusters)
-
-        all_polygons = []
-        unique_labels = np.unique(labels)
-
-        for label_id in unique_labels:
-            contours = extract_region_contours(
-                labels, label_id, request.settings, img_area
-            )
+    """
+    Main endpoint: process image and extract polygons.
+
+    The result is streamed as a GeoJSON FeatureCollection, or as
+    newline-delimited Features with output_format "ndjson". NDJSON lines are
+    sent as soon as the features are georeferenced; the last line is
+    {"metadata": {...}} with the collection's metadata.
+    """
+    return await _process(request)
+
+
+@router.post("/api/process/binary")
+async def process_image_binary(request: Request):
+    """
+    Process an image sent as binary instead of base64.
 
-            for contour in contours:
-                poly = contour_to_polygon(contour)
-                if poly:
-                    all_polygons.append({"geometry": poly})
-
-        features = assign_zone_ids(all_polygons)
-        features = transform_coordinates(
-            features,
-            img_width,
-            img_height,
-            request.control_points,
-            request.bounding_box
-        )
-
-        geojson = {
-            "type": "FeatureCollection",
-            "features": features,
-            "metadata": {
-                "image_width": img_width,
-                "image_height": img_height,
-                "original_width": original_width,
-                "original_height": original_height,
-                "georeferenced": bool(request.control_points or request.bounding_box),
-                "coordinate_system": "EPSG:4326" if (request.control_points or request.bounding_box) else "pixel"
-            }
-        }
-
-        return JSONResponse(content=geojson)
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    Send either a multipart form with a "file" part and an optional "options"
+    part, or the raw image bytes (application/octet-stream) with an "options"
+    query parameter. Options are a JSON ProcessRequest without the image.
+    """
+    file, process_request = await read_binary_request(request, ProcessRequest)
+    return await _process(process_request, file)
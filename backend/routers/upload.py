@@ -1,58 +1,140 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from PIL import Image
-import io
+from typing import BinaryIO, Optional
+
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from PIL import Image, UnidentifiedImageError
 import base64
 
+from core.config import PDF_DEFAULT_DPI, PDF_MAX_DPI, PDF_MIN_DPI
+from core.executor import run_blocking, worker_slot
+from core.uploads import check_upload_size
+from services.image_store import ImageTooLargeError, store_encoded_image
+from services.pdf_pages import (
+    PDFDocumentNotFoundError,
+    PDFRenderingUnavailable,
+    pdf_page_count,
+    render_pdf_page,
+    rendered_page_path,
+    store_pdf,
+)
+
 router = APIRouter()
 
+POPPLER_REQUIRED = "PDF support requires poppler. Install with: apt-get install poppler-utils"
 
-@router.post("/api/upload")
-async def upload_image(file: UploadFile = File(...)):
-    """Upload and return image info"""
+
+def _data_url(file: BinaryIO, mime: str) -> str:
+    file.seek(0)
+    return f"data:{mime};base64,{base64.b64encode(file.read()).decode()}"
+
+
+def _read_pdf_page(document_id: str, page: int, dpi: int, include_data: bool) -> dict:
+    image_id, img = render_pdf_page(document_id, page, dpi)
+    height, width = img.shape[:2]
+
+    result = {
+        "success": True,
+        "image_id": image_id,
+        "width": width,
+        "height": height,
+        "document_id": document_id,
+        "page": page,
+        "pages": pdf_page_count(document_id),
+        "dpi": dpi
+    }
+    if include_data:
+        with open(rendered_page_path(document_id, page, dpi), "rb") as file:
+            result["image_data"] = _data_url(file, "image/png")
+    return result
+
+
+def _read_upload(
+    file: BinaryIO,
+    content_type: Optional[str],
+    include_data: bool,
+    page: int = 1,
+    dpi: int = PDF_DEFAULT_DPI
+) -> dict:
     try:
-        contents = await file.read()
-
-        if file.content_type == "application/pdf":
-            try:
-                from pdf2image import convert_from_bytes
-                images = convert_from_bytes(contents)
-                if images:
-                    buffer = io.BytesIO()
-                    images[0].save(buffer, format="PNG")
-                    base64_data = base64.b64encode(buffer.getvalue()).decode()
-                    width, height = images[0].size
-                    return {
-                        "success": True,
-                        "image_data": f"data:image/png;base64,{base64_data}",
-                        "width": width,
-                        "height": height,
-                        "pages": len(images)
-                    }
-            except ImportError:
-                raise HTTPException(
-                    status_code=400,
-                    detail="PDF support requires poppler. Install with: apt-get install poppler-utils"
-                )
-
-        image = Image.open(io.BytesIO(contents))
-        width, height = image.size
-
-        buffer = io.BytesIO()
-        if image.mode == "RGBA":
-            image.save(buffer, format="PNG")
-            mime = "image/png"
-        else:
-            image.save(buffer, format="PNG")
-            mime = "image/png"
-
-        base64_data = base64.b64encode(buffer.getvalue()).decode()
-
-        return {
+        if content_type == "application/pdf":
+            # Only the requested page is rendered
+            return _read_pdf_page(store_pdf(file), page, dpi, include_data)
+
+        # Decode the original bytes once; no re-encoding
+        image_id, img = store_encoded_image(file, must_store=True)
+        height, width = img.shape[:2]
+
+        result = {
             "success": True,
-            "image_data": f"data:{mime};base64,{base64_data}",
+            "image_id": image_id,
             "width": width,
             "height": height
         }
+        if include_data:
+            file.seek(0)
+            mime = Image.MIME.get(Image.open(file).format, content_type or "application/octet-stream")
+            result["image_data"] = _data_url(file, mime)
+        return result
+
+    except PDFRenderingUnavailable:
+        raise HTTPException(status_code=400, detail=POPPLER_REQUIRED)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=400, detail="Unsupported or corrupt image file")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 
+def _read_stored_pdf_page(document_id: str, page: int, dpi: int, include_data: bool) -> dict:
+    try:
+        return _read_pdf_page(document_id, page, dpi, include_data)
+    except PDFDocumentNotFoundError:
+        raise HTTPException(status_code=404, detail="Document not found or expired - upload it again")
+    except PDFRenderingUnavailable:
+        raise HTTPException(status_code=400, detail=POPPLER_REQUIRED)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/api/upload")
+async def upload_image(
+    file: UploadFile = File(...),
+    include_data: bool = True,
+    page: int = Query(1, ge=1),
+    dpi: int = Query(PDF_DEFAULT_DPI, ge=PDF_MIN_DPI, le=PDF_MAX_DPI)
+):
+    """
+    Upload an image and return its ID and size.
+
+    The file is streamed to a spooled temporary file and decoded once. Pass
+    the returned image_id to the other endpoints instead of resending the
+    image. The original file is also returned as a data URL (image_data), as
+    before; pass include_data=false to skip it when the client already has it.
+    Images that decode to more than the server keeps (IMAGE_CACHE_MAX_BYTES)
+    are rejected with 413, since their ID could not be used.
+
+    For PDFs only the requested page is rendered, at the requested DPI. The
+    response also carries a document_id for rendering other pages.
+    """
+    check_upload_size(file)
+
+    async with worker_slot():
+        return await run_blocking(_read_upload, file.file, file.content_type, include_data, page, dpi)
+
+
+@router.post("/api/pdf/{document_id}/pages/{page}")
+async def render_page(
+    document_id: str,
+    page: int,
+    include_data: bool = True,
+    dpi: int = Query(PDF_DEFAULT_DPI, ge=PDF_MIN_DPI, le=PDF_MAX_DPI)
+):
+    """Render another page of an uploaded PDF and return its image ID, size and data (see upload_image)"""
+    async with worker_slot():
+        return await run_blocking(_read_stored_pdf_page, document_id, page, dpi, include_data)
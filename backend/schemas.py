@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 
 class CropArea(BaseModel):
@@ -10,12 +10,18 @@ class CropArea(BaseModel):
 
 
 class ExtractionSettings(BaseModel):
+    denoise: str = "auto"  # "none", "bilateral", "median", "nlmeans" (on a downscaled copy), "nlmeans_full" (full resolution) or "auto"
     min_area_percent: float = 0.1  # Minimum polygon area as % of image
     simplify_tolerance: float = 2.0  # Douglas-Peucker simplification
+    segmentation: str = "auto"  # "kmeans", "palette" (exact flat colors, e.g. CAD exports) or "auto" (palette when a few colors cover the image)
     color_clusters: int = 32  # Number of color clusters for segmentation
+    kmeans_sample_size: int = 100_000  # Pixels sampled to fit the palette (0 = all pixels)
+    kmeans_attempts: int = 3  # k-means restarts on the sample
     morph_kernel_size: int = 3  # Morphological operations kernel
     fill_holes: bool = True
     smooth_contours: bool = True
+    tiled: Optional[bool] = None  # Tiled, memory-bounded pipeline (None = automatic for very large images)
+    tile_size: int = 2048  # Tile edge in pixels for the tiled pipeline
 
 
 class GeoreferencePoint(BaseModel):
@@ -33,25 +39,51 @@ class BoundingBox(BaseModel):
 
 
 class ProcessRequest(BaseModel):
-    image_data: str  # Base64 encoded image
+    image_id: Optional[str] = None  # ID returned by /api/upload
+    image_data: Optional[str] = None  # Base64 encoded image (if no image_id)
     crop: Optional[CropArea] = None
     settings: ExtractionSettings = ExtractionSettings()
     control_points: Optional[List[GeoreferencePoint]] = None
     bounding_box: Optional[BoundingBox] = None
+    output_format: str = "geojson"  # "geojson" (FeatureCollection) or "ndjson" (one Feature per line, then a {"metadata": ...} line)
+    coordinate_precision: Optional[int] = None  # Decimal places of georeferenced coordinates (None = full)
 
 
-class MagicWandRequest(BaseModel):
-    image_data: str  # Base64 encoded image
-    click_x: int  # X coordinate of click
-    click_y: int  # Y coordinate of click
+class MagicWandOptions(BaseModel):
+    image_id: Optional[str] = None  # ID returned by /api/upload
+    image_data: Optional[str] = None  # Base64 encoded image (if no image_id)
     use_boundary_mode: bool = True  # True = boundary color mode, False = tolerance mode
     boundary_color: List[int] = [152, 152, 152]  # RGB boundary color (default #989898)
     boundary_tolerance: int = 15  # How close to boundary color to be considered boundary
+    boundary_metric: str = "rgb"  # "rgb" (RGB distance) or "lab" (CIE76 delta E, boundary_tolerance = max delta E)
     tolerance: int = 32  # Color tolerance for non-boundary mode
     simplify_tolerance: float = 2.0  # Douglas-Peucker simplification
     ocr_engine: str = "ai"  # "ai" or "tesseract"
     ai_model: str = "google/gemini-2.0-flash-001"  # AI model to use when ocr_engine is "ai"
     existing_polygons: Optional[List[List[List[List[float]]]]] = None  # Existing polygon coords
+    use_session_polygons: bool = False  # Check overlap against the polygons registered for image_id
+    session_id: Optional[str] = None  # Client session owning the session polygons (required with use_session_polygons)
+
+
+class MagicWandRequest(MagicWandOptions):
+    click_x: int  # X coordinate of click
+    click_y: int  # Y coordinate of click
+    unit_id: Optional[str] = None  # Register the new polygon under this ID (session polygons)
+
+
+class MagicWandSeed(BaseModel):
+    click_x: int
+    click_y: int
+    unit_id: Optional[str] = None
+
+
+class MagicWandBatchRequest(MagicWandOptions):
+    seeds: List[MagicWandSeed]
+
+
+class AutoDigitizeRequest(MagicWandOptions):
+    min_area: int = 100  # Minimum unit area in pixels
+    skip_border: bool = True  # Skip regions touching the image edge (the area around the sheet)
 
 
 class MagicWandResponse(BaseModel):
@@ -63,3 +95,20 @@ class MagicWandResponse(BaseModel):
     ocr_confidence: float = 0.0
     area: float = 0.0
     error: Optional[str] = None
+    duplicate_of: Optional[int] = None  # Batch only: index of the seed that selected the same region
+    unit_index: Optional[int] = None  # Auto-digitize only: index of the unit in sheet (raster) order
+
+
+class SessionPolygon(BaseModel):
+    coordinates: List[List[List[float]]]  # GeoJSON polygon coords
+
+
+class SessionPolygons(BaseModel):
+    polygons: Dict[str, List[List[List[float]]]]  # Unit ID -> GeoJSON polygon coords
+
+
+class ExportRequest(BaseModel):
+    features: List[Dict[str, Any]]  # GeoJSON Features (Polygon or MultiPolygon geometries)
+    group_by: Optional[str] = "collection"  # TopoJSON: property that splits features into objects (None = one object)
+    quantization: int = 100_000  # TopoJSON: quantization grid size (0 = keep full coordinates)
+    precision: Optional[int] = None  # Geobuf: decimal places kept (None = detected from the input, up to 6)
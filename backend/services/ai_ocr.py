@@ -0,0 +1,237 @@
+"""
+Async AI vision OCR client - batches region crops into shared model requests
+"""
+
+import asyncio
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.cache import LRUCache
+
+try:
+    from openai import AsyncOpenAI
+    OPENAI_SDK_AVAILABLE = True
+except ImportError:
+    AsyncOpenAI = None  # type: ignore
+    OPENAI_SDK_AVAILABLE = False
+
+SINGLE_PROMPT = (
+    "Extract the building label or code from this image. Return ONLY the text/label, "
+    "nothing else. If there's no readable text, return an empty string. "
+    "Do not add quotes or explanation."
+)
+
+BATCH_PROMPT = (
+    "You will receive {count} images, each showing one map unit. For each image, extract "
+    "the building label or code. Return ONLY a JSON array of {count} strings, one per "
+    "image in the order given. Use an empty string for an image with no readable text. "
+    "Do not add explanation."
+)
+
+# AI models don't provide confidence, so non-empty results get a fixed score
+AI_CONFIDENCE = 95.0
+
+
+def clean_label(text: str) -> Tuple[str, float]:
+    """Normalize a model's answer into (text, confidence)."""
+    # Clean up common artifacts
+    text = (text or "").strip().strip('"\'')
+    if text.lower() in ['', 'none', 'n/a', 'empty', 'no text']:
+        return "", 0.0
+    return text, AI_CONFIDENCE
+
+
+class _Pending:
+    __slots__ = ("key", "image_b64", "future")
+
+    def __init__(self, key: tuple, image_b64: str, future: "asyncio.Future[Tuple[str, float]]"):
+        self.key = key
+        self.image_b64 = image_b64
+        self.future = future
+
+
+class AIOCRClient:
+    """
+    OCR client for OpenAI-compatible vision models (OpenRouter by default).
+
+    Crops submitted within batch_window seconds of each other are sent to the
+    model as one request (up to batch_size images). At most max_concurrency
+    requests are in flight. Requests that time out or fail resolve to an empty
+    result so callers can fall back to Tesseract. Results are cached by crop
+    hash and model, and identical in-flight crops share one request.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        max_concurrency: int = 4,
+        batch_size: int = 8,
+        batch_window: float = 0.025,
+        timeout: float = 20.0,
+        max_retries: int = 2,
+        cache_size: int = 4096
+    ):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._cache = LRUCache(cache_size, sizeof=lambda _: 1)
+
+        # Created on the client's event loop
+        self._client: Optional[Any] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._queues: Dict[str, List[_Pending]] = {}
+        self._flush_handles: Dict[str, asyncio.TimerHandle] = {}
+        self._in_flight: Dict[tuple, "asyncio.Future[Tuple[str, float]]"] = {}
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    def cached(self, crop_hash: str, model: str) -> Optional[Tuple[str, float]]:
+        return self._cache.get((crop_hash, model))
+
+    def recognize_threadsafe(self, crop_hash: str, image_b64: str, model: str) -> "Future[Tuple[str, float]]":
+        """Submit a crop from any thread; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(
+            self.recognize(crop_hash, image_b64, model), self._get_loop()
+        )
+
+    async def recognize(self, crop_hash: str, image_b64: str, model: str) -> Tuple[str, float]:
+        """Recognize the label in one PNG crop (base64). Must run on the client's loop."""
+        key = (crop_hash, model)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            return await asyncio.shield(in_flight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        queue = self._queues.setdefault(model, [])
+        queue.append(_Pending(key, image_b64, future))
+
+        if len(queue) >= self.batch_size:
+            self._schedule_flush(model, delay=None)
+        elif model not in self._flush_handles:
+            self._schedule_flush(model, delay=self.batch_window)
+
+        return await asyncio.shield(future)
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """Event loop on a background thread that owns all client state."""
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="ai-ocr", daemon=True)
+                thread.start()
+                self._loop = loop
+            return self._loop
+
+    def _schedule_flush(self, model: str, delay: Optional[float]) -> None:
+        loop = asyncio.get_running_loop()
+        handle = self._flush_handles.pop(model, None)
+        if handle is not None:
+            handle.cancel()
+
+        if delay is None:
+            loop.create_task(self._flush(model))
+        else:
+            self._flush_handles[model] = loop.call_later(
+                delay, lambda: loop.create_task(self._flush(model))
+            )
+
+    async def _flush(self, model: str) -> None:
+        self._flush_handles.pop(model, None)
+        queue = self._queues.get(model, [])
+        batch, self._queues[model] = queue[:self.batch_size], queue[self.batch_size:]
+        if self._queues[model]:
+            self._schedule_flush(model, delay=None)
+        if not batch:
+            return
+
+        try:
+            results = await self._recognize_batch(model, batch)
+            cacheable = True
+        except Exception as e:
+            print(f"AI OCR error: {e!r}")
+            results = [("", 0.0)] * len(batch)
+            cacheable = False
+
+        for pending, result in zip(batch, results):
+            self._in_flight.pop(pending.key, None)
+            if cacheable:
+                self._cache.put(pending.key, result)
+            if not pending.future.done():
+                pending.future.set_result(result)
+
+    async def _recognize_batch(self, model: str, batch: List[_Pending]) -> List[Tuple[str, float]]:
+        if len(batch) == 1:
+            answer = await self._complete(model, SINGLE_PROMPT, [batch[0].image_b64], max_tokens=50)
+            return [clean_label(answer)]
+
+        answer = await self._complete(
+            model,
+            BATCH_PROMPT.format(count=len(batch)),
+            [pending.image_b64 for pending in batch],
+            max_tokens=50 * len(batch)
+        )
+        labels = _parse_label_list(answer, len(batch))
+        if labels is not None:
+            return [clean_label(label) for label in labels]
+
+        # The model didn't follow the batch format - ask for each crop separately
+        return list(await asyncio.gather(*(self._recognize_batch(model, [p]) for p in batch)))
+
+    async def _complete(self, model: str, prompt: str, images_b64: List[str], max_tokens: int) -> str:
+        if self._client is None:
+            self._client = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key=self.api_key,
+                timeout=self.timeout,
+                max_retries=self.max_retries,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        content: List[dict] = [{"type": "text", "text": prompt}]
+        for image_b64 in images_b64:
+            content.append({
+                "type": "image_url",
+                "image_url": {"url": f"data:image/png;base64,{image_b64}"}
+            })
+
+        async with self._semaphore:
+            response = await asyncio.wait_for(
+                self._client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": content}],
+                    max_tokens=max_tokens,
+                    temperature=0,
+                ),
+                # Covers the SDK's own retries
+                timeout=self.timeout * (self.max_retries + 1)
+            )
+
+        return response.choices[0].message.content or ""
+
+
+def _parse_label_list(answer: str, count: int) -> Optional[List[str]]:
+    """Parse a JSON array of labels, tolerating a surrounding code fence."""
+    text = answer.strip()
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end <= start:
+        return None
+    try:
+        labels = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(labels, list) or len(labels) != count:
+        return None
+    return [label if isinstance(label, str) else str(label) for label in labels]
@@ -0,0 +1,34 @@
+"""
+Cache of boundary-mode component label maps, per image and boundary settings
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+from core.config import IMAGE_CACHE_TTL_SECONDS, LABEL_CACHE_MAX_BYTES
+from magic_wand import BoundaryLabels, compute_boundary_labels
+from services.cache import LRUCache
+
+_labels = LRUCache(
+    LABEL_CACHE_MAX_BYTES,
+    IMAGE_CACHE_TTL_SECONDS,
+    sizeof=lambda value: value.labels.nbytes + value.stats.nbytes
+)
+
+
+def get_boundary_labels(
+    image_id: str,
+    image: np.ndarray,
+    boundary_color: Tuple[int, int, int],
+    boundary_tolerance: int,
+    boundary_metric: str = "rgb"
+) -> BoundaryLabels:
+    """Return the cached label map for an image, computing it on first use."""
+    key = (image_id, tuple(int(c) for c in boundary_color), int(boundary_tolerance), boundary_metric)
+
+    # Concurrent clicks on a new image label it only once
+    labels, _ = _labels.get_or_compute(
+        key, lambda: compute_boundary_labels(image, boundary_color, boundary_tolerance, boundary_metric)
+    )
+    return labels
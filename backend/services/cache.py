@@ -0,0 +1,177 @@
+"""
+In-process LRU cache bounded by total size in bytes, with TTL eviction
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+_MISSING = object()
+
+
+def _default_sizeof(value: Any) -> int:
+    return int(getattr(value, "nbytes", 0)) or 1
+
+
+class _KeyLock:
+    __slots__ = ("lock", "users", "value")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0  # Threads holding or waiting for the lock
+        self.value: Any = _MISSING  # Result shared with the threads waiting for it
+
+
+class KeyedLocks:
+    """
+    One lock per key, so concurrent callers do the work for a key only once.
+
+    A key's lock is dropped when no thread holds or waits for it anymore.
+    """
+
+    def __init__(self):
+        self._locks: Dict[Hashable, _KeyLock] = {}
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, key: Hashable) -> Iterator[_KeyLock]:
+        with self._guard:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = _KeyLock()
+            entry.users += 1
+
+        try:
+            with entry.lock:
+                yield entry
+        finally:
+            with self._guard:
+                entry.users -= 1
+                if not entry.users:
+                    del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache.
+
+    Entries are evicted when the summed size of all values exceeds max_bytes,
+    or when an entry has not been accessed for ttl_seconds.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: Optional[float] = None,
+        sizeof: Callable[[Any], int] = _default_sizeof
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._sizeof = sizeof
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._computing = KeyedLocks()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            value, size, last_access = entry
+            now = time.monotonic()
+            if self._is_expired(last_access, now):
+                self._remove(key)
+                return default
+
+            self._entries[key] = (value, size, now)
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None) -> bool:
+        """Store value under key. Returns False if it is too large to cache."""
+        size = self._sizeof(value) if size is None else size
+        if size > self.max_bytes:
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (value, size, time.monotonic())
+            self._total_bytes += size
+            self._evict()
+            return True
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Return the value cached under key, computing and caching it on a miss.
+
+        Concurrent calls for the same key compute it once; the others wait and
+        share its result, even if it is too large to cache. Returns (value,
+        True unless this call computed it).
+        """
+        value = self.get(key)
+        if value is not None:
+            return value, True
+
+        with self._computing.hold(key) as computing:
+            value = self.get(key)
+            if value is not None:
+                return value, True
+            if computing.value is not _MISSING:
+                return computing.value, True
+
+            value = compute()
+            self.put(key, value)
+            computing.value = value
+            return value, False
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._entries:
+                return default
+            value = self._entries[key][0]
+            self._remove(key)
+            return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def _is_expired(self, last_access: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - last_access > self.ttl_seconds
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+
+        # Oldest entries come first, so expired ones are at the front
+        while self._entries:
+            key, (_, _, last_access) = next(iter(self._entries.items()))
+            if not self._is_expired(last_access, now):
+                break
+            self._remove(key)
+
+        while self._total_bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
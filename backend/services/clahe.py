@@ -0,0 +1,136 @@
+"""
+OpenCV-exact CLAHE for 8-bit planes too large to equalize in one piece
+"""
+
+from typing import Callable, Iterator, Tuple
+
+import cv2
+import numpy as np
+
+HIST_SIZE = 256
+
+
+def _runs(values: np.ndarray) -> Iterator[Tuple[int, int]]:
+    """(start, stop) of each run of equal values"""
+    bounds = np.concatenate([[0], np.flatnonzero(np.diff(values)) + 1, [len(values)]])
+    return zip(bounds[:-1].tolist(), bounds[1:].tolist())
+
+
+def _interpolation(count: int, start: int, cell: int, cells: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Grid cells on either side of positions start..start + count along one
+    axis, and the weight of the second one, in float32 as OpenCV computes them.
+    """
+    position = np.arange(start, start + count, dtype=np.float32) * (np.float32(1) / np.float32(cell)) - np.float32(0.5)
+    first = np.floor(position).astype(np.int64)
+    weight = position - first.astype(np.float32)
+    return np.maximum(first, 0), np.minimum(first + 1, cells - 1), weight
+
+
+class TiledCLAHE:
+    """
+    cv2.createCLAHE(clip_limit, grid).apply() on a plane seen one block at a time.
+
+    Feed every block of the plane to add() and the plane's bottom and right
+    edges to add_border(), then equalize blocks with apply(). Only the grid's
+    histograms are kept between calls, and the result is identical to
+    OpenCV's.
+    """
+
+    def __init__(self, height: int, width: int, clip_limit: float, grid: Tuple[int, int]):
+        self.height, self.width = height, width
+        self.clip_limit = clip_limit
+        self.grid_x, self.grid_y = grid
+
+        # Like OpenCV: a plane that doesn't divide into the grid is extended
+        # on the bottom and right, on both sides even if one divides
+        if width % self.grid_x == 0 and height % self.grid_y == 0:
+            self.pad_x = self.pad_y = 0
+        else:
+            self.pad_x = self.grid_x - width % self.grid_x
+            self.pad_y = self.grid_y - height % self.grid_y
+        self.cell_height = (height + self.pad_y) // self.grid_y
+        self.cell_width = (width + self.pad_x) // self.grid_x
+
+        self._histograms = np.zeros((self.grid_y, self.grid_x, HIST_SIZE), dtype=np.int64)
+        self._luts = None
+
+    def add(self, block: np.ndarray, y0: int, x0: int) -> None:
+        """Count the pixels of a block at (y0, x0) of the (extended) plane into their grid cells"""
+        h, w = block.shape
+        for cell_y in range(y0 // self.cell_height, (y0 + h - 1) // self.cell_height + 1):
+            rows = slice(max(0, cell_y * self.cell_height - y0), min(h, (cell_y + 1) * self.cell_height - y0))
+            for cell_x in range(x0 // self.cell_width, (x0 + w - 1) // self.cell_width + 1):
+                cols = slice(max(0, cell_x * self.cell_width - x0), min(w, (cell_x + 1) * self.cell_width - x0))
+                self._histograms[cell_y, cell_x] += np.bincount(block[rows, cols].ravel(), minlength=HIST_SIZE)
+
+    def add_border(self, read: Callable[[slice, slice], np.ndarray]) -> None:
+        """
+        Count the reflected border that extends the plane to the grid.
+
+        read(rows, cols) returns that part of the plane; only strips along the
+        bottom and right edges are read.
+        """
+        if self.pad_y:
+            rows = slice(max(0, self.height - self.pad_y - 1), self.height)
+            strip = read(rows, slice(0, self.width))
+            extended = cv2.copyMakeBorder(strip, 0, self.pad_y, 0, self.pad_x, cv2.BORDER_REFLECT_101)
+            self.add(extended[len(strip):], self.height, 0)
+        if self.pad_x:
+            cols = slice(max(0, self.width - self.pad_x - 1), self.width)
+            strip = read(slice(0, self.height), cols)
+            extended = cv2.copyMakeBorder(strip, 0, 0, 0, self.pad_x, cv2.BORDER_REFLECT_101)
+            self.add(extended[:, strip.shape[1]:], 0, self.width)
+
+    def apply(self, block: np.ndarray, y0: int, x0: int) -> np.ndarray:
+        """Equalize a block at (y0, x0) of the plane, once every block has been added"""
+        if self._luts is None:
+            self._luts = self._compute_luts()
+
+        h, w = block.shape
+        top, bottom, y_weight = _interpolation(h, y0, self.cell_height, self.grid_y)
+        left, right, x_weight = _interpolation(w, x0, self.cell_width, self.grid_x)
+        y_weight, x_weight = y_weight[:, None], x_weight[None, :]
+
+        result = np.empty_like(block)
+        # Each run of rows (columns) lies between the same two cell centers
+        for row_start, row_stop in _runs(top * self.grid_y + bottom):
+            for col_start, col_stop in _runs(left * self.grid_x + right):
+                window = (slice(row_start, row_stop), slice(col_start, col_stop))
+                wy, wx = y_weight[row_start:row_stop], x_weight[:, col_start:col_stop]
+                # (lut(top, left) * (1 - wx) + lut(top, right) * wx) * (1 - wy)
+                #   + (lut(bottom, left) * (1 - wx) + lut(bottom, right) * wx) * wy,
+                # in the same order and float32 precision as OpenCV
+                value = None
+                for cell_y, row_weight in ((top[row_start], 1 - wy), (bottom[row_start], wy)):
+                    row = self._lookup(block[window], cell_y, left[col_start]) * (1 - wx)
+                    row += self._lookup(block[window], cell_y, right[col_start]) * wx
+                    row *= row_weight
+                    if value is None:
+                        value = row
+                    else:
+                        value += row
+                result[window] = np.rint(value, out=value)
+        return result
+
+    def _lookup(self, block: np.ndarray, cell_y: int, cell_x: int) -> np.ndarray:
+        return cv2.LUT(block, self._luts[cell_y, cell_x]).astype(np.float32)
+
+    def _compute_luts(self) -> np.ndarray:
+        """Clip and redistribute each cell's histogram, then map its cumulative sum to 0-255"""
+        cell_pixels = self.cell_height * self.cell_width
+        histograms = self._histograms.reshape(-1, HIST_SIZE).copy()
+
+        if self.clip_limit > 0:
+            limit = max(int(self.clip_limit * cell_pixels / HIST_SIZE), 1)
+            clipped = np.maximum(histograms - limit, 0).sum(axis=1)
+            np.minimum(histograms, limit, out=histograms)
+            histograms += (clipped // HIST_SIZE)[:, None]
+            # The remainder goes one count each to evenly spaced bins from 0
+            for histogram, residual in zip(histograms, (clipped % HIST_SIZE).tolist()):
+                if residual:
+                    histogram[::max(HIST_SIZE // residual, 1)][:residual] += 1
+
+        scale = np.float32(HIST_SIZE - 1) / np.float32(cell_pixels)
+        luts = np.clip(np.rint(np.cumsum(histograms, axis=1).astype(np.float32) * scale), 0, 255)
+        return luts.astype(np.uint8).reshape(self.grid_y, self.grid_x, HIST_SIZE)
@@ -0,0 +1,162 @@
+"""
+Polygon extraction pipeline behind /api/process
+"""
+
+from typing import Iterator, List, Optional, Union
+
+import numpy as np
+
+from core.config import TILED_PROCESSING_MIN_PIXELS
+from schemas import ProcessRequest
+from services.image_processing import (
+    denoise_image,
+    enhance_contrast,
+    resolve_denoise_mode,
+    resolve_segmentation_mode,
+    segment_by_color,
+    segment_by_palette,
+    extract_all_raw_contours,
+    filter_contours,
+    contour_to_polygon,
+)
+from services.geojson_stream import FEATURES_PER_CHUNK
+from services.georeference import assign_zone_ids, contour_centroids, transform_coordinates
+from services.pipeline_cache import artifact_keys, cached_artifact
+from services.tiling import extract_raw_contours_tiled
+from services.timing import StageTimings
+
+
+def extract_features(img: np.ndarray, request: ProcessRequest, image_id: Optional[str] = None) -> dict:
+    """Crop, segment and vectorize an image into a GeoJSON FeatureCollection (see extract_feature_chunks)."""
+    features: List[dict] = []
+    for item in extract_feature_chunks(img, request, image_id):
+        if isinstance(item, dict):
+            metadata = item
+        else:
+            features.extend(item)
+    return {"type": "FeatureCollection", "features": features, "metadata": metadata}
+
+
+def extract_feature_chunks(
+    img: np.ndarray,
+    request: ProcessRequest,
+    image_id: Optional[str] = None,
+    chunk_size: int = FEATURES_PER_CHUNK
+) -> Iterator[Union[List[dict], dict]]:
+    """
+    Crop, segment and vectorize an image into GeoJSON Features.
+
+    Yields lists of up to chunk_size Features as they are georeferenced, then
+    the collection's metadata dict as the last item. Zone IDs are numbered
+    over all polygons, so the first chunk comes after contour extraction.
+    Per-stage durations are reported in metadata.timings_ms.
+
+    With an image_id, the preprocessed image, label map and raw contours are
+    cached in the running process (see pipeline_cache), each keyed by the
+    settings it depends on; a request that only changes later settings reuses
+    them. Reused stages are listed in metadata.cached_stages. Run it on a
+    thread, not in a worker process, or the cache is never shared.
+    """
+    timings = StageTimings()
+    original_height, original_width = img.shape[:2]
+
+    if request.crop:
+        crop = request.crop
+        img = img[
+            crop.y: crop.y + crop.height,
+            crop.x: crop.x + crop.width
+        ]
+
+    img_height, img_width = img.shape[:2]
+    img_area = img_width * img_height
+
+    settings = request.settings
+    tiled = settings.tiled
+    if tiled is None:
+        tiled = img_area > TILED_PROCESSING_MIN_PIXELS
+
+    with timings.stage("noise_estimate"):
+        denoise = resolve_denoise_mode(img, settings.denoise)
+    with timings.stage("palette_check"):
+        segmentation = resolve_segmentation_mode(img, settings)
+
+    keys = artifact_keys(image_id, request.crop, settings, denoise, segmentation, tiled) if image_id else {}
+    cached_stages = []
+
+    def cached(stage, compute):
+        value, hit = cached_artifact(keys.get(stage), compute)
+        if hit:
+            cached_stages.append(stage)
+        return value
+
+    def preprocess():
+        with timings.stage("denoise"):
+            denoised = denoise_image(img, denoise)
+        if segmentation == "palette":
+            # Local contrast equalization would split each flat color
+            return denoised
+        with timings.stage("contrast"):
+            return enhance_contrast(denoised)
+
+    def segment():
+        processed = cached("preprocessed", preprocess)
+        with timings.stage("segmentation"):
+            if segmentation == "palette":
+                return segment_by_palette(processed, settings.kmeans_sample_size)
+            return segment_by_color(
+                processed,
+                settings.color_clusters,
+                settings.kmeans_sample_size,
+                settings.kmeans_attempts
+            )
+
+    def extract_contours():
+        if tiled:
+            tile_settings = settings.model_copy(update={"denoise": denoise, "segmentation": segmentation})
+            return extract_raw_contours_tiled(img, tile_settings, settings.tile_size, timings)
+
+        labels = cached("labels", segment)
+        with timings.stage("contours"):
+            return extract_all_raw_contours(labels, settings)
+
+    raw_contours = cached("contours", extract_contours)
+    with timings.stage("filter"):
+        contours = filter_contours(raw_contours, settings, img_area)
+
+    with timings.stage("polygons"):
+        all_polygons = []
+        kept_contours = []
+        for contour in contours:
+            poly = contour_to_polygon(contour)
+            if poly:
+                all_polygons.append({"geometry": poly})
+                kept_contours.append(contour)
+
+    with timings.stage("georeference"):
+        features = assign_zone_ids(all_polygons, contour_centroids(kept_contours))
+
+    for start in range(0, len(features), chunk_size):
+        with timings.stage("georeference"):
+            chunk = transform_coordinates(
+                features[start:start + chunk_size],
+                img_width,
+                img_height,
+                request.control_points,
+                request.bounding_box,
+                request.coordinate_precision
+            )
+        yield chunk
+
+    yield {
+        "image_width": img_width,
+        "image_height": img_height,
+        "original_width": original_width,
+        "original_height": original_height,
+        "tiled": tiled,
+        "denoise": denoise,
+        "segmentation": segmentation,
+        "cached_stages": cached_stages,
+        "georeferenced": bool(request.control_points or request.bounding_box),
+        "coordinate_system": "EPSG:4326" if (request.control_points or request.bounding_box) else "pixel",
+        "timings_ms": timings.as_ms()
+    }
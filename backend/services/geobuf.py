@@ -0,0 +1,227 @@
+"""
+Geobuf encoder - compact protobuf encoding of GeoJSON (https://github.com/mapbox/geobuf)
+
+Hand-written writer for the geobuf.proto v1 messages used here: a
+FeatureCollection of Polygon / MultiPolygon features with properties.
+Coordinates are delta-encoded and varint-packed for all features at once.
+"""
+
+import math
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import orjson
+
+from services.geojson_stream import FEATURES_PER_CHUNK
+from services.georeference import flatten_rings, geometry_polygons
+
+# Geometry.Type
+POLYGON = 4
+MULTIPOLYGON = 5
+
+MAX_PRECISION = 6
+
+# Protobuf wire types
+_VARINT = 0
+_FIXED64 = 1
+_LENGTH_DELIMITED = 2
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _tag(field: int, wire_type: int) -> bytes:
+    return _varint((field << 3) | wire_type)
+
+
+def _field_bytes(field: int, payload: bytes) -> bytes:
+    return _tag(field, _LENGTH_DELIMITED) + _varint(len(payload)) + payload
+
+
+def _varints(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Varint-encode unsigned 64-bit values; returns the bytes and per-value byte counts."""
+    values = values.astype(np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        sizes += rest > 0
+        rest >>= np.uint64(7)
+
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    offsets = np.cumsum(sizes) - sizes
+    rest = values.copy()
+    for position in range(int(sizes.max()) if len(sizes) else 0):
+        active = np.flatnonzero(sizes > position)
+        continued = (sizes[active] > position + 1).astype(np.uint8) << 7
+        out[offsets[active] + position] = (rest[active] & np.uint64(0x7F)).astype(np.uint8) | continued
+        rest[active] >>= np.uint64(7)
+    return out, sizes
+
+
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _packed(field: int, values: List[int]) -> bytes:
+    if not values:
+        return b""
+    return _field_bytes(field, b"".join(_varint(value) for value in values))
+
+
+def _detect_precision(coords: np.ndarray) -> int:
+    """Fewest decimal places (up to MAX_PRECISION) that represent every coordinate exactly"""
+    sample = coords.reshape(-1)
+    for precision in range(MAX_PRECISION):
+        scale = 10.0 ** precision
+        if np.array_equal(np.round(sample * scale) / scale, sample):
+            return precision
+    return MAX_PRECISION
+
+
+def _value(value: Any) -> bytes:
+    """Encode a Data.Value message"""
+    if isinstance(value, bool):
+        payload = _tag(5, _VARINT) + _varint(int(value))
+    elif isinstance(value, str):
+        payload = _field_bytes(1, value.encode())
+    elif isinstance(value, int):
+        payload = _tag(3 if value >= 0 else 4, _VARINT) + _varint(abs(value))
+    elif isinstance(value, float) and math.isfinite(value) and not value.is_integer():
+        payload = _tag(2, _FIXED64) + np.float64(value).tobytes()
+    elif isinstance(value, float) and math.isfinite(value):
+        payload = _tag(3 if value >= 0 else 4, _VARINT) + _varint(abs(int(value)))
+    else:
+        payload = _field_bytes(6, orjson.dumps(value))
+    return payload
+
+
+def _lengths(geometry: dict) -> Optional[List[int]]:
+    """Geometry.lengths for a polygon geometry (None when it can be omitted)"""
+    if geometry["type"] == "MultiPolygon":
+        polygons = geometry["coordinates"]
+        if len(polygons) == 1 and len(polygons[0]) == 1:
+            return None
+        lengths = [len(polygons)]
+        for polygon in polygons:
+            lengths.append(len(polygon))
+            lengths.extend(len(ring) - 1 for ring in polygon)
+        return lengths
+
+    rings = geometry["coordinates"]
+    if len(rings) == 1:
+        return None
+    return [len(ring) - 1 for ring in rings]
+
+
+def _field_size(payload_size: int) -> int:
+    """Size of a length-delimited field numbered below 16 with a payload of payload_size bytes"""
+    return 1 + len(_varint(payload_size)) + payload_size
+
+
+def _feature_parts(feature: dict, keys: Dict[str, int]) -> Tuple[bytes, bytes]:
+    """
+    The Geometry fields written before its coordinates, and the Feature
+    fields written after its geometry (id and properties).
+    """
+    geometry = feature["geometry"]
+    head = _tag(1, _VARINT) + _varint(MULTIPOLYGON if geometry["type"] == "MultiPolygon" else POLYGON)
+    ring_lengths = _lengths(geometry)
+    if ring_lengths is not None:
+        head += _packed(2, ring_lengths)
+
+    tail = b""
+    feature_id = feature.get("id")
+    if isinstance(feature_id, str):
+        tail += _field_bytes(11, feature_id.encode())
+    elif isinstance(feature_id, int) and not isinstance(feature_id, bool):
+        tail += _tag(12, _VARINT) + _varint(int(_zigzag(np.array([feature_id]))[0]))
+
+    properties = feature.get("properties") or {}
+    pairs = []
+    for value_index, (key, value) in enumerate(properties.items()):
+        tail += _field_bytes(13, _value(value))
+        pairs.extend((keys[key], value_index))
+    tail += _packed(14, pairs)
+    return head, tail
+
+
+def _feature_message(head: bytes, coord_bytes: bytes, tail: bytes) -> bytes:
+    geometry_message = head + (_field_bytes(3, coord_bytes) if coord_bytes else b"")
+    return _field_bytes(1, _field_bytes(1, geometry_message) + tail)
+
+
+def encode_geobuf(
+    features: List[dict],
+    precision: Optional[int] = None,
+    chunk_size: int = FEATURES_PER_CHUNK
+) -> Iterator[bytes]:
+    """
+    Encode Polygon / MultiPolygon features as a Geobuf FeatureCollection.
+
+    precision is the number of decimal places kept (None = the fewest that
+    represent the input exactly, up to 6). Yields the message in chunks: the
+    header and property keys, then chunk_size features at a time, each chunk
+    encoded only when it is requested.
+    """
+    coords, lengths = flatten_rings(features)
+    if precision is None:
+        precision = _detect_precision(coords) if len(coords) else 0
+    scale = 10.0 ** precision
+
+    # Rings are written without their closing point, deltas restarting per ring
+    starts = np.cumsum(lengths) - lengths
+    keep = np.ones(len(coords), dtype=bool)
+    keep[(starts + lengths - 1)[lengths > 0]] = False
+    ring_of_vertex = np.repeat(np.arange(len(lengths)), lengths)[keep]
+    points = np.round(coords[keep] * scale).astype(np.int64)
+
+    deltas = points.copy()
+    deltas[1:] -= points[:-1]
+    first = np.ones(len(points), dtype=bool)
+    first[1:] = ring_of_vertex[1:] != ring_of_vertex[:-1]
+    deltas[first] = points[first]
+
+    encoded, sizes = _varints(_zigzag(deltas.reshape(-1)))
+    byte_offsets = np.concatenate([[0], np.cumsum(sizes)])
+
+    # Vertices (after dropping closing points) per feature
+    ring_counts = [
+        sum(len(polygon) for polygon in geometry_polygons(feature["geometry"])) for feature in features
+    ]
+    ring_vertices = np.bincount(ring_of_vertex, minlength=len(lengths)) if len(lengths) else np.zeros(0, np.int64)
+    ring_bounds = np.concatenate([[0], np.cumsum(ring_counts)]).astype(np.int64)
+    vertex_bounds = np.concatenate([[0], np.cumsum(ring_vertices)]).astype(np.int64)
+    feature_bytes = byte_offsets[2 * vertex_bounds[ring_bounds]].tolist()
+
+    keys: Dict[str, int] = {}
+    for feature in features:
+        for key in (feature.get("properties") or {}):
+            keys.setdefault(key, len(keys))
+
+    # The collection is length-prefixed, so every feature's size is needed
+    # up front; it follows from the small fields and the coordinate byte count
+    parts = [_feature_parts(feature, keys) for feature in features]
+    collection_size = 0
+    for index, (head, tail) in enumerate(parts):
+        coord_size = feature_bytes[index + 1] - feature_bytes[index]
+        geometry_size = len(head) + (_field_size(coord_size) if coord_size else 0)
+        collection_size += _field_size(_field_size(geometry_size) + len(tail))
+
+    header = b"".join(_field_bytes(1, key.encode()) for key in keys)
+    # Written even when it is the proto2 default, for proto3-generated decoders
+    header += _tag(3, _VARINT) + _varint(precision)
+    yield header + _tag(4, _LENGTH_DELIMITED) + _varint(collection_size)
+
+    for chunk_start in range(0, len(features), chunk_size):
+        chunk_stop = min(chunk_start + chunk_size, len(features))
+        yield b"".join(
+            _feature_message(head, encoded[feature_bytes[index]:feature_bytes[index + 1]].tobytes(), tail)
+            for index, (head, tail) in enumerate(parts[chunk_start:chunk_stop], chunk_start)
+        )
@@ -0,0 +1,50 @@
+"""
+Chunked GeoJSON serialization for /api/process responses
+"""
+
+from typing import Iterable, Iterator, List, Union
+
+import orjson
+
+OUTPUT_FORMATS = ("geojson", "ndjson")
+
+# Features serialized per chunk of the response body
+FEATURES_PER_CHUNK = 500
+
+_OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+
+
+def iter_feature_collection(result: dict, chunk_size: int = FEATURES_PER_CHUNK) -> Iterator[bytes]:
+    """
+    Serialize a FeatureCollection in chunks of features.
+
+    The collection's other members (type, metadata) are written first, then
+    the features array, so the whole document is never encoded at once.
+    """
+    header = {key: value for key, value in result.items() if key != "features"}
+    yield orjson.dumps(header, option=_OPTIONS)[:-1] + b',"features":['
+
+    features: List[dict] = result["features"]
+    for start in range(0, len(features), chunk_size):
+        chunk = orjson.dumps(features[start:start + chunk_size], option=_OPTIONS)[1:-1]
+        yield chunk if start == 0 else b"," + chunk
+
+    yield b"]}"
+
+
+def iter_feature_lines(items: Iterable[Union[List[dict], dict]]) -> Iterator[bytes]:
+    """
+    Serialize extraction output as newline-delimited GeoJSON, as it is produced.
+
+    items are lists of Features followed by the collection's metadata dict
+    (see extract_feature_chunks). Each Feature is one line; the metadata is
+    the last line, as {"metadata": {...}}.
+    """
+    for item in items:
+        if isinstance(item, dict):
+            yield orjson.dumps({"metadata": item}, option=_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        else:
+            yield b"".join(
+                orjson.dumps(feature, option=_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+                for feature in item
+            )
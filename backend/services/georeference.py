@@ -1,3 +1,4 @@
+from itertools import chain
 from typing import List, Optional, Tuple
 import cv2
 import numpy as np
@@ -5,74 +6,195 @@ import numpy as np
 from schemas import BoundingBox, GeoreferencePoint
 
 
+def geometry_polygons(geometry: dict) -> List[list]:
+    """Coordinate lists (rings) of each polygon in a Polygon or MultiPolygon"""
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    return [geometry["coordinates"]]
+
+
+def flatten_rings(features: List[dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Gather the vertices of every ring of every feature into one array.
+
+    Returns:
+        Tuple of (N x 2 float64 vertices, vertex count of each ring), with rings
+        in feature, polygon, ring order
+    """
+    rings = [
+        ring
+        for feature in features
+        for polygon in geometry_polygons(feature["geometry"])
+        for ring in polygon
+    ]
+    lengths = np.fromiter((len(ring) for ring in rings), dtype=np.int64, count=len(rings))
+    values = chain.from_iterable(chain.from_iterable(rings))
+    coords = np.fromiter(values, dtype=np.float64, count=2 * int(lengths.sum())).reshape(-1, 2)
+    return coords, lengths
+
+
+def _ring_kinds(features: List[dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """Owning feature index and exterior flag of each ring, in flatten_rings order"""
+    polygon_counts = np.array([len(geometry_polygons(feature["geometry"])) for feature in features], dtype=np.int64)
+    ring_counts = np.array([
+        len(polygon) for feature in features for polygon in geometry_polygons(feature["geometry"])
+    ], dtype=np.int64)
+
+    polygon_owners = np.repeat(np.arange(len(features)), polygon_counts)
+    owners = np.repeat(polygon_owners, ring_counts)
+    exteriors = np.zeros(int(ring_counts.sum()), dtype=bool)
+    exteriors[(np.cumsum(ring_counts) - ring_counts)[ring_counts > 0]] = True
+    return owners, exteriors
+
+
+def _ring_centroids(
+    coords: np.ndarray,
+    lengths: np.ndarray,
+    owners: np.ndarray,
+    exteriors: np.ndarray,
+    count: int
+) -> np.ndarray:
+    """Area centroids of count features from a flat vertex buffer (see compute_centroids)"""
+    centroids = np.zeros((count, 2), dtype=np.float64)
+    keep = lengths > 0
+    owners, exteriors, lengths = owners[keep], exteriors[keep], lengths[keep]
+    if not len(lengths):
+        return centroids
+
+    starts = np.cumsum(lengths) - lengths
+    ring_of_vertex = np.repeat(np.arange(len(lengths)), lengths)
+
+    # Each vertex pairs with the next one in its ring, wrapping at the ring's end
+    following = np.arange(1, len(coords) + 1)
+    following[starts + lengths - 1] = starts
+    x, y = coords[:, 0], coords[:, 1]
+    x_next, y_next = x[following], y[following]
+    cross = x * y_next - x_next * y
+
+    area2 = np.add.reduceat(cross, starts)  # Twice the signed ring area
+    moment_x = np.add.reduceat((x + x_next) * cross, starts)
+    moment_y = np.add.reduceat((y + y_next) * cross, starts)
+
+    # Exteriors add, holes subtract, whatever each ring's winding
+    sign = np.sign(area2) * np.where(exteriors, 1.0, -1.0)
+    feature_area2 = np.bincount(owners, weights=area2 * sign, minlength=count)
+    feature_mx = np.bincount(owners, weights=moment_x * sign, minlength=count)
+    feature_my = np.bincount(owners, weights=moment_y * sign, minlength=count)
+
+    vertex_owner = owners[ring_of_vertex]
+    vertex_count = np.maximum(np.bincount(vertex_owner, minlength=count), 1)
+    mean_x = np.bincount(vertex_owner, weights=x, minlength=count) / vertex_count
+    mean_y = np.bincount(vertex_owner, weights=y, minlength=count) / vertex_count
+
+    has_area = np.abs(feature_area2) > 1e-12
+    safe_area = np.where(has_area, feature_area2, 1.0)
+    centroids[:, 0] = np.where(has_area, feature_mx / (3 * safe_area), mean_x)
+    centroids[:, 1] = np.where(has_area, feature_my / (3 * safe_area), mean_y)
+    return centroids
+
+
+def compute_centroids(features: List[dict]) -> np.ndarray:
+    """
+    Area centroids (N x 2) of polygon features, in one vectorized pass.
+
+    Uses the shoelace area and first moments of every ring over a flat
+    vertex buffer; holes are subtracted from their polygon. Unlike the mean
+    of the vertices, the result doesn't depend on how the outline was
+    simplified. Features with zero area fall back to their vertex mean.
+    """
+    coords, lengths = flatten_rings(features)
+    owners, exteriors = _ring_kinds(features)
+    return _ring_centroids(coords, lengths, owners, exteriors, len(features))
+
+
+def contour_centroids(contours: List[np.ndarray]) -> np.ndarray:
+    """Area centroids (N x 2) of OpenCV contours, without going through coordinate lists"""
+    lengths = np.array([len(contour) for contour in contours], dtype=np.int64)
+    if not len(contours):
+        return np.zeros((0, 2), dtype=np.float64)
+
+    coords = np.concatenate([contour.reshape(-1, 2) for contour in contours]).astype(np.float64)
+    owners = np.arange(len(contours))
+    return _ring_centroids(coords, lengths, owners, np.ones(len(contours), dtype=bool), len(contours))
+
+
 def compute_centroid(coords: List[List[float]]) -> Tuple[float, float]:
-    """Compute centroid of polygon coordinates"""
-    ring = coords[0] if coords and coords[0] else []
-    if not ring:
+    """Compute the area centroid of polygon coordinates"""
+    if not coords or not coords[0]:
         return (0.0, 0.0)
 
-    x_sum = sum(p[0] for p in ring[:-1])
-    y_sum = sum(p[1] for p in ring[:-1])
-    n = len(ring) - 1
+    x, y = compute_centroids([{"geometry": {"type": "Polygon", "coordinates": coords}}])[0]
+    return (float(x), float(y))
 
-    return (x_sum / n, y_sum / n) if n > 0 else (0.0, 0.0)
 
-
-def assign_zone_ids(polygons: List[dict]) -> List[dict]:
+def assign_zone_ids(polygons: List[dict], centroids: Optional[np.ndarray] = None) -> List[dict]:
     """
     Assign deterministic zone IDs based on centroid position.
     Sort by Y (top to bottom), then X (left to right).
-    """
-    polygon_data = []
-    for poly in polygons:
-        centroid = compute_centroid(poly["geometry"]["coordinates"])
-        polygon_data.append({
-            "polygon": poly,
-            "centroid_x": centroid[0],
-            "centroid_y": centroid[1]
-        })
 
-    polygon_data.sort(key=lambda p: (p["centroid_y"], p["centroid_x"]))
+    Centroids are area centroids (see compute_centroids). Pass precomputed
+    centroids (e.g. from contour_centroids) to skip computing them from the
+    coordinate lists.
+    """
+    if centroids is None:
+        centroids = compute_centroids(polygons)
+    # Stable, like the sort it replaces, so exact ties keep their input order
+    order = np.lexsort((centroids[:, 0], centroids[:, 1]))
 
     result = []
-    for i, data in enumerate(polygon_data, start=1):
+    for i, index in enumerate(order, start=1):
         zone_id = f"ZONE_{i:04d}"
         feature = {
             "type": "Feature",
             "properties": {"zone_id": zone_id},
-            "geometry": data["polygon"]["geometry"]
+            "geometry": polygons[index]["geometry"]
         }
         result.append(feature)
 
     return result
 
 
+def _unflatten_rings(features: List[dict], coords: np.ndarray, lengths: np.ndarray) -> None:
+    """Write flattened vertices back into the features' rings (inverse of flatten_rings)"""
+    rings = iter(np.split(coords, np.cumsum(lengths)[:-1]) if len(lengths) else [])
+    for feature in features:
+        geometry = feature["geometry"]
+        polygons = [[next(rings).tolist() for _ in polygon] for polygon in geometry_polygons(geometry)]
+        geometry["coordinates"] = polygons if geometry["type"] == "MultiPolygon" else polygons[0]
+
+
+def _apply_homography(coords: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    projected = coords @ matrix[:, :2].T + matrix[:, 2]
+    return projected[:, :2] / projected[:, 2:3]
+
+
+def _round(coords: np.ndarray, precision: Optional[int]) -> np.ndarray:
+    return coords if precision is None else np.round(coords, precision)
+
+
 def transform_coordinates(
     features: List[dict],
     img_width: int,
     img_height: int,
     control_points: Optional[List[GeoreferencePoint]] = None,
-    bounding_box: Optional[BoundingBox] = None
+    bounding_box: Optional[BoundingBox] = None,
+    precision: Optional[int] = None
 ) -> List[dict]:
-    """Transform pixel coordinates to geographic coordinates"""
+    """
+    Transform pixel coordinates to geographic coordinates.
 
+    All vertices of all rings (holes included) are transformed in one array
+    operation, in float64, and rounded to precision decimal places if given.
+    """
     if bounding_box:
-        for feature in features:
-            coords = feature["geometry"]["coordinates"][0]
-            transformed = []
-            for point in coords:
-                norm_x = point[0] / img_width
-                norm_y = point[1] / img_height
-
-                lng = bounding_box.top_left_lng + norm_x * (
-                    bounding_box.bottom_right_lng - bounding_box.top_left_lng
-                )
-                lat = bounding_box.top_left_lat + norm_y * (
-                    bounding_box.bottom_right_lat - bounding_box.top_left_lat
-                )
-                transformed.append([lng, lat])
-
-            feature["geometry"]["coordinates"] = [transformed]
+        coords, lengths = flatten_rings(features)
+        origin = np.array([bounding_box.top_left_lng, bounding_box.top_left_lat])
+        extent = np.array([
+            bounding_box.bottom_right_lng - bounding_box.top_left_lng,
+            bounding_box.bottom_right_lat - bounding_box.top_left_lat
+        ])
+        coords = origin + coords / np.array([img_width, img_height]) * extent
+        _unflatten_rings(features, _round(coords, precision), lengths)
 
     elif control_points and len(control_points) >= 4:
         src_points = np.array([
@@ -84,23 +206,10 @@ def transform_coordinates(
 
         if len(control_points) == 4:
             matrix = cv2.getPerspectiveTransform(src_points[:4], dst_points[:4])
-
-            for feature in features:
-                coords = feature["geometry"]["coordinates"][0]
-                points = np.array([[p] for p in coords], dtype=np.float32)
-                transformed = cv2.perspectiveTransform(points, matrix)
-                feature["geometry"]["coordinates"] = [
-                    [[float(p[0][0]), float(p[0][1])] for p in transformed]
-                ]
         else:
             matrix, _ = cv2.findHomography(src_points, dst_points)
 
-            for feature in features:
-                coords = feature["geometry"]["coordinates"][0]
-                points = np.array([[p] for p in coords], dtype=np.float32)
-                transformed = cv2.perspectiveTransform(points, matrix)
-                feature["geometry"]["coordinates"] = [
-                    [[float(p[0][0]), float(p[0][1])] for p in transformed]
-                ]
+        coords, lengths = flatten_rings(features)
+        _unflatten_rings(features, _round(_apply_homography(coords, matrix), precision), lengths)
 
     return features
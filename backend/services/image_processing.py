@@ -1,4 +1,5 @@
-from typing import List, Optional
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import BinaryIO, Dict, List, Optional, Tuple
 import base64
 import io
 
@@ -7,17 +8,19 @@ import numpy as np
 from PIL import Image
 from scipy import ndimage
 
+from core.config import EXTRACTION_MAX_WINDOW_BYTES, EXTRACTION_WORKERS
 from schemas import ExtractionSettings
 
+# Per-label contour extraction; OpenCV releases the GIL
+_extraction_pool = ThreadPoolExecutor(max_workers=EXTRACTION_WORKERS, thread_name_prefix="extract")
 
-def decode_image(base64_data: str) -> np.ndarray:
-    """Decode base64 image to OpenCV format"""
-    if "," in base64_data:
-        base64_data = base64_data.split(",")[1]
+# Bytes per pixel a label window holds while it is extracted: the label test,
+# the mask and the morphology buffers
+WINDOW_BYTES_PER_PIXEL = 4
 
-    image_bytes = base64.b64decode(base64_data)
-    image = Image.open(io.BytesIO(image_bytes))
 
+def pil_to_bgr(image: Image.Image) -> np.ndarray:
+    """Convert a PIL image to OpenCV BGR format"""
     if image.mode == "RGBA":
         # Convert RGBA to RGB with white background
         background = Image.new("RGB", image.size, (255, 255, 255))
@@ -29,52 +32,351 @@ def decode_image(base64_data: str) -> np.ndarray:
     return cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
 
 
-def preprocess_image(img: np.ndarray) -> np.ndarray:
-    """Preprocess image: denoise and improve contrast"""
-    denoised = cv2.fastNlMeansDenoisingColored(img, None, 10, 10, 7, 21)
-    lab = cv2.cvtColor(denoised, cv2.COLOR_BGR2LAB)
+def decode_image_file(file: BinaryIO) -> np.ndarray:
+    """Decode an encoded image file object (PNG, JPEG, ...) to OpenCV format"""
+    return pil_to_bgr(Image.open(file))
+
+
+def decode_image_bytes(image_bytes: bytes) -> np.ndarray:
+    """Decode encoded image bytes (PNG, JPEG, ...) to OpenCV format"""
+    return decode_image_file(io.BytesIO(image_bytes))
+
+
+def decode_base64(base64_data: str) -> bytes:
+    """Decode base64 data, with or without a data: URL prefix"""
+    if "," in base64_data:
+        base64_data = base64_data.split(",")[1]
+
+    return base64.b64decode(base64_data)
+
+
+def decode_image(base64_data: str) -> np.ndarray:
+    """Decode base64 image to OpenCV format"""
+    return decode_image_bytes(decode_base64(base64_data))
+
+
+DENOISE_MODES = ("none", "bilateral", "median", "nlmeans", "nlmeans_full", "auto")
+
+# Noise levels (estimated sigma, 0-255) separating the automatic denoise choices
+AUTO_DENOISE_CLEAN_SIGMA = 1.0
+AUTO_DENOISE_HEAVY_SIGMA = 4.0
+# NL-means runs on a copy downscaled by this factor (a quarter of the pixels)
+NLMEANS_SCALE = 0.5
+
+
+def estimate_noise(img: np.ndarray, max_side: int = 1024) -> float:
+    """
+    Estimate the Gaussian noise sigma of an image (0-255 scale).
+
+    Uses a robust (median) version of Immerkaer's Laplacian-difference
+    estimator on a central crop, so flat colors with sharp lines - typical
+    of rendered plans - score close to 0.
+    """
+    h, w = img.shape[:2]
+    y0, x0 = max(0, (h - max_side) // 2), max(0, (w - max_side) // 2)
+    gray = cv2.cvtColor(img[y0:y0 + max_side, x0:x0 + max_side], cv2.COLOR_BGR2GRAY)
+
+    kernel = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+    response = cv2.filter2D(gray.astype(np.float32), -1, kernel)[1:-1, 1:-1]
+    # 6 = L2 norm of the kernel; 1.4826 turns a median absolute deviation into sigma
+    return float(1.4826 * np.median(np.abs(response)) / 6.0)
+
+
+def resolve_denoise_mode(img: np.ndarray, mode: str) -> str:
+    """Map "auto" to a concrete denoise mode from a quick noise estimate"""
+    if mode not in DENOISE_MODES:
+        raise ValueError(f"Unknown denoise mode: {mode}")
+    if mode != "auto":
+        return mode
+
+    sigma = estimate_noise(img)
+    if sigma < AUTO_DENOISE_CLEAN_SIGMA:
+        return "none"
+    if sigma < AUTO_DENOISE_HEAVY_SIGMA:
+        return "bilateral"
+    return "nlmeans"
+
+
+def denoise_image(img: np.ndarray, mode: str = "nlmeans") -> np.ndarray:
+    """Denoise an image with one of DENOISE_MODES"""
+    mode = resolve_denoise_mode(img, mode)
+
+    if mode == "none":
+        return img
+    if mode == "bilateral":
+        return cv2.bilateralFilter(img, 7, 40, 7)
+    if mode == "median":
+        return cv2.medianBlur(img, 3)
+    if mode == "nlmeans_full":
+        return cv2.fastNlMeansDenoisingColored(img, None, 10, 10, 7, 21)
+
+    # NL-means on a downscaled copy, upscaled back
+    h, w = img.shape[:2]
+    small_size = (max(1, round(w * NLMEANS_SCALE)), max(1, round(h * NLMEANS_SCALE)))
+    small = cv2.resize(img, small_size, interpolation=cv2.INTER_AREA)
+    denoised = cv2.fastNlMeansDenoisingColored(small, None, 10, 10, 7, 21)
+    return cv2.resize(denoised, (w, h), interpolation=cv2.INTER_LINEAR)
+
+
+# CLAHE applied to the LAB lightness channel by enhance_contrast
+CLAHE_CLIP_LIMIT = 2.0
+CLAHE_GRID = (8, 8)  # Cells across, down
+
+
+def contrast_equalizer() -> cv2.CLAHE:
+    """CLAHE applied to the LAB lightness channel by enhance_contrast"""
+    return cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_GRID)
+
+
+def enhance_contrast(img: np.ndarray) -> np.ndarray:
+    """Equalize lightness with CLAHE"""
+    lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
     l, a, b = cv2.split(lab)
 
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    l = clahe.apply(l)
+    l = contrast_equalizer().apply(l)
 
     enhanced = cv2.merge([l, a, b])
     return cv2.cvtColor(enhanced, cv2.COLOR_LAB2BGR)
 
 
-def segment_by_color(img: np.ndarray, n_clusters: int = 32) -> np.ndarray:
-    """Segment image by color using k-means clustering"""
+def preprocess_image(img: np.ndarray, denoise: str = "nlmeans_full") -> np.ndarray:
+    """
+    Preprocess image: denoise and improve contrast.
+
+    Defaults to the original full-resolution NL-means; pass
+    ExtractionSettings.denoise to use the configured stage instead.
+    """
+    return enhance_contrast(denoise_image(img, denoise))
+
+
+def segment_by_color(
+    img: np.ndarray,
+    n_clusters: int = 32,
+    sample_size: int = 100_000,
+    attempts: int = 3
+) -> np.ndarray:
+    """
+    Segment image by color using k-means clustering.
+
+    The palette is fitted on a random sample of sample_size pixels (0 = all
+    pixels), then every pixel is assigned to its nearest center in chunks.
+    """
     lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-    pixels = lab.reshape(-1, 3).astype(np.float32)
+    pixels = lab.reshape(-1, 3)
+
+    centers = fit_palette(sample_pixels(lab, sample_size), n_clusters, attempts)
+    return assign_to_centers(pixels, centers).reshape(img.shape[:2])
+
+
+SEGMENTATION_MODES = ("kmeans", "palette", "auto")
+
+# Exact-palette segmentation: at most this many dominant colors, each covering
+# at least PALETTE_MIN_SHARE of the sampled pixels
+PALETTE_MAX_COLORS = 256
+PALETTE_MIN_SHARE = 0.0005
+# "auto" picks the palette when its dominant colors cover this share of the sample
+PALETTE_MIN_COVERAGE = 0.95
+# Pixels packed and looked up per chunk
+PALETTE_CHUNK_PIXELS = 1 << 20
+
+
+def sample_index(pixel_count: int, sample_size: int) -> np.ndarray:
+    """Flat indices of a random pixel sample, in draw order (0 = all pixels, in order)"""
+    if not 0 < sample_size < pixel_count:
+        return np.arange(pixel_count)
+
+    rng = np.random.default_rng(0)
+    return rng.choice(pixel_count, sample_size, replace=False)
+
+
+def sample_pixels(img: np.ndarray, sample_size: int) -> np.ndarray:
+    """Random pixels (N x 3) of an image, drawn without copying the image (0 = all pixels)"""
+    h, w = img.shape[:2]
+    if not 0 < sample_size < h * w:
+        return img.reshape(-1, img.shape[2])
+
+    index = sample_index(h * w, sample_size)
+    return img[index // w, index % w]
+
+
+def pack_colors(pixels: np.ndarray) -> np.ndarray:
+    """Pack uint8 pixels (N x 3) into int32 color codes, c0 << 16 | c1 << 8 | c2"""
+    packed = pixels[:, 0].astype(np.int32) << 16
+    packed |= pixels[:, 1].astype(np.int32) << 8
+    packed |= pixels[:, 2]
+    return packed
+
+
+def unpack_colors(packed: np.ndarray) -> np.ndarray:
+    """Inverse of pack_colors"""
+    return np.stack([packed >> 16, (packed >> 8) & 0xFF, packed & 0xFF], axis=1).astype(np.uint8)
+
+
+def dominant_colors(
+    sample: np.ndarray,
+    max_colors: int = PALETTE_MAX_COLORS,
+    min_share: float = PALETTE_MIN_SHARE
+) -> Tuple[np.ndarray, float]:
+    """
+    Most frequent exact colors of a pixel sample.
+
+    Returns the colors (K x 3 uint8, most frequent first; at least one) and
+    the share of the sample they cover.
+    """
+    colors, counts = np.unique(pack_colors(sample), return_counts=True)
+    order = np.argsort(counts, kind="stable")[::-1][:max_colors]
+    dominant = order[counts[order] >= min_share * len(sample)]
+    if not len(dominant):
+        dominant = order[:1]
+    return unpack_colors(colors[dominant]), float(counts[dominant].sum() / len(sample))
+
+
+def resolve_segmentation_mode(img: np.ndarray, settings: ExtractionSettings) -> str:
+    """Map "auto" to "palette" when a few exact colors cover the image, else "kmeans"."""
+    mode = settings.segmentation
+    if mode not in SEGMENTATION_MODES:
+        raise ValueError(f"Unknown segmentation mode: {mode}")
+    if mode != "auto":
+        return mode
+
+    _, coverage = dominant_colors(sample_pixels(img, settings.kmeans_sample_size))
+    return "palette" if coverage >= PALETTE_MIN_COVERAGE else "kmeans"
+
+
+def palette_lut(present: np.ndarray, palette: np.ndarray) -> np.ndarray:
+    """
+    Label lookup table over packed BGR colors (see pack_colors).
+
+    present flags the packed colors that occur (1 << 24 bools). Each of them
+    is mapped to its nearest palette color in LAB, so anti-aliasing fringe
+    joins a neighbouring flat color; palette colors map to themselves.
+    """
+    colors = np.flatnonzero(present).astype(np.int32)
+    to_lab = lambda bgr: cv2.cvtColor(bgr.reshape(-1, 1, 3), cv2.COLOR_BGR2LAB).reshape(-1, 3)
+
+    lut = np.zeros(1 << 24, dtype=np.int16)
+    lut[colors] = assign_to_centers(to_lab(unpack_colors(colors)), to_lab(palette))
+    lut[pack_colors(palette)] = np.arange(len(palette))
+    return lut
+
+
+def mark_colors(present: np.ndarray, pixels: np.ndarray, chunk_size: int = PALETTE_CHUNK_PIXELS) -> None:
+    """Flag the packed colors of pixels (N x 3 uint8) in present, in chunks"""
+    for start in range(0, len(pixels), chunk_size):
+        present[pack_colors(pixels[start:start + chunk_size])] = True
+
+
+def label_with_lut(pixels: np.ndarray, lut: np.ndarray, chunk_size: int = PALETTE_CHUNK_PIXELS) -> np.ndarray:
+    """Label pixels (N x 3 uint8) through a palette_lut(), in chunks"""
+    labels = np.empty(len(pixels), dtype=np.int32)
+    for start in range(0, len(pixels), chunk_size):
+        labels[start:start + chunk_size] = lut[pack_colors(pixels[start:start + chunk_size])]
+    return labels
+
+
+def segment_by_palette(img: np.ndarray, sample_size: int = 100_000) -> np.ndarray:
+    """
+    Segment an image with flat colors (e.g. a CAD export) by its exact palette.
+
+    The dominant colors of a pixel sample become the palette, every color
+    present is mapped to its nearest palette color once, and pixels are then
+    labelled by table lookup - linear in the number of pixels, no k-means.
+    """
+    palette, _ = dominant_colors(sample_pixels(img, sample_size))
+
+    pixels = img.reshape(-1, 3)
+    present = np.zeros(1 << 24, dtype=bool)
+    mark_colors(present, pixels)
+    return label_with_lut(pixels, palette_lut(present, palette)).reshape(img.shape[:2])
+
+
+def fit_palette(sample: np.ndarray, n_clusters: int = 32, attempts: int = 3) -> np.ndarray:
+    """Fit k-means color centers (n_clusters x 3, float32) to sampled pixels"""
+    sample = sample.astype(np.float32)
+    n_clusters = min(n_clusters, len(sample))
 
     criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.2)
-    _, labels, _ = cv2.kmeans(
-        pixels, n_clusters, None, criteria, 10, cv2.KMEANS_PP_CENTERS
+    cv2.setRNGSeed(0)
+    _, _, centers = cv2.kmeans(
+        sample, n_clusters, None, criteria, max(1, attempts), cv2.KMEANS_PP_CENTERS
     )
+    return centers
+
+
+def assign_to_centers(
+    pixels: np.ndarray,
+    centers: np.ndarray,
+    chunk_size: int = 262_144
+) -> np.ndarray:
+    """Label each pixel (N x 3) with the index of its nearest center, in chunks."""
+    centers = centers.astype(np.float32)
+    center_norms = np.sum(centers ** 2, axis=1)
+    labels = np.empty(len(pixels), dtype=np.int32)
+
+    for start in range(0, len(pixels), chunk_size):
+        chunk = pixels[start:start + chunk_size].astype(np.float32)
+        # |p - c|^2 without the |p|^2 term, which doesn't change the argmin
+        distances = center_norms - 2 * (chunk @ centers.T)
+        labels[start:start + chunk_size] = np.argmin(distances, axis=1)
 
-    return labels.reshape(img.shape[:2])
+    return labels
 
 
 def extract_region_contours(
     labels: np.ndarray,
     label_id: int,
     settings: ExtractionSettings,
-    img_area: int
+    img_area: int,
+    window: Optional[Tuple[slice, slice]] = None
+) -> List[np.ndarray]:
+    """
+    Extract contours for a specific label/color region.
+
+    If window (row slice, column slice) is given, only that part of the label
+    image is processed; contours are still returned in full-image coordinates.
+    """
+    return filter_contours(raw_region_contours(labels, label_id, settings, window), settings, img_area)
+
+
+def raw_region_contours(
+    labels: np.ndarray,
+    label_id: int,
+    settings: ExtractionSettings,
+    window: Optional[Tuple[slice, slice]] = None
 ) -> List[np.ndarray]:
-    """Extract contours for a specific label/color region"""
-    mask = (labels == label_id).astype(np.uint8) * 255
+    """Outer contours of a label region, before area filtering and simplification"""
+    if window is None:
+        window = (slice(0, labels.shape[0]), slice(0, labels.shape[1]))
+    offset = (window[1].start, window[0].start)
+
+    mask = region_mask(labels[window], label_id, settings)
+
+    contours, _ = cv2.findContours(
+        mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=offset
+    )
+    return list(contours)
+
+
+def region_mask(labels: np.ndarray, label_id: int, settings: ExtractionSettings) -> np.ndarray:
+    """Binary mask of one label, cleaned up with morphological operations"""
+    mask = (labels == label_id).view(np.uint8)
+    mask *= 255
 
     kernel = np.ones((settings.morph_kernel_size, settings.morph_kernel_size), np.uint8)
     mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
     mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
 
-    if settings.fill_holes:
-        mask = ndimage.binary_fill_holes(mask).astype(np.uint8) * 255
+    # settings.fill_holes needs no work here: only outer contours are
+    # extracted (RETR_EXTERNAL), and filling holes never changes those
+    return mask
 
-    contours, _ = cv2.findContours(
-        mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-    )
 
+def filter_contours(
+    contours: List[np.ndarray],
+    settings: ExtractionSettings,
+    img_area: int
+) -> List[np.ndarray]:
+    """Drop contours below the minimum area and simplify the rest"""
     min_area = img_area * (settings.min_area_percent / 100)
     valid_contours = []
 
@@ -91,6 +393,71 @@ def extract_region_contours(
     return valid_contours
 
 
+def morphology_margin(settings: ExtractionSettings) -> int:
+    """
+    Padding around a crop so region_mask() gives the same result inside it as
+    on the full frame: room for the closing's dilation plus a kernel.
+    """
+    return 3 * settings.morph_kernel_size + 2
+
+
+def extract_all_region_contours(
+    labels: np.ndarray,
+    settings: ExtractionSettings,
+    img_area: int
+) -> List[np.ndarray]:
+    """Extract, filter and simplify the contours of every label"""
+    return filter_contours(extract_all_raw_contours(labels, settings), settings, img_area)
+
+
+def extract_all_raw_contours(
+    labels: np.ndarray,
+    settings: ExtractionSettings,
+    max_window_bytes: int = EXTRACTION_MAX_WINDOW_BYTES
+) -> List[np.ndarray]:
+    """
+    Extract the outer contours of every label, each inside its own bounding box.
+
+    Label bounding boxes come from a single pass over the label image. Each
+    label's mask and morphology are then computed on its padded bounding box
+    only, in parallel across labels. Results are ordered by label and are not
+    yet area-filtered or simplified (see filter_contours).
+
+    Windows are only started while the estimated memory of those in flight
+    stays within max_window_bytes (a larger window runs on its own), so peak
+    memory is bounded by the budget or one frame, not frame x workers.
+    """
+    h, w = labels.shape
+    pad = morphology_margin(settings)
+
+    windows = []
+    for index, found in enumerate(ndimage.find_objects(labels + 1)):
+        if found is None:
+            continue
+        rows, cols = found
+        windows.append((index, (
+            slice(max(0, rows.start - pad), min(h, rows.stop + pad)),
+            slice(max(0, cols.start - pad), min(w, cols.stop + pad)),
+        )))
+
+    futures = []
+    in_flight: Dict[Future, int] = {}
+    in_flight_bytes = 0
+    for index, (rows, cols) in windows:
+        cost = (rows.stop - rows.start) * (cols.stop - cols.start) * WINDOW_BYTES_PER_PIXEL
+        while in_flight and in_flight_bytes + cost > max_window_bytes:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                in_flight_bytes -= in_flight.pop(future)
+
+        future = _extraction_pool.submit(raw_region_contours, labels, index, settings, (rows, cols))
+        in_flight[future] = cost
+        in_flight_bytes += cost
+        futures.append(future)
+
+    return [contour for future in futures for contour in future.result()]
+
+
 def contour_to_polygon(contour: np.ndarray) -> Optional[dict]:
     """Convert OpenCV contour to GeoJSON-style polygon coordinates"""
     points = contour.squeeze()
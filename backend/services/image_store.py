@@ -0,0 +1,104 @@
+"""
+Decoded image store - keeps uploaded images in memory so requests can refer to them by ID
+"""
+
+import hashlib
+import io
+import uuid
+from typing import BinaryIO, Optional, Tuple
+
+import numpy as np
+
+from core.config import IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_TTL_SECONDS
+from services.cache import LRUCache
+from services.image_processing import decode_base64, decode_image_file
+
+_images = LRUCache(IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_TTL_SECONDS)
+
+_HASH_CHUNK_BYTES = 1024 * 1024
+
+
+class ImageNotFoundError(KeyError):
+    """Raised when an image ID is unknown or has been evicted."""
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when a decoded image does not fit in the image store."""
+
+
+def store_image(img: np.ndarray, image_id: Optional[str] = None) -> str:
+    """
+    Store a decoded BGR image and return its ID.
+
+    Stored arrays are shared between requests and must not be modified in place.
+    Raises ImageTooLargeError if the image is larger than IMAGE_CACHE_MAX_BYTES,
+    rather than returning an ID that would never resolve.
+    """
+    image_id = image_id or uuid.uuid4().hex
+    if not _images.put(image_id, img):
+        raise ImageTooLargeError(
+            f"Decoded image is {img.nbytes} bytes, more than the {IMAGE_CACHE_MAX_BYTES} bytes the server can keep"
+        )
+    return image_id
+
+
+def get_image(image_id: str) -> np.ndarray:
+    """Return a stored image, raising ImageNotFoundError if it is not cached."""
+    img = _images.get(image_id)
+    if img is None:
+        raise ImageNotFoundError(image_id)
+    return img
+
+
+def store_encoded_image(file: BinaryIO, must_store: bool = False) -> Tuple[str, np.ndarray]:
+    """
+    Decode an encoded image file (PNG, JPEG, ...) and store it under a hash of its bytes.
+
+    The original bytes are decoded once, straight from the file, and resending
+    the same file skips decoding. An image too large for the store is still
+    returned for one-off use, unless must_store is set (the caller hands the
+    ID out), in which case ImageTooLargeError is raised.
+
+    Returns:
+        Tuple of (image_id, BGR image)
+    """
+    file.seek(0)
+    digest = hashlib.sha1()
+    for chunk in iter(lambda: file.read(_HASH_CHUNK_BYTES), b""):
+        digest.update(chunk)
+
+    content_id = "sha1-" + digest.hexdigest()
+    img = _images.get(content_id)
+    if img is None:
+        file.seek(0)
+        img = decode_image_file(file)
+        try:
+            store_image(img, content_id)
+        except ImageTooLargeError:
+            if must_store:
+                raise
+
+    return content_id, img
+
+
+def load_image(
+    image_id: Optional[str] = None,
+    image_data: Optional[str] = None
+) -> Tuple[str, np.ndarray]:
+    """
+    Resolve a request's image, either by ID or from inline base64 data.
+
+    Inline images are keyed by a hash of their content, so resending the same
+    image skips decoding and yields a stable ID for the caches built on top of it.
+    The ID matches the one store_encoded_image gives the same file.
+
+    Returns:
+        Tuple of (image_id, BGR image)
+    """
+    if image_id:
+        return image_id, get_image(image_id)
+
+    if not image_data:
+        raise ValueError("Either image_id or image_data is required")
+
+    return store_encoded_image(io.BytesIO(decode_base64(image_data)))
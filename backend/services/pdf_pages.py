@@ -0,0 +1,179 @@
+"""
+Lazy PDF page rendering - documents and rendered pages are cached on disk
+"""
+
+import hashlib
+import os
+import shutil
+import uuid
+from typing import BinaryIO, Tuple
+
+import numpy as np
+
+from core.config import PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES
+from services.cache import KeyedLocks, LRUCache
+from services.image_processing import decode_image_file
+from services.image_store import ImageNotFoundError, get_image, store_image
+
+try:
+    from pdf2image import convert_from_path, pdfinfo_from_path
+    from pdf2image.exceptions import PDFInfoNotInstalledError, PDFPageCountError
+    PDF2IMAGE_AVAILABLE = True
+except ImportError:
+    PDF2IMAGE_AVAILABLE = False
+
+DOCUMENT_FILENAME = "document.pdf"
+_COPY_CHUNK_BYTES = 1024 * 1024
+
+_page_counts = LRUCache(4096, sizeof=lambda _: 1)
+
+# One lock per rendered page so concurrent requests render it only once
+_render_locks = KeyedLocks()
+
+
+class PDFRenderingUnavailable(RuntimeError):
+    """Raised when pdf2image or the poppler utilities are not installed."""
+
+
+class PDFDocumentNotFoundError(KeyError):
+    """Raised when a document ID is unknown or has been evicted from the disk cache."""
+
+
+def _require_pdf2image() -> None:
+    if not PDF2IMAGE_AVAILABLE:
+        raise PDFRenderingUnavailable("pdf2image is not installed")
+
+
+def _document_dir(document_id: str) -> str:
+    if not document_id.startswith("pdf-") or not document_id[4:].isalnum():
+        raise PDFDocumentNotFoundError(document_id)
+    return os.path.join(PDF_CACHE_DIR, document_id)
+
+
+def _document_path(document_id: str) -> str:
+    path = os.path.join(_document_dir(document_id), DOCUMENT_FILENAME)
+    if not os.path.exists(path):
+        raise PDFDocumentNotFoundError(document_id)
+    return path
+
+
+def store_pdf(file: BinaryIO) -> str:
+    """Copy a PDF into the disk cache under a hash of its bytes and return its document ID."""
+    file.seek(0)
+    digest = hashlib.sha1()
+    for chunk in iter(lambda: file.read(_COPY_CHUNK_BYTES), b""):
+        digest.update(chunk)
+    document_id = "pdf-" + digest.hexdigest()
+
+    directory = _document_dir(document_id)
+    path = os.path.join(directory, DOCUMENT_FILENAME)
+    if os.path.exists(path):
+        os.utime(path)
+    else:
+        os.makedirs(directory, exist_ok=True)
+        partial = f"{path}.{uuid.uuid4().hex}.partial"
+        file.seek(0)
+        with open(partial, "wb") as out:
+            shutil.copyfileobj(file, out, _COPY_CHUNK_BYTES)
+        os.replace(partial, path)
+        _prune_cache()
+
+    return document_id
+
+
+def pdf_page_count(document_id: str) -> int:
+    """Number of pages in a stored PDF, read with pdfinfo (no rendering)"""
+    _require_pdf2image()
+    count = _page_counts.get(document_id)
+    if count is None:
+        try:
+            count = int(pdfinfo_from_path(_document_path(document_id))["Pages"])
+        except PDFInfoNotInstalledError:
+            raise PDFRenderingUnavailable("poppler is not installed")
+        except PDFPageCountError as e:
+            raise ValueError(f"Unreadable PDF: {e}")
+        _page_counts.put(document_id, count)
+    return count
+
+
+def rendered_page_path(document_id: str, page: int, dpi: int) -> str:
+    """
+    Path of a page rendered to PNG at the given DPI, rendering it on first use.
+
+    Only the requested page is rasterized. poppler writes the PNG straight
+    into the cache, so the page is never re-encoded.
+    """
+    _require_pdf2image()
+    pages = pdf_page_count(document_id)
+    if not 1 <= page <= pages:
+        raise ValueError(f"Page {page} is out of range (document has {pages} pages)")
+
+    directory = _document_dir(document_id)
+    path = os.path.join(directory, f"page-{page}-{dpi}.png")
+
+    with _render_locks.hold((document_id, page, dpi)):
+        if os.path.exists(path):
+            os.utime(path)  # Keep recently used pages when pruning
+            return path
+
+        partial = f"page-{page}-{dpi}-{uuid.uuid4().hex}"
+        try:
+            rendered = convert_from_path(
+                _document_path(document_id),
+                dpi=dpi,
+                first_page=page,
+                last_page=page,
+                fmt="png",
+                output_folder=directory,
+                output_file=partial,
+                single_file=True,
+                paths_only=True
+            )
+        except PDFInfoNotInstalledError:
+            raise PDFRenderingUnavailable("poppler is not installed")
+        os.replace(rendered[0], path)
+
+    _prune_cache()
+    return path
+
+
+def render_pdf_page(document_id: str, page: int, dpi: int) -> Tuple[str, np.ndarray]:
+    """
+    Decode one page of a stored PDF into the image store.
+
+    Returns:
+        Tuple of (image_id, BGR image)
+    """
+    image_id = f"{document_id}-page-{page}-{dpi}"
+    try:
+        return image_id, get_image(image_id)
+    except ImageNotFoundError:
+        pass
+
+    with open(rendered_page_path(document_id, page, dpi), "rb") as file:
+        img = decode_image_file(file)
+    store_image(img, image_id)
+    return image_id, img
+
+
+def _prune_cache() -> None:
+    """Delete the least recently used files until the cache fits PDF_CACHE_MAX_BYTES."""
+    files = []
+    for root, _, names in os.walk(PDF_CACHE_DIR):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= PDF_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
@@ -0,0 +1,71 @@
+"""
+Cache of /api/process intermediates, each keyed by only the settings it depends on
+"""
+
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from core.config import IMAGE_CACHE_TTL_SECONDS, PIPELINE_CACHE_MAX_BYTES
+from schemas import CropArea, ExtractionSettings
+from services.cache import LRUCache
+
+# Rough per-object overhead of Python containers around arrays
+_OBJECT_BYTES = 64
+
+
+def _artifact_size(value: Any) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(_artifact_size(item) for item in value) + _OBJECT_BYTES * len(value)
+    return _OBJECT_BYTES
+
+
+_artifacts = LRUCache(PIPELINE_CACHE_MAX_BYTES, IMAGE_CACHE_TTL_SECONDS, sizeof=_artifact_size)
+
+
+def artifact_keys(
+    image_id: str,
+    crop: Optional[CropArea],
+    settings: ExtractionSettings,
+    denoise: str,
+    segmentation: str,
+    tiled: bool
+) -> Dict[str, Tuple]:
+    """
+    Cache keys of the pipeline stages for one request.
+
+    denoise and segmentation are the resolved modes, so "auto" shares entries
+    with the mode it picked. Settings only used after contour extraction (min_area_percent,
+    simplify_tolerance, smooth_contours) are in no key: changing them only
+    re-filters the cached raw contours.
+    """
+    source = (image_id, (crop.x, crop.y, crop.width, crop.height) if crop else None)
+    # Palette segmentation skips the contrast step
+    preprocessed = ("preprocessed",) + source + (denoise, segmentation == "palette")
+    if segmentation == "palette":
+        labels = ("labels",) + preprocessed[1:] + ("palette", settings.kmeans_sample_size)
+    else:
+        labels = ("labels",) + preprocessed[1:] + (
+            settings.color_clusters, settings.kmeans_sample_size, settings.kmeans_attempts
+        )
+    contours = ("contours",) + labels[1:] + (settings.morph_kernel_size,)
+    if tiled:
+        # Tiled runs keep no full-frame intermediates
+        return {"contours": contours + ("tiled", settings.tile_size)}
+    return {"preprocessed": preprocessed, "labels": labels, "contours": contours}
+
+
+def cached_artifact(key: Optional[Hashable], compute: Callable[[], Any]) -> Tuple[Any, bool]:
+    """
+    Return the artifact cached under key, computing and caching it on a miss.
+
+    Cached values are shared between requests and must not be modified.
+    Concurrent identical requests compute an artifact once. Returns (value,
+    True if it was not computed by this call). A None key disables caching.
+    """
+    if key is None:
+        return compute(), False
+
+    return _artifacts.get_or_compute(key, compute)
@@ -0,0 +1,53 @@
+"""
+Per-session, per-image spatial indexes of the unit polygons a client has already digitized
+"""
+
+import threading
+from typing import Optional, Tuple
+
+from core.config import IMAGE_CACHE_TTL_SECONDS, POLYGON_INDEX_CACHE_SIZE
+from magic_wand import PolygonIndex
+from schemas import MagicWandOptions
+from services.cache import LRUCache
+
+# Sized by count: every index weighs 1
+_indexes = LRUCache(POLYGON_INDEX_CACHE_SIZE, IMAGE_CACHE_TTL_SECONDS, sizeof=lambda _: 1)
+_create_lock = threading.Lock()
+
+
+def _session_key(session_id: str, image_id: str) -> Tuple[str, str]:
+    # Image IDs are content hashes shared by every client that uploads the
+    # same sheet, so indexes are also keyed by the client's session
+    if not session_id:
+        raise ValueError("session_id is required for session polygons")
+    return (session_id, image_id)
+
+
+def get_session_index(session_id: str, image_id: str) -> PolygonIndex:
+    """Return a session's polygon index for an image, creating an empty one on first use."""
+    key = _session_key(session_id, image_id)
+    index = _indexes.get(key)
+    if index is None:
+        with _create_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = PolygonIndex()
+                _indexes.put(key, index)
+    return index
+
+
+def replace_session_index(session_id: str, image_id: str, index: PolygonIndex) -> None:
+    _indexes.put(_session_key(session_id, image_id), index)
+
+
+def resolve_overlap_index(image_id: str, options: MagicWandOptions) -> Optional[PolygonIndex]:
+    """
+    Pick the polygons a new selection is checked against: the session's index
+    for the image if requested, otherwise an index over the request's
+    existing_polygons.
+    """
+    if options.use_session_polygons:
+        return get_session_index(options.session_id, image_id)
+    if options.existing_polygons:
+        return PolygonIndex(dict(enumerate(options.existing_polygons)))
+    return None
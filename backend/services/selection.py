@@ -0,0 +1,276 @@
+"""
+Magic wand selection pipeline: region selection, polygon extraction, overlap check and OCR
+"""
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import AUTO_DIGITIZE_IN_FLIGHT, MAGIC_WAND_BATCH_WORKERS
+from magic_wand import (
+    BoundaryLabels,
+    PolygonIndex,
+    check_overlap,
+    enclosed_components,
+    magic_wand_select,
+    mask_to_polygon,
+    pad_selection,
+    refine_mask,
+    select_label,
+    selection_contains,
+)
+from ocr_service import (
+    extract_text_from_polygon,
+    extract_text_with_gemini,
+    is_tesseract_available,
+    is_gemini_available,
+)
+from schemas import AutoDigitizeRequest, MagicWandOptions, MagicWandResponse, MagicWandSeed
+
+_batch_pool = ThreadPoolExecutor(
+    max_workers=MAGIC_WAND_BATCH_WORKERS, thread_name_prefix="magic-wand"
+)
+
+
+def select_region(
+    img: np.ndarray,
+    seed_x: int,
+    seed_y: int,
+    options: MagicWandOptions,
+    boundary_labels: Optional[BoundaryLabels] = None
+) -> Tuple[np.ndarray, dict]:
+    """Run the magic wand selection for one seed point; the mask is cropped to the bbox."""
+    return magic_wand_select(
+        img,
+        seed_x,
+        seed_y,
+        use_boundary_mode=options.use_boundary_mode,
+        boundary_color=tuple(options.boundary_color[:3]),
+        boundary_tolerance=options.boundary_tolerance,
+        tolerance=options.tolerance,
+        boundary_labels=boundary_labels,
+        boundary_metric=options.boundary_metric
+    )
+
+
+def build_response(
+    img: np.ndarray,
+    mask: np.ndarray,
+    bbox: dict,
+    options: MagicWandOptions,
+    overlap_index: Optional[PolygonIndex] = None,
+    unit_id: Optional[str] = None
+) -> MagicWandResponse:
+    """
+    Turn a selection mask into a polygon, check it for overlaps and OCR its label.
+
+    All mask work runs on the selection's padded bounding box, so the cost
+    scales with the size of the unit rather than the image.
+
+    If unit_id is given and the session polygons are in use, the new polygon is
+    added to overlap_index so later selections are checked against it.
+    """
+    if bbox.get("error") == "selection_too_large":
+        return MagicWandResponse(
+            success=False,
+            error="Selection too large - the boundary color may not be present in this area. Try adjusting the boundary color or tolerance."
+        )
+
+    padded_mask, mask_offset = pad_selection(mask, bbox, img.shape)
+    refined_mask = refine_mask(padded_mask)
+    result = mask_to_polygon(refined_mask, options.simplify_tolerance, mask_offset)
+
+    if result is None:
+        return MagicWandResponse(
+            success=False,
+            error="No valid region selected. Try adjusting tolerance or clicking elsewhere."
+        )
+
+    if overlap_index is not None and result["polygon"]:
+        new_ring = result["polygon"][0]
+        if check_overlap(new_ring, overlap_index):
+            return MagicWandResponse(
+                success=False,
+                error="This area overlaps with an existing selection. Please select a different area."
+            )
+        if unit_id and options.use_session_polygons:
+            overlap_index.add(unit_id, result["polygon"])
+
+    ocr_text = ""
+    ocr_confidence = 0.0
+
+    if bbox["width"] > 0 and bbox["height"] > 0:
+        polygon_coords = result["polygon"][0][:-1] if result["polygon"][0] else []
+
+        if options.ocr_engine == "ai" and is_gemini_available():
+            ocr_text, ocr_confidence = extract_text_with_gemini(
+                img, refined_mask, polygon_coords, model=options.ai_model
+            )
+        elif options.ocr_engine == "tesseract" and is_tesseract_available():
+            ocr_text, ocr_confidence = extract_text_from_polygon(
+                img, refined_mask, polygon_coords, mask_offset
+            )
+
+        if not ocr_text:
+            if options.ocr_engine == "ai" and is_tesseract_available():
+                ocr_text, ocr_confidence = extract_text_from_polygon(
+                    img, refined_mask, polygon_coords, mask_offset
+                )
+            elif options.ocr_engine == "tesseract" and is_gemini_available():
+                ocr_text, ocr_confidence = extract_text_with_gemini(
+                    img, refined_mask, polygon_coords, model=options.ai_model
+                )
+
+    return MagicWandResponse(
+        success=True,
+        polygon=result["polygon"],
+        centroid=result["centroid"],
+        bbox=bbox,
+        ocr_text=ocr_text,
+        ocr_confidence=ocr_confidence,
+        area=result["area"]
+    )
+
+
+def _duplicate_response(index: int) -> MagicWandResponse:
+    return MagicWandResponse(
+        success=False,
+        error=f"Same region as seed {index}",
+        duplicate_of=index
+    )
+
+
+def _select_seed(
+    img: np.ndarray,
+    seed: MagicWandSeed,
+    options: MagicWandOptions,
+    boundary_labels: Optional[BoundaryLabels]
+) -> Tuple[Optional[np.ndarray], dict, Optional[str]]:
+    try:
+        mask, bbox = select_region(img, seed.click_x, seed.click_y, options, boundary_labels)
+        return mask, bbox, None
+    except ValueError as e:
+        return None, {}, str(e)
+
+
+def select_batch(
+    img: np.ndarray,
+    seeds: List[MagicWandSeed],
+    options: MagicWandOptions,
+    boundary_labels: Optional[BoundaryLabels] = None,
+    overlap_index: Optional[PolygonIndex] = None
+) -> List[MagicWandResponse]:
+    """
+    Run the magic wand for many seed points on one image.
+
+    Seeds that fall into a region already selected by an earlier seed are
+    reported as duplicates instead of being processed again. Selection and
+    polygon/OCR work run in parallel across the batch worker pool.
+    """
+    responses: List[Optional[MagicWandResponse]] = [None] * len(seeds)
+    pending = list(range(len(seeds)))
+
+    # In boundary mode the component label identifies the region up front,
+    # so duplicates are dropped before any mask is built
+    if boundary_labels is not None:
+        h, w = boundary_labels.labels.shape
+        first_seed_for_label: Dict[int, int] = {}
+        pending = []
+        for i, seed in enumerate(seeds):
+            if not (0 <= seed.click_x < w and 0 <= seed.click_y < h):
+                pending.append(i)  # reported as out of bounds by the selection
+                continue
+            label = int(boundary_labels.labels[seed.click_y, seed.click_x])
+            if label != 0 and label in first_seed_for_label:
+                responses[i] = _duplicate_response(first_seed_for_label[label])
+            else:
+                first_seed_for_label.setdefault(label, i)
+                pending.append(i)
+
+    selections = list(_batch_pool.map(
+        lambda i: _select_seed(img, seeds[i], options, boundary_labels), pending
+    ))
+
+    # In tolerance mode regions are only known after filling, so a seed is a
+    # duplicate if it lies inside the mask of an earlier seed
+    to_build = []
+    for i, (mask, bbox, error) in zip(pending, selections):
+        if error is not None:
+            responses[i] = MagicWandResponse(success=False, error=error)
+            continue
+
+        if boundary_labels is None:
+            seed = seeds[i]
+            duplicate_of = next(
+                (
+                    j for j, other_mask, other_bbox in to_build
+                    if selection_contains(other_mask, other_bbox, seed.click_x, seed.click_y)
+                ),
+                None
+            )
+            if duplicate_of is not None:
+                responses[i] = _duplicate_response(duplicate_of)
+                continue
+
+        to_build.append((i, mask, bbox))
+
+    built = _batch_pool.map(
+        lambda item: build_response(
+            img, item[1], item[2], options, overlap_index, seeds[item[0]].unit_id
+        ),
+        to_build
+    )
+    for (i, _, _), response in zip(to_build, built):
+        responses[i] = response
+
+    return responses
+
+
+def digitize_sheet(
+    img: np.ndarray,
+    request: AutoDigitizeRequest,
+    boundary_labels: BoundaryLabels,
+    overlap_index: Optional[PolygonIndex] = None
+) -> Tuple[int, Iterator[MagicWandResponse]]:
+    """
+    Turn every boundary-enclosed region of the sheet into a unit.
+
+    Regions come from the boundary label map, filtered like a click would be
+    (see enclosed_components). Returns the number of units and an iterator
+    that yields their responses, with unit_index set, as the polygon and OCR
+    work for each one completes on the batch worker pool. Units are submitted
+    as the iterator is consumed, at most AUTO_DIGITIZE_IN_FLIGHT at a time.
+    """
+    components = enclosed_components(boundary_labels, request.min_area, request.skip_border)
+
+    def build(label: int) -> MagicWandResponse:
+        mask, bbox = select_label(boundary_labels, label)
+        return build_response(img, mask, bbox, request, overlap_index)
+
+    def responses() -> Iterator[MagicWandResponse]:
+        units = enumerate(components)
+        pending: Dict[Future, int] = {}
+        try:
+            while True:
+                # Keep at most AUTO_DIGITIZE_IN_FLIGHT units queued or running
+                for index, label in islice(units, max(1, AUTO_DIGITIZE_IN_FLIGHT) - len(pending)):
+                    pending[_batch_pool.submit(build, int(label))] = index
+                if not pending:
+                    return
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in sorted(done, key=pending.get):
+                    try:
+                        response = future.result()
+                    except Exception as e:
+                        response = MagicWandResponse(success=False, error=str(e))
+                    response.unit_index = pending.pop(future)
+                    yield response
+        finally:
+            # Client went away: drop the units not started yet
+            for future in pending:
+                future.cancel()
+
+    return len(components), responses()
@@ -0,0 +1,292 @@
+"""
+Tiled, memory-bounded variant of the /api/process segmentation for very large images
+"""
+
+import os
+import tempfile
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from shapely import STRtree, make_valid, unary_union
+from shapely.geometry import LineString, Point
+from shapely.geometry import Polygon as ShapelyPolygon
+
+from schemas import ExtractionSettings
+from services.clahe import TiledCLAHE
+from services.image_processing import (
+    CLAHE_CLIP_LIMIT,
+    CLAHE_GRID,
+    _extraction_pool,
+    assign_to_centers,
+    denoise_image,
+    dominant_colors,
+    fit_palette,
+    label_with_lut,
+    mark_colors,
+    morphology_margin,
+    palette_lut,
+    region_mask,
+    resolve_denoise_mode,
+    resolve_segmentation_mode,
+    sample_index,
+)
+from services.timing import StageTimings
+
+# Context around a tile for the denoiser's search window
+PREPROCESS_MARGIN = 32
+# Extra pixels each tile's contours extend past its core, so the pieces of a
+# region cut by a seam overlap and union into one polygon
+SEAM_OVERLAP = 2
+# Palette sample size when ExtractionSettings.kmeans_sample_size is 0
+MAX_TILED_SAMPLE = 1_000_000
+# Smaller tiles would be dominated by their margins
+MIN_TILE_SIZE = 256
+
+Tile = Tuple[int, int, int, int]  # y0, y1, x0, x1
+
+
+def iter_tiles(height: int, width: int, tile_size: int) -> Iterator[Tile]:
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            yield y0, min(y0 + tile_size, height), x0, min(x0 + tile_size, width)
+
+
+def _with_margin(tile: Tile, margin: int, height: int, width: int) -> Tuple[Tile, Tile]:
+    """Expand a tile by margin; returns (expanded tile, core relative to it)."""
+    y0, y1, x0, x1 = tile
+    ey0, ey1 = max(0, y0 - margin), min(height, y1 + margin)
+    ex0, ex1 = max(0, x0 - margin), min(width, x1 + margin)
+    return (ey0, ey1, ex0, ex1), (y0 - ey0, y1 - ey0, x0 - ex0, x1 - ex0)
+
+
+def _slices(tile: Tile) -> Tuple[slice, slice]:
+    y0, y1, x0, x1 = tile
+    return slice(y0, y1), slice(x0, x1)
+
+
+def _touches_seam(rect: Tuple[int, int, int, int], tile: Tile, height: int, width: int) -> bool:
+    """Whether a contour's bounding rect reaches an edge shared with another tile."""
+    x, y, w, h = rect
+    y0, y1, x0, x1 = tile
+    return (
+        (x0 > 0 and x <= x0) or (x1 < width and x + w >= x1)
+        or (y0 > 0 and y <= y0) or (y1 < height and y + h >= y1)
+    )
+
+
+def _to_polygon(contour: np.ndarray):
+    points = contour.reshape(-1, 2)
+    if len(points) == 1:
+        geometry = Point(points[0])
+    elif len(points) == 2:
+        geometry = LineString(points)
+    else:
+        geometry = make_valid(ShapelyPolygon(points))
+    if geometry.area == 0:
+        # One pixel wide - widen to its pixel footprint so it can still join neighbours
+        geometry = geometry.buffer(0.5, 1)
+    return geometry
+
+
+def _exteriors(geometry) -> List[ShapelyPolygon]:
+    """Outer shells of the polygons in a (multi)geometry."""
+    if geometry.is_empty:
+        return []
+    if geometry.geom_type == "Polygon":
+        return [ShapelyPolygon(geometry.exterior)]
+    if hasattr(geometry, "geoms"):
+        return [shell for part in geometry.geoms for shell in _exteriors(part)]
+    return []
+
+
+def _to_contour(shell: ShapelyPolygon) -> np.ndarray:
+    points = np.round(np.asarray(shell.exterior.coords)[:-1]).astype(np.int32)
+    return points.reshape(-1, 1, 2)
+
+
+def _lightness(pixels: np.ndarray) -> np.ndarray:
+    """LAB lightness channel of BGR pixels"""
+    return np.ascontiguousarray(cv2.cvtColor(np.asarray(pixels), cv2.COLOR_BGR2LAB)[..., 0])
+
+
+def _tile_pieces(
+    labels: np.ndarray,
+    label_id: int,
+    settings: ExtractionSettings,
+    crop: Tile,
+    offset: Tuple[int, int]
+) -> List[np.ndarray]:
+    """Outer contours of one label inside a tile crop, in image coordinates."""
+    mask = region_mask(labels, label_id, settings)
+    contours, _ = cv2.findContours(
+        np.ascontiguousarray(mask[_slices(crop)]),
+        cv2.RETR_EXTERNAL,
+        cv2.CHAIN_APPROX_SIMPLE,
+        offset=offset
+    )
+    return list(contours)
+
+
+def extract_raw_contours_tiled(
+    img: np.ndarray,
+    settings: ExtractionSettings,
+    tile_size: int,
+    timings: Optional[StageTimings] = None
+) -> List[np.ndarray]:
+    """
+    Preprocess, segment and vectorize an image tile by tile.
+
+    Pass 1 denoises each tile (with context for the denoiser) into a
+    disk-backed array; for k-means it also adds the tile's lightness to the
+    CLAHE grid histograms (TiledCLAHE). Pass 2 equalizes each tile against
+    those histograms, exactly as a full-frame CLAHE would, writes its
+    segmentation pixels (LAB for k-means, BGR for an exact palette) and
+    gathers its share of the palette sample, which holds
+    the same pixels in the same order as the full-frame sample (up to
+    MAX_TILED_SAMPLE). Pass 3 labels each tile plus a morphology margin
+    against the global palette and extracts each label's outer contours
+    inside the tile. Pieces that reach a tile seam are unioned per label, and
+    pieces nested inside another polygon of the same label are dropped, as a
+    full-frame RETR_EXTERNAL extraction would. Contours are returned before
+    area filtering and simplification (see filter_contours).
+
+    Apart from the decoded input image, peak memory scales with the tile size
+    and the palette sample.
+    Stage durations summed over all tiles are recorded in timings.
+    """
+    timings = timings or StageTimings()
+    height, width = img.shape[:2]
+    img_area = height * width
+    tile_size = max(tile_size, MIN_TILE_SIZE)
+    tiles = list(iter_tiles(height, width, tile_size))
+    with timings.stage("noise_estimate"):
+        # One choice for the whole image, so tiles are denoised consistently
+        denoise = resolve_denoise_mode(img, settings.denoise)
+    with timings.stage("palette_check"):
+        exact_palette = resolve_segmentation_mode(img, settings) == "palette"
+    present = np.zeros(1 << 24, dtype=bool) if exact_palette else None
+
+    sample_size = settings.kmeans_sample_size
+    if not 0 < sample_size < img_area and img_area > MAX_TILED_SAMPLE:
+        sample_size = MAX_TILED_SAMPLE
+    # The full-frame sample, gathered tile by tile into its original order
+    index = sample_index(img_area, sample_size)
+    sample = np.empty((len(index), 3), dtype=np.uint8)
+    sample_rows, sample_cols = np.divmod(index, width)
+    tiles_across = -(-width // tile_size)
+    sample_tiles = (sample_rows // tile_size) * tiles_across + sample_cols // tile_size
+    by_tile = np.argsort(sample_tiles, kind="stable")
+    tile_bounds = np.searchsorted(sample_tiles[by_tile], np.arange(len(tiles) + 1))
+    del index, sample_tiles
+
+    with tempfile.TemporaryDirectory() as tmp:
+        processed_pixels = np.lib.format.open_memmap(
+            os.path.join(tmp, "pixels.npy"), mode="w+", dtype=np.uint8, shape=(height, width, 3)
+        )
+        # CLAHE of the lightness channel, as enhance_contrast does, from
+        # histograms gathered tile by tile
+        equalizer = None if exact_palette else TiledCLAHE(height, width, CLAHE_CLIP_LIMIT, CLAHE_GRID)
+
+        # Pass 1: denoising and lightness histograms
+        for tile in tiles:
+            expanded, core = _with_margin(tile, PREPROCESS_MARGIN, height, width)
+            with timings.stage("denoise"):
+                denoised = denoise_image(img[_slices(expanded)], denoise)[_slices(core)]
+                processed_pixels[_slices(tile)] = denoised
+            if equalizer is not None:
+                with timings.stage("contrast"):
+                    equalizer.add(_lightness(denoised), tile[0], tile[2])
+
+        if equalizer is not None:
+            with timings.stage("contrast"):
+                equalizer.add_border(lambda rows, cols: _lightness(processed_pixels[rows, cols]))
+
+        # Pass 2: contrast, segmentation pixels and palette sample
+        for tile_number, tile in enumerate(tiles):
+            tile_pixels = np.asarray(processed_pixels[_slices(tile)])
+            if equalizer is not None:
+                with timings.stage("contrast"):
+                    lab = cv2.cvtColor(tile_pixels, cv2.COLOR_BGR2LAB)
+                    lab[..., 0] = equalizer.apply(lab[..., 0], tile[0], tile[2])
+                    tile_pixels = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
+            with timings.stage("segmentation"):
+                if equalizer is not None:
+                    tile_pixels = cv2.cvtColor(tile_pixels, cv2.COLOR_BGR2LAB)
+                    processed_pixels[_slices(tile)] = tile_pixels
+                if exact_palette:
+                    mark_colors(present, tile_pixels.reshape(-1, 3))
+
+                y0, _, x0, _ = tile
+                picked = by_tile[tile_bounds[tile_number]:tile_bounds[tile_number + 1]]
+                sample[picked] = tile_pixels[sample_rows[picked] - y0, sample_cols[picked] - x0]
+
+        with timings.stage("segmentation"):
+            if exact_palette:
+                lut = palette_lut(present, dominant_colors(sample)[0])
+                classify = lambda window: label_with_lut(window, lut)
+            else:
+                centers = fit_palette(sample, settings.color_clusters, settings.kmeans_attempts)
+                classify = lambda window: assign_to_centers(window, centers)
+        del sample, sample_rows, sample_cols, by_tile, present, equalizer
+
+        # Pass 3: labels and contour pieces
+        interior: List[Tuple[int, np.ndarray]] = []
+        seam_pieces: Dict[int, List[ShapelyPolygon]] = defaultdict(list)
+        margin = morphology_margin(settings) + SEAM_OVERLAP
+
+        for tile in tiles:
+            expanded, core = _with_margin(tile, margin, height, width)
+            with timings.stage("segmentation"):
+                window = processed_pixels[_slices(expanded)]
+                labels = classify(window.reshape(-1, 3)).reshape(window.shape[:2])
+
+            cy0, cy1, cx0, cx1 = core
+            crop = (cy0, min(cy1 + SEAM_OVERLAP, labels.shape[0]), cx0, min(cx1 + SEAM_OVERLAP, labels.shape[1]))
+            offset = (tile[2], tile[0])
+            label_ids = np.unique(labels[_slices(core)])
+
+            with timings.stage("contours"):
+                results = _extraction_pool.map(
+                    lambda label_id: _tile_pieces(labels, label_id, settings, crop, offset),
+                    label_ids
+                )
+                for label_id, contours in zip(label_ids, results):
+                    for contour in contours:
+                        if _touches_seam(cv2.boundingRect(contour), tile, height, width):
+                            seam_pieces[int(label_id)].append(_to_polygon(contour))
+                        else:
+                            interior.append((int(label_id), contour))
+
+    with timings.stage("stitching"):
+        return _stitch(seam_pieces, interior)
+
+
+def _stitch(
+    seam_pieces: Dict[int, List[ShapelyPolygon]],
+    interior: List[Tuple[int, np.ndarray]]
+) -> List[np.ndarray]:
+    """Union seam pieces per label and drop contours nested in a same-label shell."""
+    candidates: Dict[int, List[Tuple[np.ndarray, ShapelyPolygon]]] = defaultdict(list)
+    shells_by_label: Dict[int, List[ShapelyPolygon]] = {}
+    for label_id, pieces in seam_pieces.items():
+        shells = _exteriors(unary_union(pieces))
+        shells_by_label[label_id] = shells
+        for shell in shells:
+            candidates[label_id].append((_to_contour(shell), shell))
+    for label_id, contour in interior:
+        candidates[label_id].append((contour, None))
+
+    contours = []
+    for label_id, items in candidates.items():
+        shells = shells_by_label.get(label_id, [])
+        tree = STRtree(shells) if shells else None
+        for contour, own_shell in items:
+            if tree is not None:
+                point = Point(contour[0, 0])
+                if any(shells[i] is not own_shell for i in tree.query(point, predicate="within")):
+                    continue  # Nested inside another region of the same label
+            contours.append(contour)
+
+    return contours
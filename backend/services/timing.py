@@ -0,0 +1,26 @@
+"""
+Per-stage wall-clock timings for pipeline responses
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class StageTimings:
+    """Accumulates the time spent in named pipeline stages."""
+
+    def __init__(self):
+        self._seconds: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._seconds[name] = self._seconds.get(name, 0.0) + time.perf_counter() - start
+
+    def as_ms(self) -> Dict[str, float]:
+        """Stage durations in milliseconds, in the order the stages first ran"""
+        return {name: round(seconds * 1000, 1) for name, seconds in self._seconds.items()}
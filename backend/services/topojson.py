@@ -0,0 +1,213 @@
+"""
+TopoJSON encoder - shared-arc topology with optional quantization, streamed in chunks
+"""
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import orjson
+
+from services.georeference import flatten_rings, geometry_polygons
+
+# Arcs serialized per chunk of the response body
+ARCS_PER_CHUNK = 2000
+
+UNGROUPED_OBJECT = "features"
+UNCATEGORIZED_OBJECT = "uncategorized"
+
+
+class Topology:
+    """Arcs and per-feature arc references of a set of polygon features."""
+
+    def __init__(
+        self,
+        bbox: List[float],
+        transform: Optional[dict],
+        arcs: List[np.ndarray],
+        geometries: List[dict]
+    ):
+        self.bbox = bbox
+        self.transform = transform
+        self.arcs = arcs  # Point arrays; delta-encoded when quantized
+        self.geometries = geometries
+
+
+def _quantize(coords: np.ndarray, bbox: np.ndarray, quantization: int) -> Tuple[np.ndarray, dict]:
+    extent = bbox[2:] - bbox[:2]
+    scale = np.where(extent > 0, extent / (quantization - 1), 1.0)
+    quantized = np.round((coords - bbox[:2]) / scale).astype(np.int64)
+    return quantized, {"scale": scale.tolist(), "translate": bbox[:2].tolist()}
+
+
+def _point_ids(points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Unique points and the index of each input point among them"""
+    unique, inverse = np.unique(points, axis=0, return_inverse=True)
+    return unique, inverse.reshape(-1)
+
+
+def _junctions(ids: np.ndarray, lengths: np.ndarray, point_count: int) -> np.ndarray:
+    """
+    Flag points where rings meet or diverge.
+
+    A point is a junction when it is seen with more than one distinct pair of
+    neighbours. Rings are open (no closing point) here.
+    """
+    junction = np.zeros(point_count, dtype=bool)
+    if not len(ids):
+        return junction
+
+    starts = np.cumsum(lengths) - lengths
+    ends = starts + lengths - 1
+    previous = np.arange(-1, len(ids) - 1)
+    previous[starts] = ends
+    following = np.arange(1, len(ids) + 1)
+    following[ends] = starts
+
+    a, b = ids[previous], ids[following]
+    occurrences = np.stack([ids, np.minimum(a, b), np.maximum(a, b)], axis=1)
+    distinct = np.unique(occurrences, axis=0)
+    junction[np.flatnonzero(np.bincount(distinct[:, 0], minlength=point_count) > 1)] = True
+    return junction
+
+
+class _ArcIndex:
+    """Deduplicates arcs; a reversed copy of a known arc is referenced as ~index."""
+
+    def __init__(self):
+        self.arcs: List[np.ndarray] = []
+        self._index: Dict[tuple, int] = {}
+
+    def add(self, arc: np.ndarray) -> int:
+        key = tuple(arc.tolist())
+        index = self._index.get(key)
+        if index is not None:
+            return index
+
+        index = self._index.get(key[::-1])
+        if index is not None:
+            return ~index
+
+        self._index[key] = len(self.arcs)
+        self.arcs.append(arc)
+        return len(self.arcs) - 1
+
+    def add_ring(self, ring: np.ndarray, junction: np.ndarray) -> List[int]:
+        """Cut an open ring of point IDs at its junctions; returns arc references."""
+        cuts = np.flatnonzero(junction[ring])
+        if not len(cuts):
+            # No junction: one closed arc, started at its smallest point so
+            # identical rings match whatever their starting point
+            ring = np.roll(ring, -int(np.argmin(ring)))
+            return [self.add(np.append(ring, ring[0]))]
+
+        ring = np.roll(ring, -int(cuts[0]))
+        cuts = np.append(cuts - cuts[0], len(ring))
+        closed = np.append(ring, ring[0])
+        return [self.add(closed[start:end + 1]) for start, end in zip(cuts[:-1], cuts[1:])]
+
+
+def build_topology(features: List[dict], quantization: int = 100_000) -> Topology:
+    """
+    Build a TopoJSON topology from Polygon / MultiPolygon features.
+
+    Vertices are quantized onto a quantization x quantization grid over the
+    bounding box (0 = keep full coordinates). Rings are cut at junctions -
+    points where the outlines of neighbouring polygons meet or part - and
+    boundaries shared by several polygons are stored once as a common arc.
+    """
+    coords, lengths = flatten_rings(features)
+    if len(coords):
+        bbox = np.concatenate([coords.min(axis=0), coords.max(axis=0)])
+    else:
+        bbox = np.zeros(4)
+
+    transform = None
+    points = coords
+    if quantization and quantization > 1:
+        points, transform = _quantize(coords, bbox, quantization)
+
+    unique, ids = _point_ids(points) if len(points) else (np.empty((0, 2)), np.empty(0, dtype=np.int64))
+
+    # Open rings: drop the closing point and repeated points (e.g. merged by quantization)
+    ring_of_vertex = np.repeat(np.arange(len(lengths)), lengths)
+    ring_end = np.zeros(len(ids), dtype=bool)
+    ring_end[(np.cumsum(lengths) - 1)[lengths > 0]] = True
+    repeated = np.zeros(len(ids), dtype=bool)
+    repeated[1:] = (ids[1:] == ids[:-1]) & (ring_of_vertex[1:] == ring_of_vertex[:-1])
+    closing = ring_end & (ids == ids[np.repeat(np.cumsum(lengths) - lengths, lengths)])
+    keep = ~(repeated | closing)
+    # A ring must keep at least one point
+    keep[(np.cumsum(lengths) - lengths)[lengths > 0]] = True
+    open_ids = ids[keep]
+    open_lengths = np.bincount(ring_of_vertex[keep], minlength=len(lengths)).astype(np.int64)
+
+    junction = _junctions(open_ids, open_lengths[open_lengths > 0], len(unique))
+    rings = np.split(open_ids, np.cumsum(open_lengths)[:-1]) if len(open_lengths) else []
+
+    index = _ArcIndex()
+    ring_iter = iter(rings)
+    geometries = []
+    for feature in features:
+        geometry = feature["geometry"]
+        polygons = geometry_polygons(geometry)
+        arcs = [
+            [index.add_ring(ring, junction) for ring in (next(ring_iter) for _ in polygon) if len(ring)]
+            for polygon in polygons
+        ]
+        arcs = [polygon for polygon in arcs if polygon]
+
+        topo_geometry: dict = {"type": None}
+        if arcs:
+            if geometry["type"] == "MultiPolygon":
+                topo_geometry = {"type": "MultiPolygon", "arcs": arcs}
+            else:
+                topo_geometry = {"type": "Polygon", "arcs": arcs[0]}
+        if feature.get("id") is not None:
+            topo_geometry["id"] = feature["id"]
+        if feature.get("properties"):
+            topo_geometry["properties"] = feature["properties"]
+        geometries.append(topo_geometry)
+
+    arcs = []
+    for arc in index.arcs:
+        arc_points = unique[arc]
+        if transform is not None:
+            arc_points = np.concatenate([arc_points[:1], np.diff(arc_points, axis=0)])
+        arcs.append(arc_points)
+
+    return Topology(bbox.tolist(), transform, arcs, geometries)
+
+
+def group_objects(features: List[dict], geometries: List[dict], group_by: Optional[str]) -> Dict[str, dict]:
+    """Split geometries into named GeometryCollections by a feature property"""
+    groups: Dict[str, List[dict]] = {}
+    for feature, geometry in zip(features, geometries):
+        if group_by:
+            name = (feature.get("properties") or {}).get(group_by)
+            name = str(name) if name not in (None, "") else UNCATEGORIZED_OBJECT
+        else:
+            name = UNGROUPED_OBJECT
+        groups.setdefault(name, []).append(geometry)
+
+    return {name: {"type": "GeometryCollection", "geometries": items} for name, items in groups.items()}
+
+
+def iter_topojson(
+    topology: Topology,
+    objects: Dict[str, dict],
+    chunk_size: int = ARCS_PER_CHUNK
+) -> Iterator[bytes]:
+    """Serialize a topology as a TopoJSON document, arcs in chunks"""
+    header = {"type": "Topology", "bbox": topology.bbox}
+    if topology.transform is not None:
+        header["transform"] = topology.transform
+    header["objects"] = objects
+    yield orjson.dumps(header)[:-1] + b',"arcs":['
+
+    for start in range(0, len(topology.arcs), chunk_size):
+        chunk = b",".join(
+            orjson.dumps(arc.tolist()) for arc in topology.arcs[start:start + chunk_size]
+        )
+        yield chunk if start == 0 else b"," + chunk
+
+    yield b"]}"
@@ -0,0 +1,219 @@
+"""Test the batched AI OCR client against a local stub of the chat completions API.
+
+Run from backend/: python test_ai_ocr.py (or python -m pytest test_ai_ocr.py)
+"""
+import base64
+import json
+import threading
+import time
+from concurrent.futures import wait
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+import ocr_service
+import services.selection as selection
+from magic_wand import magic_wand_select
+from schemas import MagicWandOptions
+from services.ai_ocr import OPENAI_SDK_AVAILABLE, AIOCRClient
+
+MODEL = "stub/vision"
+
+
+class StubServer(ThreadingHTTPServer):
+    """Answers with the label encoded in each image, after an optional delay."""
+
+    daemon_threads = True
+
+    def __init__(self, delay: float = 0.0):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.delay = delay
+        self.requests = []  # Number of images in each request
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server: StubServer
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        labels = [
+            _decode_label(part["image_url"]["url"])
+            for part in body["messages"][0]["content"]
+            if part["type"] == "image_url"
+        ]
+        with self.server.lock:
+            self.server.requests.append(len(labels))
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        try:
+            time.sleep(self.server.delay)
+        finally:
+            with self.server.lock:
+                self.server.active -= 1
+
+        answer = labels[0] if len(labels) == 1 else json.dumps(labels)
+        payload = json.dumps({
+            "id": "stub",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": answer},
+            }],
+        }).encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except OSError:
+            pass  # The client gave up on a slow request
+
+    def log_message(self, *args):
+        pass
+
+
+def _decode_label(data_url: str) -> str:
+    """Tests send the label itself as the image; real PNG crops read as blank."""
+    try:
+        return base64.b64decode(data_url.split(",", 1)[1]).decode()
+    except UnicodeDecodeError:
+        return ""
+
+
+@contextmanager
+def stub_server(delay: float = 0.0):
+    server = StubServer(delay)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def make_client(server: StubServer, **kwargs) -> AIOCRClient:
+    options = dict(max_concurrency=4, batch_size=8, batch_window=0.05, timeout=5.0, max_retries=0)
+    options.update(kwargs)
+    return AIOCRClient(server.base_url, "stub-key", **options)
+
+
+def encode(label: str) -> str:
+    return base64.b64encode(label.encode()).decode()
+
+
+def recognize_all(client: AIOCRClient, labels, model: str = MODEL):
+    futures = [client.recognize_threadsafe(f"hash-{label}", encode(label), model) for label in labels]
+    wait(futures, timeout=30)
+    return [future.result() for future in futures]
+
+
+def test_batching():
+    labels = [f"A-{i}" for i in range(6)]
+    with stub_server() as server:
+        client = make_client(server, batch_size=4)
+        results = recognize_all(client, labels)
+
+    assert [text for text, _ in results] == labels
+    assert all(conf > 0 for _, conf in results)
+    # Six crops submitted together go out as one full batch and one partial one
+    assert sorted(server.requests) == [2, 4], server.requests
+
+
+def test_concurrency_cap():
+    labels = [f"B-{i}" for i in range(8)]
+    with stub_server(delay=0.2) as server:
+        client = make_client(server, batch_size=1, max_concurrency=2)
+        results = recognize_all(client, labels)
+
+    assert [text for text, _ in results] == labels
+    assert len(server.requests) == len(labels)
+    assert server.max_active == 2, server.max_active
+
+
+def test_timeout_returns_empty_result():
+    with stub_server(delay=2.0) as server:
+        client = make_client(server, timeout=0.2)
+        start = time.perf_counter()
+        result = client.recognize_threadsafe("hash-slow", encode("C-1"), MODEL).result(timeout=10)
+        elapsed = time.perf_counter() - start
+
+        assert result == ("", 0.0)
+        assert elapsed < 1.5, elapsed
+        # Failures aren't cached, so the crop is retried next time
+        assert client.cached("hash-slow", MODEL) is None
+
+
+def test_timeout_falls_back_to_tesseract():
+    img = np.full((120, 160, 3), 255, dtype=np.uint8)
+    img[20:100, 20:140] = (180, 220, 250)
+    cv2.rectangle(img, (20, 20), (139, 99), (152, 152, 152), 2)
+    mask, bbox = magic_wand_select(img, 80, 60, tolerance=32)
+    tesseract_calls = []
+
+    def fake_tesseract(*args, **kwargs):
+        tesseract_calls.append(args)
+        return "D-1", 88.0
+
+    patched = {
+        "is_gemini_available": lambda: True,
+        "is_tesseract_available": lambda: True,
+        "extract_text_from_polygon": fake_tesseract,
+    }
+    originals = {name: getattr(selection, name) for name in patched}
+    original_client = ocr_service._openrouter_client
+
+    with stub_server(delay=2.0) as server:
+        ocr_service._openrouter_client = make_client(server, timeout=0.2)
+        for name, value in patched.items():
+            setattr(selection, name, value)
+        try:
+            response = selection.build_response(img, mask, bbox, MagicWandOptions(ocr_engine="ai", ai_model=MODEL))
+        finally:
+            for name, value in originals.items():
+                setattr(selection, name, value)
+            ocr_service._openrouter_client = original_client
+
+    assert response.success
+    assert server.requests == [1]
+    assert len(tesseract_calls) == 1
+    assert (response.ocr_text, response.ocr_confidence) == ("D-1", 88.0)
+
+
+def test_result_cache():
+    with stub_server(delay=0.1) as server:
+        client = make_client(server)
+        # Identical crops in flight at the same time share one request
+        first = recognize_all(client, ["E-1", "E-1"])
+        assert first == [("E-1", 95.0)] * 2
+        assert server.requests == [1]
+
+        assert client.cached("hash-E-1", MODEL) == ("E-1", 95.0)
+        assert client.cached("hash-E-1", "other/model") is None
+
+        # Later lookups are served from the cache without a request
+        again = client.recognize_threadsafe("hash-E-1", encode("E-1"), MODEL).result(timeout=10)
+        assert again == ("E-1", 95.0)
+        assert server.requests == [1]
+
+
+if __name__ == "__main__":
+    if not OPENAI_SDK_AVAILABLE:
+        raise SystemExit("openai SDK not installed")
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,135 @@
+"""Test the in-process caches and the pipeline stages they let /api/process reuse.
+
+Run from backend/: python test_cache.py (or python -m pytest test_cache.py)
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from fastapi.testclient import TestClient
+
+from benchmarks.synthetic import generate_masterplan
+from main import app
+from services.cache import KeyedLocks, LRUCache
+
+
+def test_evicts_least_recently_used_by_bytes():
+    cache = LRUCache(max_bytes=300)
+    for key in "abc":
+        assert cache.put(key, np.zeros(100, dtype=np.uint8))
+    assert cache.total_bytes == 300
+
+    cache.get("a")  # "b" is now the least recently used
+    cache.put("d", np.zeros(150, dtype=np.uint8))
+    assert "b" not in cache and "c" not in cache
+    assert "a" in cache and "d" in cache
+    assert cache.total_bytes == 250
+
+    # Values larger than the whole cache are refused and evict nothing
+    assert not cache.put("e", np.zeros(301, dtype=np.uint8))
+    assert len(cache) == 2 and cache.total_bytes == 250
+
+    # Replacing a key replaces its size
+    cache.put("a", np.zeros(10, dtype=np.uint8))
+    assert cache.total_bytes == 160
+    assert cache.pop("a").nbytes == 10 and cache.total_bytes == 150
+
+
+def test_entries_expire_after_ttl():
+    cache = LRUCache(max_bytes=1000, ttl_seconds=0.2)
+    cache.put("old", np.zeros(10))
+    cache.put("used", np.zeros(10))
+    time.sleep(0.15)
+    assert cache.get("used") is not None  # Access refreshes the entry
+    time.sleep(0.1)
+
+    assert cache.get("old") is None
+    assert cache.get("used") is not None
+    # Expired entries are also dropped when something new is stored
+    time.sleep(0.25)
+    cache.put("new", np.zeros(10))
+    assert len(cache) == 1
+
+
+def test_get_or_compute_runs_once_for_concurrent_callers():
+    cache = LRUCache(max_bytes=10)
+    calls = []
+    started = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        # Too large to cache, but still shared with the callers waiting for it
+        return np.zeros(100, dtype=np.uint8)
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda _: cache.get_or_compute("key", compute), range(4)))
+
+    assert len(calls) == 1
+    assert sum(not hit for _, hit in results) == 1
+    assert all(value is results[0][0] for value, _ in results)
+    assert len(cache._computing) == 0
+
+    # Nothing was cached, so the next call computes again
+    _, hit = cache.get_or_compute("key", compute)
+    assert not hit and len(calls) == 2
+
+
+def test_keyed_locks_are_per_key_and_dropped():
+    locks = KeyedLocks()
+    with locks.hold("a") as a:
+        with locks.hold("b") as b:
+            assert a is not b
+            assert len(locks) == 2
+        assert len(locks) == 1
+
+        acquired = []
+
+        def wait_for_a():
+            with locks.hold("a") as entry:
+                acquired.append(entry)
+
+        waiter = threading.Thread(target=wait_for_a)
+        waiter.start()
+        waiter.join(0.1)
+        # A second holder of "a" waits for the first
+        assert not acquired and a.users == 2
+    waiter.join(1)
+    assert acquired == [a]
+    assert len(locks) == 0
+
+
+def test_process_reuses_cached_stages():
+    client = TestClient(app)
+    image = generate_masterplan(0.3, seed=7).image
+    png = cv2.imencode(".png", image)[1].tobytes()
+    image_id = client.post("/api/upload", files={"file": ("plan.png", png, "image/png")}).json()["image_id"]
+
+    def process(**settings):
+        response = client.post("/api/process", json={
+            "image_id": image_id, "settings": dict(settings, tiled=False, segmentation="kmeans"),
+        })
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    first = process()
+    assert first["metadata"]["cached_stages"] == []
+
+    # Only the area filter changed: the raw contours are reused
+    second = process(min_area_percent=0.5)
+    assert second["metadata"]["cached_stages"] == ["contours"]
+    assert 0 < len(second["features"]) <= len(first["features"])
+
+    # A new kernel size re-extracts contours from the cached label map
+    third = process(morph_kernel_size=5)
+    assert third["metadata"]["cached_stages"] == ["labels"]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,96 @@
+"""Test the worker pools and their admission queue.
+
+Run from backend/: python test_executor.py (or python -m pytest test_executor.py)
+"""
+import asyncio
+import os
+from contextlib import contextmanager
+
+from fastapi.testclient import TestClient
+
+import core.executor as executor
+from main import app
+
+
+def square(x, y, size=10):
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+
+
+EXPORT = {
+    "features": [
+        {"type": "Feature", "properties": {"zone_id": f"ZONE_{i:04d}", "collection": "A" if i % 2 else "B"},
+         "geometry": {"type": "Polygon", "coordinates": [square(10 * i, 0)]}}
+        for i in range(20)
+    ],
+}
+
+
+@contextmanager
+def pool_kind(kind: str):
+    original = executor.WORKER_POOL_KIND
+    executor.shutdown_pools()
+    executor.WORKER_POOL_KIND = kind
+    try:
+        yield
+    finally:
+        executor.shutdown_pools()
+        executor.WORKER_POOL_KIND = original
+
+
+def test_isolated_work_runs_in_worker_process():
+    async def pids():
+        return await asyncio.gather(
+            executor.run_blocking(os.getpid, isolated=True),
+            executor.run_blocking(os.getpid),
+        )
+
+    with pool_kind("process"):
+        isolated, shared = asyncio.run(pids())
+    assert isolated != os.getpid()
+    # Work that isn't isolated stays in this process, next to the caches
+    assert shared == os.getpid()
+
+    with pool_kind("thread"):
+        assert asyncio.run(pids()) == [os.getpid(), os.getpid()]
+
+
+def test_topojson_export_in_process_pool():
+    client = TestClient(app)
+    with pool_kind("thread"):
+        expected = client.post("/api/export/topojson", json=EXPORT)
+    with pool_kind("process"):
+        response = client.post("/api/export/topojson", json=EXPORT)
+        assert executor._process_pool is not None
+
+    assert response.status_code == 200, response.text
+    assert response.content == expected.content
+    # Validation errors raised in the worker process are still a 400
+    with pool_kind("process"):
+        bad = client.post("/api/export/topojson", json={"features": [{"geometry": {"type": "Point"}}]})
+    assert bad.status_code == 400 and "Polygon" in bad.json()["detail"]
+
+
+def test_worker_slot_rejects_when_queue_is_full():
+    async def run():
+        async with executor.worker_slot():
+            try:
+                async with executor.worker_slot():
+                    pass
+            except executor.WorkerPoolBusy:
+                return True
+        return False
+
+    original = executor.WORKER_QUEUE_LIMIT
+    executor.WORKER_QUEUE_LIMIT = 1
+    try:
+        assert asyncio.run(run())
+    finally:
+        executor.WORKER_QUEUE_LIMIT = original
+    assert executor._in_flight == 0
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: ok")
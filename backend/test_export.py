@@ -0,0 +1,345 @@
+"""Test that TopoJSON and Geobuf exports decode back to the features that were sent.
+
+Run from backend/: python test_export.py (or python -m pytest test_export.py)
+"""
+import json
+import struct
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import core.executor as executor
+from main import app
+from services.geobuf import MULTIPOLYGON, POLYGON, encode_geobuf
+
+try:
+    import geobuf
+except ImportError:
+    geobuf = None
+
+
+def square(x, y, size=10):
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+
+
+def feature(geometry, properties, feature_id=None):
+    result = {"type": "Feature", "geometry": geometry, "properties": properties}
+    if feature_id is not None:
+        result["id"] = feature_id
+    return result
+
+
+# A and B share the edge x = 10; C has a hole; D is a MultiPolygon, one part with a hole
+FEATURES = [
+    feature({"type": "Polygon", "coordinates": [square(0, 0)]},
+            {"zone_id": "A", "collection": "left", "count": 3, "ratio": 0.25, "flag": True}, "A"),
+    feature({"type": "Polygon", "coordinates": [square(10, 0)]},
+            {"zone_id": "B", "collection": "left", "offset": -7, "tags": ["x", 1]}, 12),
+    feature({"type": "Polygon", "coordinates": [square(30, 0), square(32.5, 2.25, 3)]},
+            {"zone_id": "C", "collection": "right"}),
+    feature({"type": "MultiPolygon", "coordinates": [
+        [square(50.125, 0.5, 4)],
+        [square(60, 0), [[62, 2], [62, 4], [64, 4], [64, 2], [62, 2]]],
+    ]}, {"zone_id": "D", "collection": "right", "count": 2.0}, -4),
+]
+
+
+def open_ring(ring):
+    ring = [tuple(point) for point in ring]
+    return ring[:-1] if len(ring) > 1 and ring[0] == ring[-1] else ring
+
+
+def same_ring(actual, expected, tolerance=0.0) -> bool:
+    """Same closed ring, in the same direction, whatever its starting point"""
+    actual, expected = np.array(open_ring(actual)), np.array(open_ring(expected))
+    if actual.shape != expected.shape:
+        return False
+    return any(
+        np.allclose(np.roll(actual, -shift, axis=0), expected, rtol=0, atol=tolerance)
+        for shift in range(len(actual))
+    )
+
+
+def polygons(geometry):
+    return geometry["coordinates"] if geometry["type"] == "MultiPolygon" else [geometry["coordinates"]]
+
+
+def assert_same_geometry(actual, expected, tolerance=0.0):
+    assert actual["type"] == expected["type"], (actual["type"], expected["type"])
+    actual_polygons, expected_polygons = polygons(actual), polygons(expected)
+    assert len(actual_polygons) == len(expected_polygons)
+    for actual_rings, expected_rings in zip(actual_polygons, expected_polygons):
+        assert len(actual_rings) == len(expected_rings)
+        for actual_ring, expected_ring in zip(actual_rings, expected_rings):
+            assert same_ring(actual_ring, expected_ring, tolerance), (actual_ring, expected_ring)
+
+
+# --- TopoJSON ---
+
+
+def decode_arcs(topology: dict) -> list:
+    """Absolute coordinates of each arc, undoing delta encoding and quantization"""
+    transform = topology.get("transform")
+    arcs = []
+    for arc in topology["arcs"]:
+        points = np.array(arc, dtype=float)
+        if transform is not None:
+            points = np.cumsum(points, axis=0) * transform["scale"] + transform["translate"]
+        arcs.append(points)
+    return arcs
+
+
+def arc_ring(references, arcs):
+    """Join a ring's arcs (~index = reversed) into a closed ring"""
+    ring = []
+    for reference in references:
+        points = arcs[reference] if reference >= 0 else arcs[~reference][::-1]
+        ring.extend(points.tolist() if not ring else points[1:].tolist())
+    return ring
+
+
+def topojson_features(topology: dict) -> dict:
+    """GeoJSON features of a topology by zone_id"""
+    arcs = decode_arcs(topology)
+    features = {}
+    for collection in topology["objects"].values():
+        for geometry in collection["geometries"]:
+            if geometry["type"] == "MultiPolygon":
+                coordinates = [[arc_ring(ring, arcs) for ring in polygon] for polygon in geometry["arcs"]]
+            else:
+                coordinates = [arc_ring(ring, arcs) for ring in geometry["arcs"]]
+            features[geometry["properties"]["zone_id"]] = {
+                "geometry": {"type": geometry["type"], "coordinates": coordinates},
+                "properties": geometry["properties"],
+                "id": geometry.get("id"),
+                "arcs": geometry["arcs"],
+            }
+    return features
+
+
+def export_topojson(quantization: int) -> dict:
+    response = TestClient(app).post(
+        "/api/export/topojson", json={"features": FEATURES, "quantization": quantization}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def check_topojson_round_trip(quantization: int):
+    topology = export_topojson(quantization)
+    assert sorted(topology["objects"]) == ["left", "right"]
+    tolerance = max(topology["transform"]["scale"]) if quantization else 0.0
+
+    decoded = topojson_features(topology)
+    for expected in FEATURES:
+        actual = decoded[expected["properties"]["zone_id"]]
+        assert_same_geometry(actual["geometry"], expected["geometry"], tolerance)
+        assert actual["properties"] == expected["properties"]
+        assert actual["id"] == expected.get("id")
+
+    # The shared edge is stored once, walked forwards by A and backwards by B
+    a_refs, b_refs = decoded["A"]["arcs"][0], decoded["B"]["arcs"][0]
+    shared = {ref if ref >= 0 else ~ref for ref in a_refs} & {ref if ref >= 0 else ~ref for ref in b_refs}
+    assert len(shared) == 1, (a_refs, b_refs)
+    index = shared.pop()
+    assert (index in a_refs and ~index in b_refs) or (~index in a_refs and index in b_refs)
+    edge = decode_arcs(topology)[index]
+    assert np.allclose(sorted(edge.tolist()), [[10, 0], [10, 10]], rtol=0, atol=tolerance), edge
+
+
+def test_topojson_round_trip_quantized():
+    check_topojson_round_trip(10_000)
+
+
+def test_topojson_round_trip_unquantized():
+    topology = export_topojson(0)
+    assert "transform" not in topology
+    check_topojson_round_trip(0)
+
+
+# --- Geobuf ---
+
+
+def read_varint(data: bytes, position: int):
+    result = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def read_fields(data: bytes):
+    """(field, value) of each field of a protobuf message; length-delimited values as bytes"""
+    position = 0
+    while position < len(data):
+        key, position = read_varint(data, position)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, position = read_varint(data, position)
+        elif wire_type == 1:
+            value, position = data[position:position + 8], position + 8
+        elif wire_type == 2:
+            size, position = read_varint(data, position)
+            value, position = data[position:position + size], position + size
+        else:
+            raise AssertionError(f"unexpected wire type {wire_type}")
+        yield field, value
+
+
+def read_packed(data: bytes) -> list:
+    values, position = [], 0
+    while position < len(data):
+        value, position = read_varint(data, position)
+        values.append(value)
+    return values
+
+
+def unzigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def decode_value(data: bytes):
+    for field, value in read_fields(data):
+        if field == 1:
+            return value.decode()
+        if field == 2:
+            return struct.unpack("<d", value)[0]
+        if field == 3:
+            return value
+        if field == 4:
+            return -value
+        if field == 5:
+            return bool(value)
+        if field == 6:
+            return json.loads(value)
+    raise AssertionError("empty value")
+
+
+def decode_geometry(data: bytes, scale: float) -> dict:
+    kind, lengths, deltas = None, [], []
+    for field, value in read_fields(data):
+        if field == 1:
+            kind = value
+        elif field == 2:
+            lengths = read_packed(value)
+        elif field == 3:
+            deltas = [unzigzag(value) for value in read_packed(value)]
+    points = iter(zip(deltas[::2], deltas[1::2]))
+
+    def rings(counts):
+        result = []
+        for count in counts:
+            x = y = 0
+            ring = []
+            for dx, dy in (next(points) for _ in range(count)):
+                x, y = x + dx, y + dy
+                ring.append([x / scale, y / scale])
+            result.append(ring + ring[:1])
+        return result
+
+    if kind == POLYGON:
+        return {"type": "Polygon", "coordinates": rings(lengths or [len(deltas) // 2])}
+    assert kind == MULTIPOLYGON, kind
+    if not lengths:
+        return {"type": "MultiPolygon", "coordinates": [rings([len(deltas) // 2])]}
+    coordinates, position = [], 1
+    for _ in range(lengths[0]):
+        ring_count = lengths[position]
+        coordinates.append(rings(lengths[position + 1:position + 1 + ring_count]))
+        position += 1 + ring_count
+    return {"type": "MultiPolygon", "coordinates": coordinates}
+
+
+def decode_geobuf(data: bytes) -> dict:
+    keys, precision, collection = [], 0, b""
+    for field, value in read_fields(data):
+        if field == 1:
+            keys.append(value.decode())
+        elif field == 3:
+            precision = value
+        elif field == 4:
+            collection = value
+
+    features = []
+    for field, message in read_fields(collection):
+        assert field == 1, field
+        result = {"type": "Feature"}
+        values, pairs = [], []
+        for feature_field, value in read_fields(message):
+            if feature_field == 1:
+                result["geometry"] = decode_geometry(value, 10.0 ** precision)
+            elif feature_field == 11:
+                result["id"] = value.decode()
+            elif feature_field == 12:
+                result["id"] = unzigzag(value)
+            elif feature_field == 13:
+                values.append(decode_value(value))
+            elif feature_field == 14:
+                pairs = read_packed(value)
+        result["properties"] = {keys[key]: values[index] for key, index in zip(pairs[::2], pairs[1::2])}
+        features.append(result)
+    return {"type": "FeatureCollection", "features": features}
+
+
+def assert_same_features(decoded: dict, expected: list, tolerance: float = 1e-9):
+    assert len(decoded["features"]) == len(expected)
+    for actual, original in zip(decoded["features"], expected):
+        assert_same_geometry(actual["geometry"], original["geometry"], tolerance)
+        assert actual["properties"] == original["properties"], (actual["properties"], original["properties"])
+        assert actual.get("id") == original.get("id")
+
+
+def test_geobuf_round_trip():
+    client = TestClient(app)
+    response = client.post("/api/export/geobuf", json={"features": FEATURES})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/octet-stream"
+    # The stream released its worker slot once the body was sent
+    assert executor._in_flight == 0
+
+    assert_same_features(decode_geobuf(response.content), FEATURES)
+    if geobuf is not None:
+        assert_same_features(geobuf.decode(response.content), FEATURES)
+
+
+def test_geobuf_precision():
+    data = b"".join(encode_geobuf(FEATURES, precision=1))
+    rounded = json.loads(json.dumps(FEATURES))
+    for item in rounded:
+        for rings in polygons(item["geometry"]):
+            for ring in rings:
+                ring[:] = [[round(x, 1), round(y, 1)] for x, y in ring]
+    assert_same_features(decode_geobuf(data), rounded)
+
+
+def test_geobuf_chunks():
+    features = [
+        feature({"type": "Polygon", "coordinates": [square(10 * i, 0)]}, {"zone_id": f"Z{i}"}, i)
+        for i in range(5)
+    ]
+    whole = list(encode_geobuf(features))
+    chunks = list(encode_geobuf(features, chunk_size=2))
+    # Header, then features 0-1, 2-3 and 4
+    assert len(whole) == 2 and len(chunks) == 4
+    assert b"".join(chunks) == b"".join(whole)
+    assert_same_features(decode_geobuf(b"".join(chunks)), features)
+
+    empty = b"".join(encode_geobuf([]))
+    assert decode_geobuf(empty) == {"type": "FeatureCollection", "features": []}
+
+
+def test_geobuf_rejects_other_geometries():
+    client = TestClient(app)
+    response = client.post("/api/export/geobuf", json={"features": [{"geometry": {"type": "Point"}}]})
+    assert response.status_code == 400 and "Polygon" in response.json()["detail"]
+    assert executor._in_flight == 0
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: ok")
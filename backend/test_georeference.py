@@ -0,0 +1,158 @@
+"""Test georeferencing of extracted features.
+
+Run from backend/: python test_georeference.py (or python -m pytest test_georeference.py)
+"""
+import copy
+
+import cv2
+import numpy as np
+from shapely.geometry import shape
+
+from schemas import BoundingBox, GeoreferencePoint
+from services.georeference import assign_zone_ids, compute_centroids, contour_centroids, transform_coordinates
+
+BOX = BoundingBox(top_left_lat=52.5, top_left_lng=13.3, bottom_right_lat=52.4, bottom_right_lng=13.5)
+CONTROL_POINTS = [
+    GeoreferencePoint(image_x=0, image_y=0, geo_lng=13.30, geo_lat=52.50),
+    GeoreferencePoint(image_x=800, image_y=0, geo_lng=13.52, geo_lat=52.51),
+    GeoreferencePoint(image_x=800, image_y=600, geo_lng=13.50, geo_lat=52.40),
+    GeoreferencePoint(image_x=0, image_y=600, geo_lng=13.31, geo_lat=52.41),
+]
+
+
+def ring(x, y, size):
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+
+
+def features():
+    return [
+        {"type": "Feature", "properties": {"zone_id": "ZONE_0001"}, "geometry": {
+            "type": "Polygon", "coordinates": [ring(10, 10, 100), ring(40, 40, 20)],
+        }},
+        {"type": "Feature", "properties": {"zone_id": "ZONE_0002"}, "geometry": {
+            "type": "MultiPolygon", "coordinates": [[ring(300, 200, 50)], [ring(500, 400, 75.5)]],
+        }},
+    ]
+
+
+def rings_of(feature_list):
+    for feature in feature_list:
+        geometry = feature["geometry"]
+        polygons = geometry["coordinates"] if geometry["type"] == "MultiPolygon" else [geometry["coordinates"]]
+        for polygon in polygons:
+            yield from polygon
+
+
+def transform_each_point(feature_list, transform):
+    """Reference: transform vertex by vertex, keeping the nesting"""
+    result = copy.deepcopy(feature_list)
+    for original, transformed in zip(rings_of(feature_list), rings_of(result)):
+        transformed[:] = [list(transform(x, y)) for x, y in original]
+    return result
+
+
+def assert_close(actual, expected, tolerance):
+    assert [f["geometry"]["type"] for f in actual] == [f["geometry"]["type"] for f in expected]
+    for got, want in zip(rings_of(actual), rings_of(expected)):
+        assert np.allclose(got, want, rtol=0, atol=tolerance), (got, want)
+
+
+def test_bounding_box():
+    def linear(x, y):
+        return (
+            BOX.top_left_lng + x / 800 * (BOX.bottom_right_lng - BOX.top_left_lng),
+            BOX.top_left_lat + y / 600 * (BOX.bottom_right_lat - BOX.top_left_lat),
+        )
+
+    result = transform_coordinates(features(), 800, 600, bounding_box=BOX)
+    assert_close(result, transform_each_point(features(), linear), 1e-12)
+    assert result[1]["properties"] == {"zone_id": "ZONE_0002"}
+
+
+def test_homography():
+    src = np.array([[cp.image_x, cp.image_y] for cp in CONTROL_POINTS], dtype=np.float32)
+    dst = np.array([[cp.geo_lng, cp.geo_lat] for cp in CONTROL_POINTS], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(src, dst)
+
+    def project(x, y):
+        return cv2.perspectiveTransform(np.array([[[x, y]]], dtype=np.float64), matrix)[0, 0]
+
+    result = transform_coordinates(features(), 800, 600, control_points=CONTROL_POINTS)
+    assert_close(result, transform_each_point(features(), project), 1e-9)
+
+    # The control points themselves land on their geographic positions
+    corners = [{"geometry": {"type": "Polygon", "coordinates": [[[cp.image_x, cp.image_y] for cp in CONTROL_POINTS]]}}]
+    transform_coordinates(corners, 800, 600, control_points=CONTROL_POINTS)
+    assert np.allclose(corners[0]["geometry"]["coordinates"][0], dst, atol=1e-5)
+
+
+def test_precision():
+    full = transform_coordinates(features(), 800, 600, bounding_box=BOX)
+    rounded = transform_coordinates(features(), 800, 600, bounding_box=BOX, precision=6)
+
+    for exact, short in zip(rings_of(full), rings_of(rounded)):
+        assert np.array_equal(np.round(exact, 6), short)
+        assert all(abs(value - round(value, 6)) < 1e-12 for point in short for value in point)
+    # Without a precision nothing is rounded: 13.3 + 10 / 800 * 0.2 keeps all its digits
+    assert next(rings_of(full))[0][0] == 13.3 + 10 / 800 * (13.5 - 13.3)
+
+
+def test_without_georeference_features_are_unchanged():
+    assert transform_coordinates(features(), 800, 600) == features()
+    assert transform_coordinates(features(), 800, 600, control_points=CONTROL_POINTS[:3]) == features()
+
+
+def test_centroids_match_shapely():
+    feature_list = features()
+    # Clockwise exterior and counter-clockwise hole: winding must not matter
+    feature_list.append({"geometry": {"type": "Polygon", "coordinates": [
+        ring(0, 0, 90)[::-1], ring(5, 5, 30),
+    ]}})
+    feature_list.append({"geometry": {"type": "Polygon", "coordinates": [[[0, 0], [10, 0], [0, 10], [0, 0]]]}})
+
+    expected = [list(shape(f["geometry"]).centroid.coords[0]) for f in feature_list]
+    assert np.allclose(compute_centroids(feature_list), expected, rtol=0, atol=1e-9)
+
+    # The hole pulls the centroid away from the square's center
+    assert compute_centroids(feature_list)[2][0] > 45
+
+
+def test_degenerate_centroids_fall_back_to_vertex_mean():
+    line = {"geometry": {"type": "Polygon", "coordinates": [[[0, 0], [10, 0], [20, 0], [0, 0]]]}}
+    empty = {"geometry": {"type": "Polygon", "coordinates": [[]]}}
+
+    centroids = compute_centroids([line, empty])
+    assert np.allclose(centroids[0], [7.5, 0])
+    assert np.allclose(centroids[1], [0, 0])
+
+
+def test_contour_centroids():
+    contour = np.array([[[10, 20]], [[10, 60]], [[50, 60]], [[50, 20]]], dtype=np.int32)
+    moments = cv2.moments(contour)
+
+    centroids = contour_centroids([contour])
+    assert np.allclose(centroids[0], [moments["m10"] / moments["m00"], moments["m01"] / moments["m00"]])
+    assert contour_centroids([]).shape == (0, 2)
+
+
+def test_zone_ids_sort_by_y_then_x():
+    # Input order is scrambled; the last two have exactly the same centroid
+    cells = [(200, 0), (0, 100), (0, 0), (100, 0), (100, 100), (100, 100)]
+    polygons = [{"geometry": {"type": "Polygon", "coordinates": [ring(x, y, 50)]}} for x, y in cells]
+    polygons[-1]["geometry"]["coordinates"][0].reverse()
+
+    zones = assign_zone_ids(polygons)
+    assert [z["properties"]["zone_id"] for z in zones] == [f"ZONE_{i:04d}" for i in range(1, 7)]
+    # Exact ties keep their input order
+    assert [z["geometry"] for z in zones] == [polygons[i]["geometry"] for i in (2, 3, 0, 1, 4, 5)]
+
+    # Precomputed centroids are used as given
+    zones = assign_zone_ids(polygons[:2], np.array([[0.0, 5.0], [0.0, 1.0]]))
+    assert [z["geometry"] for z in zones] == [polygons[1]["geometry"], polygons[0]["geometry"]]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,148 @@
+"""Test color segmentation and contour extraction.
+
+Run from backend/: python test_image_processing.py (or python -m pytest test_image_processing.py)
+"""
+import cv2
+import numpy as np
+
+from schemas import ExtractionSettings
+from services.image_processing import (
+    assign_to_centers,
+    enhance_contrast,
+    extract_all_raw_contours,
+    preprocess_image,
+    raw_region_contours,
+    resolve_segmentation_mode,
+    sample_index,
+    segment_by_color,
+    segment_by_palette,
+)
+
+# Flat BGR fills far apart in LAB, one per 40 x 40 block of a 6 x 4 grid
+COLORS = np.array([
+    (255, 255, 255), (0, 0, 0), (0, 0, 255), (0, 255, 0), (255, 0, 0), (0, 255, 255),
+], dtype=np.uint8)
+
+
+def flat_image(block: int = 40) -> np.ndarray:
+    color_index = np.arange(24).reshape(4, 6) % len(COLORS)
+    return COLORS[np.kron(color_index, np.ones((block, block), dtype=int))]
+
+
+def same_partition(a: np.ndarray, b: np.ndarray) -> bool:
+    """True if two label images group the pixels identically (up to renumbering)"""
+    pairs = np.unique(np.stack([a.ravel(), b.ravel()]), axis=1)
+    return len(pairs[0]) == len(np.unique(a)) == len(np.unique(b))
+
+
+def test_kmeans_separates_flat_colors():
+    img = flat_image()
+    expected = np.unique(img.reshape(-1, 3), axis=0, return_inverse=True)[1].reshape(img.shape[:2])
+
+    labels = segment_by_color(img, n_clusters=len(COLORS), sample_size=0)
+    assert labels.shape == img.shape[:2] and labels.dtype == np.int32
+    assert same_partition(labels, expected)
+
+    # A palette fitted on a sample labels the full image the same way
+    sampled = segment_by_color(img, n_clusters=len(COLORS), sample_size=2_000)
+    assert same_partition(sampled, expected)
+
+
+def test_assign_to_centers_matches_brute_force():
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, (10_000, 3)).astype(np.uint8)
+    centers = rng.uniform(0, 255, (16, 3)).astype(np.float32)
+
+    distances = ((pixels[:, None, :].astype(np.float64) - centers[None]) ** 2).sum(axis=2)
+    expected = np.argmin(distances, axis=1)
+    for chunk_size in (1_000, 4_096, 1 << 20):
+        labels = assign_to_centers(pixels, centers, chunk_size=chunk_size)
+        # Float32 ties can only flip a label between equidistant centers
+        mismatched = labels != expected
+        assert np.allclose(distances[mismatched, labels[mismatched]], distances[mismatched, expected[mismatched]])
+
+
+def test_sample_index():
+    index = sample_index(10_000, 500)
+    assert len(np.unique(index)) == 500 and index.min() >= 0 and index.max() < 10_000
+    assert np.array_equal(index, sample_index(10_000, 500))
+    # 0 or a sample at least as large as the image means every pixel, in order
+    assert np.array_equal(sample_index(100, 0), np.arange(100))
+    assert np.array_equal(sample_index(100, 1_000), np.arange(100))
+
+
+def test_palette_matches_kmeans_on_flat_colors():
+    img = flat_image()
+    kmeans = segment_by_color(img, n_clusters=len(COLORS), sample_size=0)
+    palette = segment_by_palette(img)
+
+    assert palette.shape == img.shape[:2]
+    assert same_partition(palette, kmeans)
+
+
+def test_palette_joins_antialiased_fringe_to_nearest_color():
+    img = flat_image()
+    # Blend a few pixels at each vertical block edge, like anti-aliasing: too
+    # rare to enter the palette
+    blended = img.copy()
+    rows, edges = slice(10, 14), np.arange(40, img.shape[1], 40)
+    blended[rows, edges] = (img[rows, edges - 1].astype(np.int32) * 3 + img[rows, edges]) // 4
+
+    labels = segment_by_palette(blended)
+    assert len(np.unique(labels)) == len(COLORS)
+    # Mostly-left fringe pixels join the block on their left
+    assert np.array_equal(labels[rows, edges], labels[rows, edges - 1])
+
+
+def test_auto_segmentation_mode():
+    settings = ExtractionSettings(segmentation="auto")
+    assert resolve_segmentation_mode(flat_image(), settings) == "palette"
+
+    noisy = np.random.default_rng(0).integers(0, 256, (160, 240, 3)).astype(np.uint8)
+    assert resolve_segmentation_mode(noisy, settings) == "kmeans"
+    # Explicit modes are kept as given
+    assert resolve_segmentation_mode(flat_image(), ExtractionSettings(segmentation="kmeans")) == "kmeans"
+    try:
+        resolve_segmentation_mode(flat_image(), ExtractionSettings(segmentation="exact"))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+
+
+def test_windowed_contours_match_full_frame():
+    rng = np.random.default_rng(0)
+    # Blocky random labels, so regions have holes, touch the edges and nest
+    labels = np.kron(rng.integers(0, 7, (30, 40)), np.ones((8, 8), dtype=np.int64)).astype(np.int32)
+    settings = ExtractionSettings(morph_kernel_size=3)
+    expected = [
+        contour.tolist()
+        for label_id in np.unique(labels)
+        for contour in raw_region_contours(labels, int(label_id), settings)
+    ]
+
+    # Budgets from one window at a time to all at once give the same contours, in label order
+    for max_window_bytes in (0, labels.size, 1 << 30):
+        contours = extract_all_raw_contours(labels, settings, max_window_bytes)
+        assert [contour.tolist() for contour in contours] == expected, max_window_bytes
+
+
+def test_preprocess_defaults_to_full_resolution_nlmeans():
+    rng = np.random.default_rng(0)
+    noisy = np.clip(flat_image().astype(np.int16) + rng.normal(0, 12, (160, 240, 3)), 0, 255).astype(np.uint8)
+
+    # The original preprocessing: NL-means on every pixel, then CLAHE on lightness
+    lab = cv2.cvtColor(cv2.fastNlMeansDenoisingColored(noisy, None, 10, 10, 7, 21), cv2.COLOR_BGR2LAB)
+    lab[..., 0] = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(lab[..., 0])
+    expected = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
+
+    assert np.array_equal(preprocess_image(noisy), expected)
+    assert np.array_equal(preprocess_image(noisy, "nlmeans_full"), expected)
+    assert np.array_equal(preprocess_image(noisy, "none"), enhance_contrast(noisy))
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: ok")
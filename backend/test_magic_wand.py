@@ -0,0 +1,276 @@
+"""Test magic-wand selection on a synthetic masterplan.
+
+Run from backend/: python test_magic_wand.py (or python -m pytest test_magic_wand.py)
+"""
+import cv2
+import numpy as np
+from shapely.geometry import Polygon
+
+import magic_wand
+from benchmarks.synthetic import generate_masterplan
+from magic_wand import (
+    PolygonIndex,
+    check_overlap,
+    compute_boundary_labels,
+    compute_boundary_mask,
+    magic_wand_select_boundary,
+    magic_wand_select_tolerance,
+    pad_selection,
+    refine_mask,
+    select_label,
+)
+from services.boundary_labels import get_boundary_labels
+from services.polygon_index import get_session_index
+
+PLAN = generate_masterplan(0.3)
+
+
+def full_frame_selection(image, seed_x, seed_y, boundary_color=(152, 152, 152), tolerance=15):
+    """Reference: flood fill the whole frame's boundary mask, then crop to the bbox."""
+    boundary = compute_boundary_mask(image, boundary_color, tolerance)
+    h, w = boundary.shape
+    mask = np.zeros((h + 2, w + 2), dtype=np.uint8)
+    _, _, _, (x, y, width, height) = cv2.floodFill(
+        boundary.view(np.uint8), mask, (seed_x, seed_y), 0, 0, 0, 4 | cv2.FLOODFILL_MASK_ONLY | (255 << 8)
+    )
+    return mask[y + 1:y + 1 + height, x + 1:x + 1 + width], {"x": x, "y": y, "width": width, "height": height}
+
+
+def test_boundary_fill_matches_full_frame():
+    for parcel in PLAN.parcels:
+        mask, bbox = magic_wand_select_boundary(PLAN.image, *parcel.seed)
+        expected_mask, expected_bbox = full_frame_selection(PLAN.image, *parcel.seed)
+
+        assert bbox == expected_bbox, parcel
+        assert np.array_equal(mask, expected_mask), parcel
+        # The parcel is outlined, so its selection stays inside the outline
+        assert parcel.x <= bbox["x"] and bbox["x"] + bbox["width"] <= parcel.x + parcel.width
+
+
+def test_seed_on_boundary_selects_nothing():
+    parcel = PLAN.parcels[0]
+    mask, bbox = magic_wand_select_boundary(PLAN.image, parcel.x, parcel.y)
+
+    assert mask.size == 0
+    assert bbox == {"x": 0, "y": 0, "width": 0, "height": 0}
+
+
+def test_unbounded_selection_is_rejected():
+    blank = np.full((200, 300, 3), 255, dtype=np.uint8)
+    mask, bbox = magic_wand_select_boundary(blank, 150, 100)
+
+    assert mask.size == 0
+    assert bbox["error"] == "selection_too_large"
+
+
+def test_seed_out_of_bounds():
+    h, w = PLAN.image.shape[:2]
+    try:
+        magic_wand_select_boundary(PLAN.image, w, 0)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+
+
+def test_rgb_boundary_mask_matches_exact_distance():
+    rng = np.random.default_rng(0)
+    # Random colors plus ones on and around the tolerance sphere
+    image = rng.integers(0, 256, (64, 64, 3)).astype(np.uint8)
+    image[:32] = np.clip(152 + rng.integers(-30, 31, (32, 64, 3)), 0, 255)
+    color = (152, 162, 142)  # RGB
+
+    for tolerance in (0, 5, 15, 40):
+        squared = ((image[..., ::-1].astype(np.int64) - color) ** 2).sum(axis=2)
+        expected = squared <= 3 * tolerance ** 2
+        assert np.array_equal(compute_boundary_mask(image, color, tolerance), expected), tolerance
+
+    # A color exactly tolerance * sqrt(3) away is a boundary
+    exact = np.array([[[142 + 15, 162 - 15, 152 + 15]]], dtype=np.uint8)
+    assert compute_boundary_mask(exact, color, 15)[0, 0]
+
+
+def test_lab_boundary_mask_matches_float_delta_e():
+    rng = np.random.default_rng(1)
+    color = (200, 60, 90)  # RGB
+    image = np.clip(np.array(color[::-1]) + rng.integers(-25, 26, (64, 64, 3)), 0, 255).astype(np.uint8)
+
+    lab = cv2.cvtColor(image.astype(np.float32) / 255, cv2.COLOR_BGR2LAB)
+    target = cv2.cvtColor(np.array([[color]], dtype=np.float32) / 255, cv2.COLOR_RGB2LAB)[0, 0]
+    delta_e = np.sqrt(((lab - target) ** 2).sum(axis=2))
+    expected = delta_e <= 10
+    # Skip pixels whose delta E is too close to the threshold for float32 to decide
+    decided = np.abs(delta_e - 10) > 1e-3
+
+    mask = compute_boundary_mask(image, color, 10, metric="lab")
+    assert np.array_equal(mask[decided], expected[decided])
+    assert 0 < np.count_nonzero(mask) < mask.size
+
+
+def test_boundary_mask_chunks():
+    image = PLAN.image
+    whole = compute_boundary_mask(image)
+    original = magic_wand.BOUNDARY_CHUNK_PIXELS
+    magic_wand.BOUNDARY_CHUNK_PIXELS = 4_099  # Chunks that don't divide the image
+    try:
+        assert np.array_equal(compute_boundary_mask(image), whole)
+    finally:
+        magic_wand.BOUNDARY_CHUNK_PIXELS = original
+
+    try:
+        compute_boundary_mask(image, metric="hsv")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+
+
+def test_label_map_clicks_match_flood_fill():
+    labels = compute_boundary_labels(PLAN.image)
+    for parcel in PLAN.parcels:
+        assert (
+            _as_tuple(magic_wand_select_boundary(PLAN.image, *parcel.seed, boundary_labels=labels))
+            == _as_tuple(magic_wand_select_boundary(PLAN.image, *parcel.seed))
+        ), parcel
+
+    # Boundary pixels are label 0 and select nothing
+    parcel = PLAN.parcels[0]
+    mask, _ = magic_wand_select_boundary(PLAN.image, parcel.x, parcel.y, boundary_labels=labels)
+    assert labels.labels[parcel.y, parcel.x] == 0
+    assert mask.size == 0
+
+
+def test_select_label():
+    labels = compute_boundary_labels(PLAN.image)
+    parcel = PLAN.parcels[0]
+    label = int(labels.labels[parcel.seed[1], parcel.seed[0]])
+    mask, bbox = select_label(labels, label)
+
+    assert mask.shape == (bbox["height"], bbox["width"])
+    assert mask.dtype == np.uint8 and set(np.unique(mask)) <= {0, 255}
+    assert np.count_nonzero(mask) == labels.stats[label, cv2.CC_STAT_AREA]
+    window = labels.labels[bbox["y"]:bbox["y"] + bbox["height"], bbox["x"]:bbox["x"] + bbox["width"]]
+    assert np.array_equal(mask == 255, window == label)
+
+
+def test_label_map_is_cached_per_image_and_settings():
+    first = get_boundary_labels("test-plan", PLAN.image, (152, 152, 152), 15)
+
+    assert get_boundary_labels("test-plan", PLAN.image, (152, 152, 152), 15) is first
+    assert get_boundary_labels("test-plan", PLAN.image, (152, 152, 152), 20) is not first
+
+
+def test_tolerance_fill_grows_window_to_full_frame_result():
+    # Shaded blocks wider than the first fill window, so the window has to
+    # grow, and a seed near each corner of the image
+    h, w = 700, 900
+    img = np.zeros((h, w, 3), dtype=np.uint8)
+    img[..., 0] = (np.arange(w) // 400 * 80 + np.arange(w) % 400 // 40)[None, :]
+    img[..., 1] = (np.arange(h) // 300 * 60)[:, None]
+    img[..., 2] = 128
+    widths = []
+    flags = 4 | cv2.FLOODFILL_MASK_ONLY | cv2.FLOODFILL_FIXED_RANGE | (255 << 8)
+
+    for seed in [(450, 350), (2, 2), (w - 3, 5), (4, h - 2), (w - 1, h - 1), (300, 650)]:
+        mask, bbox = magic_wand_select_tolerance(img, *seed, tolerance=20)
+
+        full = np.zeros((h + 2, w + 2), dtype=np.uint8)
+        _, _, _, (x, y, width, height) = cv2.floodFill(img.copy(), full, seed, (255,) * 3, (20,) * 3, (20,) * 3, flags)
+        assert bbox == {"x": x, "y": y, "width": width, "height": height}, seed
+        assert np.array_equal(mask, full[y + 1:y + 1 + height, x + 1:x + 1 + width]), seed
+        widths.append(width)
+    # Some selections span more than the first window
+    assert max(widths) > 256
+
+
+def test_padded_refine_matches_full_frame():
+    h, w = PLAN.image.shape[:2]
+    for parcel in PLAN.parcels[:10]:
+        mask, bbox = magic_wand_select_boundary(PLAN.image, *parcel.seed)
+        full = np.zeros((h, w), dtype=np.uint8)
+        full[bbox["y"]:bbox["y"] + bbox["height"], bbox["x"]:bbox["x"] + bbox["width"]] = mask
+
+        padded, (x0, y0) = pad_selection(mask, bbox, PLAN.image.shape)
+        refined = refine_mask(padded)
+        expected = refine_mask(full)
+        assert np.array_equal(refined, expected[y0:y0 + padded.shape[0], x0:x0 + padded.shape[1]]), parcel
+        # Nothing outside the padded window is selected on the full frame
+        assert np.count_nonzero(expected) == np.count_nonzero(refined), parcel
+
+
+def test_pad_selection_clips_to_image():
+    mask = np.full((5, 8), 255, dtype=np.uint8)
+    padded, offset = pad_selection(mask, {"x": 2, "y": 90, "width": 8, "height": 5}, (100, 50), margin=4)
+
+    assert offset == (0, 86)
+    assert padded.shape == (13, 14)
+    assert np.array_equal(padded[4:9, 2:10], mask)
+    assert np.count_nonzero(padded) == mask.size
+
+
+def square(x, y, size=10):
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+
+
+def test_polygon_index_matches_brute_force():
+    rng = np.random.default_rng(0)
+    existing = {i: [square(*rng.integers(0, 1000, 2), size=int(rng.integers(5, 40)))] for i in range(300)}
+    index = PolygonIndex(dict(list(existing.items())[:200]))
+    # The rest go through add(), partly into the pending list and partly into rebuilt trees
+    for polygon_id in list(existing)[200:]:
+        index.add(polygon_id, existing[polygon_id])
+    assert len(index) == 300
+
+    shapes = [Polygon(coords[0]) for coords in existing.values()]
+    for x, y in rng.integers(0, 1000, (200, 2)):
+        ring = square(x, y, 15)
+        expected = any(Polygon(ring).intersects(shape) for shape in shapes)
+        assert index.intersects(ring) == expected, (x, y)
+        assert check_overlap(ring, list(existing.values())) == expected, (x, y)
+
+
+def test_polygon_index_add_remove_replace():
+    index = PolygonIndex({"a": [square(0, 0)]})
+    assert index.intersects(square(5, 5))
+
+    assert index.remove("a")
+    assert not index.remove("a")
+    assert not index.intersects(square(5, 5))
+
+    index.add("b", [square(100, 100)])
+    assert index.intersects(square(105, 105))
+    # Replacing a polygon moves it; the old shape in the tree no longer matches
+    index.add("b", [square(200, 200)])
+    assert not index.intersects(square(105, 105))
+    assert index.intersects(square(205, 205))
+    assert len(index) == 1
+
+
+def test_check_overlap_edge_cases():
+    assert not check_overlap(square(0, 0), [])
+    assert not check_overlap(square(0, 0), PolygonIndex())
+    assert not check_overlap([[0, 0], [1, 1]], [[square(0, 0)]])
+    assert check_overlap(square(5, 5), [[square(0, 0)]])
+    assert not check_overlap(square(20, 20), [[square(0, 0)]])
+    # A self-intersecting ring is repaired instead of failing
+    assert check_overlap([[0, 0], [10, 10], [10, 0], [0, 10], [0, 0]], [[square(2, 2, 3)]])
+
+
+def test_session_indexes_are_per_session():
+    first = get_session_index("session-a", "image")
+
+    assert get_session_index("session-a", "image") is first
+    assert get_session_index("session-b", "image") is not first
+    assert get_session_index("session-a", "other-image") is not first
+
+
+def _as_tuple(selection):
+    mask, bbox = selection
+    return mask.tobytes(), mask.shape, bbox
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: ok")
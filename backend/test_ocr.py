@@ -4,7 +4,7 @@ sys.path.insert(0, '/home/so/bta/map-to-geojson/backend')
 
 import cv2
 import numpy as np
-from magic_wand import magic_wand_select, mask_to_polygon, refine_mask
+from magic_wand import magic_wand_select, mask_to_polygon, pad_selection, refine_mask
 from ocr_service import extract_text_from_polygon, is_tesseract_available
 
 # Load the sample map
@@ -40,17 +40,18 @@ for i, (x, y) in enumerate(test_points):
             continue
 
         # Refine mask
-        refined = refine_mask(mask)
+        padded, offset = pad_selection(mask, bbox, img.shape)
+        refined = refine_mask(padded)
 
         # Get polygon
-        result = mask_to_polygon(refined, simplify_tolerance=2.0)
+        result = mask_to_polygon(refined, simplify_tolerance=2.0, offset=offset)
         if result:
             print(f'Polygon vertices: {len(result["polygon"][0])}')
             print(f'Area: {result["area"]:.0f}')
 
             # Try OCR
             polygon_coords = result['polygon'][0][:-1]
-            text, conf = extract_text_from_polygon(img, refined, polygon_coords)
+            text, conf = extract_text_from_polygon(img, refined, polygon_coords, offset)
             print(f'OCR result: "{text}" (confidence: {conf:.1f})')
         else:
             print('No polygon found')